@@ -0,0 +1,362 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# Benchmarks of the h5temperature pipeline on synthetic data.
+#
+#   python benchmarks/run_benchmarks.py -o results.json
+#   python benchmarks/run_benchmarks.py --compare results.json
+#
+# Results are written as JSON. With --compare, timings are compared to a
+# previous results file and the script exits with 1 on regressions.
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import datetime
+import warnings
+import statistics
+
+import numpy as np
+
+# allow running from a source checkout without installing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+import h5temperature.physics as Ph
+from h5temperature.formats import read_h5file, customparse_file2data
+from h5temperature.models import (BlackBodySpec, TemperaturesBatch,
+                                  compare_warmstart)
+
+
+PARS = dict(lowerb = 550,
+            upperb = 900,
+            delta = 100,
+            usebg = False,
+            fastplanck = False)
+
+
+def timeit(func, repeat=5, number=1, setup=None):
+    # returns the best and median time of one call, in seconds
+    # one call first, to leave lazy imports out of the timings
+    if setup is not None:
+        setup()
+    func()
+
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - t) / number)
+    return min(times), statistics.median(times)
+
+def make_spec(n_px, usebg=False, seed=0):
+    rng = np.random.default_rng(seed)
+    bg = 500 if usebg else 0
+    lam, planck, max_data = synthetic.synthetic_spectrum(rng, n_px,
+                                                         temp=2500, bg=bg)
+    spec = BlackBodySpec('bench', lam, planck, max_data=max_data)
+    spec.set_pars(dict(PARS, usebg=usebg))
+    return spec
+
+def bench_physics(n_px, repeat):
+    spec = make_spec(n_px)
+    lam, planck = spec.lam, spec.planck
+    return [('physics.planck', timeit(
+                lambda: Ph.planck(lam, 1e-6, 2500), repeat, 100)),
+            ('physics.wien', timeit(
+                lambda: Ph.wien(lam, planck), repeat, 100)),
+            ('physics.temp2color', timeit(
+                lambda: Ph.temp2color(lam, spec.rawwien, 100), repeat, 100)),
+            ('physics.planck_jac', timeit(
+                lambda: Ph.planck_jac(lam, 1e-6, 2500), repeat, 100))]
+
+def bench_fits(n_px, repeat):
+    out = []
+    for usebg in (False, True):
+        spec = make_spec(n_px, usebg)
+        tag = 'bg' if usebg else 'nobg'
+
+        out.append((f'eval_wien_fit[{tag}]', timeit(spec.eval_wien_fit,
+                                                     repeat, 10)))
+        spec.eval_wien_fit()
+        out.append((f'eval_planck_fit[{tag}]', timeit(spec.eval_planck_fit,
+                                                       repeat)))
+        out.append((f'eval_twocolor[{tag}]', timeit(spec.eval_twocolor,
+                                                     repeat, 10)))
+        out.append((f'choose_delta[{tag}]', timeit(
+            lambda: spec.twocolor_stddevs(range(1, 300)), repeat)))
+        out.append((f'eval_fits[{tag}]', timeit(
+            lambda: spec.eval_fits(spec.pars), repeat)))
+
+    spec = make_spec(n_px)
+    spec.set_pars(dict(PARS, fastplanck=True))
+    out.append(('eval_planck_fit[fast]', timeit(spec.eval_planck_fit,
+                                                 repeat, 10)))
+
+    spec = make_spec(n_px)
+    pars = dict(PARS, rebin=10)
+    out.append(('eval_fits[rebin10]', timeit(
+        lambda: spec.eval_fits(pars), repeat)))
+
+    spec.eval_fits(PARS)
+    out.append(('eval_bootstrap[200]', timeit(
+        lambda: spec.eval_bootstrap(200), repeat)))
+    return out
+
+def bench_formats(n_px, n_frames, repeat, tmpdir):
+    out = []
+    path = os.path.join(tmpdir, f'bench_{n_px}_{n_frames}.h5')
+    synthetic.write_h5(path, n_px=n_px, n_frames=n_frames)
+    out.append((f'read_h5file[frames={n_frames}]', timeit(
+        lambda: read_h5file(path), repeat)))
+
+    for delim, name in (('\t', 'tab'), (',', 'comma'), (' ', 'space')):
+        path = os.path.join(tmpdir, f'bench_{n_px}_{name}.txt')
+        synthetic.write_ascii(path, n_px=n_px, delimiter=delim,
+                              header_lines=20, footer_lines=2)
+        out.append((f'customparse_file2data[{name}]', timeit(
+            lambda: customparse_file2data(path), repeat)))
+    return out
+
+def bench_plots(n_px, repeat):
+    # plot updates need Qt, the offscreen platform is used when no display
+    try:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        from h5temperature.plots import FourPlotsCanvas
+    except ImportError:
+        return []
+
+    app = QApplication.instance() or QApplication([])
+    canvas = FourPlotsCanvas()
+    canvas.resize(1200, 800)
+    spec = make_spec(n_px)
+    spec.eval_fits(spec.pars)
+
+    def update_all():
+        canvas.update_all(spec)
+        canvas.draw()
+
+    def update_fits():
+        canvas.update_fits(spec)
+        canvas.draw()
+
+    return [('plots.update_all+draw', timeit(update_all, repeat)),
+            ('plots.update_fits+draw', timeit(update_fits, repeat))]
+
+def check_warmstart(n_px, n_frames):
+    # warm-started fits of a ramp must reproduce the independent fits
+    # with fewer Planck evaluations, returns the names of the failed checks
+    failed = []
+    for usebg in (False, True):
+        rng = np.random.default_rng(1)
+        specs = []
+        for i, temp in enumerate(synthetic.ramp_temperatures(n_frames)):
+            lam, planck, max_data = synthetic.synthetic_spectrum(
+                rng, n_px, temp=temp, bg=500 if usebg else 0)
+            spec = BlackBodySpec(f'ramp[{i}]', lam, planck, 
+                                 max_data=max_data)
+            spec.timestamp = i
+            specs.append(spec)
+        name = f'warmstart[{"bg" if usebg else "nobg"}]'
+        c = compare_warmstart(specs, dict(PARS, usebg=usebg))
+        print(f'{name:40s} n_px={n_px:6d} '
+              f'max dT={c["max_delta_T"]:8.2g} K '
+              f'nfev={c["nfev_warm"]}/{c["nfev_cold"]} '
+              f'time={1e3 * c["time_warm"]:.0f}/{1e3 * c["time_cold"]:.0f} ms '
+              f'seeded={c["seeded"]}/{n_frames} '
+              f'{"ok" if c["ok"] else "FAILED"}')
+        # the seed must save Planck evaluations
+        if not c['ok'] or c['nfev_warm'] >= c['nfev_cold']:
+            failed.append((name, n_px))
+    return failed
+
+def check_polish(n_px, n_specs=20):
+    # fits with background, with and without the Gauss-Newton polishing 
+    # (models.POLISH_STEPS), against the minimum found by a curve_fit 
+    # with tight tolerances. The polished fits must reach it (0.01 std 
+    # deviation of T) and never have a larger SSE than the plain fits.
+    # Returns the failed checks.
+    from scipy.optimize import curve_fit
+    import h5temperature.models as models
+
+    steps = models.POLISH_STEPS
+    rng = np.random.default_rng(3)
+    dev = {0: [], steps: []}
+    worse = 0
+    for i in range(n_specs):
+        temp = rng.uniform(1500, 4000)
+        # bg close to its bound (0) and well above
+        bg = (0, 50, 500, 3000)[i % 4]
+        lam, planck, max_data = synthetic.synthetic_spectrum(
+            rng, n_px, temp=temp, bg=bg)
+        sse = dict()
+        try:
+            for n in (0, steps):
+                models.POLISH_STEPS = n
+                spec = BlackBodySpec(f'polish[{i}]', lam, planck, 
+                                     max_data=max_data)
+                spec.eval_fits(dict(PARS, usebg=True))
+                sse[n] = np.nansum(spec.planck_residuals**2)
+                dev[n].append(spec.T_planck)
+        finally:
+            models.POLISH_STEPS = steps
+        p, _ = curve_fit(Ph.planck, spec.lam_win, spec.planck_win,
+                         p0 = (spec.eps_planck, spec.T_planck, 
+                               max(spec.bg, 1)),
+                         bounds = ((0, 0, 0), (np.inf, 2e4, np.inf)),
+                         jac = lambda lamb, *p: Ph.planck_jac(lamb, *p),
+                         method = 'trf', x_scale = 'jac', max_nfev = 2000,
+                         ftol = 1e-15, xtol = 1e-15, gtol = 1e-15)
+        for n in dev:
+            dev[n][-1] = abs(dev[n][-1] - p[1]) / spec.T_std_planck
+        worse += sse[steps] > sse[0] * (1 + 1e-12)
+
+    ok = max(dev[steps]) <= 0.01 and worse == 0
+    print(f'{"polish[bg]":40s} n_px={n_px:6d} '
+          f'max |T - T_min|/std: {max(dev[0]):8.2g} plain, '
+          f'{max(dev[steps]):8.2g} polished {"ok" if ok else "FAILED"}')
+    return [] if ok else [('polish[bg]', n_px)]
+
+def check_batch_times():
+    # tz-aware acquisition times (HDF5 start_time) are stored in the batch
+    # as local times, without numpy warning; returns the failed checks
+    tz = os.environ.get('TZ')
+    os.environ['TZ'] = 'Europe/Paris'
+    time.tzset()
+    try:
+        rng = np.random.default_rng(0)
+        specs = []
+        for i, t in enumerate(('2024-07-01T12:00:00.000000+0200',
+                               '2024-07-01T12:00:00.000000+0000')):
+            lam, planck, max_data = synthetic.synthetic_spectrum(rng, 500)
+            specs.append(BlackBodySpec(f'times[{i}]', lam, planck,
+                max_data=max_data,
+                time=datetime.datetime.strptime(t, '%Y-%m-%dT%H:%M:%S.%f%z')))
+        specs.append(BlackBodySpec('times[2]', lam, planck))
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            batch = TemperaturesBatch(specs)
+            batch.update('times[1]')
+    finally:
+        if tz is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = tz
+        time.tzset()
+
+    expected = np.array(['2024-07-01T12:00', '2024-07-01T14:00', 'NaT'],
+                        dtype='datetime64[us]')
+    ok = np.array_equal(batch.times, expected, equal_nan=True)
+    print(f'{"batch times":40s} {"ok" if ok else "FAILED"}')
+    return [] if ok else [('batch times', None)]
+
+def run(sizes, frames, repeat):
+    results = []
+    failed = check_batch_times()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_px in sizes:
+            benches = bench_physics(n_px, repeat)
+            benches += bench_fits(n_px, repeat)
+            for n_frames in frames:
+                benches += bench_formats(n_px, n_frames, repeat, tmpdir)
+            benches += bench_plots(n_px, repeat)
+            failed += check_warmstart(n_px, min(frames))
+            failed += check_polish(n_px)
+
+            for name, (best, median) in benches:
+                results.append(dict(name = name,
+                                    n_px = n_px,
+                                    best_s = best,
+                                    median_s = median))
+                print(f'{name:40s} n_px={n_px:6d} '
+                      f'best={1e3 * best:10.3f} ms '
+                      f'median={1e3 * median:10.3f} ms')
+
+    meta = dict(date = datetime.datetime.now().isoformat(),
+                python = platform.python_version(),
+                platform = platform.platform(),
+                numpy = np.__version__,
+                backend = Ph.backend,
+                repeat = repeat)
+    return dict(meta = meta, results = results, failed = failed)
+
+def compare(new, old, tolerance):
+    # compares best times; returns the list of regressions
+    ref = {(r['name'], r['n_px']): r['best_s'] for r in old['results']}
+    regressions = []
+    for r in new['results']:
+        key = (r['name'], r['n_px'])
+        if key in ref:
+            ratio = r['best_s'] / ref[key]
+            flag = ''
+            if ratio > 1 + tolerance:
+                flag = '  <-- regression'
+                regressions.append(key)
+            print(f'{key[0]:40s} n_px={key[1]:6d} x{ratio:6.2f}{flag}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='h5temperature benchmarks')
+    parser.add_argument('-o', '--output', help='JSON results file')
+    parser.add_argument('--compare', help='previous JSON results file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative slowdown reported as regression')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[500, 2000, 8000], help='pixels per spectrum')
+    parser.add_argument('--frames', type=int, nargs='+',
+                        default=[10, 100, 1000], help='frames per ramp')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true',
+                        help='small sizes, for a smoke run')
+    parser.add_argument('--backend', default='auto',
+                        choices=['auto', 'numpy', 'numba'],
+                        help='backend of h5temperature.physics')
+    args = parser.parse_args()
+
+    Ph.set_backend(args.backend)
+
+    if args.quick:
+        args.sizes, args.frames, args.repeat = [500], [10], 2
+
+    new = run(args.sizes, args.frames, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(new, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            old = json.load(file)
+        if compare(new, old, args.tolerance):
+            sys.exit(1)
+
+    if new['failed']:
+        print(f'failed checks: {new["failed"]}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
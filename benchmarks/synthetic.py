@@ -0,0 +1,132 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# Synthetic blackbody spectra written in the layouts read by
+# h5temperature.formats (ESRF-like HDF5 files and ASCII exports).
+# Everything is generated from a seed, so that files are reproducible.
+
+import datetime
+import numpy as np
+
+import h5temperature.physics as Ph
+
+SATURATION = 2**16 - 1
+
+
+def synthetic_spectrum(rng, n_px=2000, temp=2500, eps=1e-6, bg=0,
+                       noise=0.01, lam_range=(450, 1000), saturate=False):
+    # noisy planck spectrum in counts, noise relative to the maximum.
+    # lam is returned in decreasing order as on some spectrometers,
+    # BlackBodySpec sorts it anyway.
+    lam = np.linspace(lam_range[1], lam_range[0], n_px)
+    planck = Ph.planck(lam, eps, temp, bg)
+    # scale to detector counts: the maximum sits at 60% of saturation
+    # or well above it when saturation is requested
+    scale = (1.5 if saturate else 0.6) * SATURATION / np.max(planck)
+    planck = scale * planck
+    planck = planck + rng.normal(0, noise * np.max(planck), n_px)
+
+    # max_data is the max over all CCD lines, taken above the mean line
+    max_data = np.minimum(1.1 * planck, SATURATION)
+    return lam, planck, max_data
+
+def ramp_temperatures(n_frames, t_start=1500, t_stop=4000):
+    return np.linspace(t_start, t_stop, n_frames)
+
+def hotspot_lines(rng, lam, temp, n_lines, noise=0.01):
+    # CCD image (n_lines, n_px) across a hotspot: the temperature drops
+    # by 40% and the intensity vanishes away from the center line
+    x = np.linspace(-1, 1, n_lines)[:, None]
+    temps = temp * (0.6 + 0.4 * np.exp(-(x / 0.5)**2))
+    eps = np.exp(-(x / 0.4)**2)
+    lines = eps * Ph.planck(lam, 1e-6, temps)
+    lines = 0.6 * SATURATION * lines / np.max(lines)
+    lines = lines + rng.normal(0, noise * np.max(lines), lines.shape)
+    return lines
+
+def write_h5(path, n_px=2000, n_single=5, n_ramps=1, n_frames=100,
+             bg=0, noise=0.01, saturate_every=0, n_lines=0, seed=0):
+    # ESRF-like file: n_single 1D measurements and n_ramps groups with
+    # 2D planck_data (n_frames, n_px).
+    # every saturate_every-th spectrum is saturated (0: none)
+    # n_lines > 0: ramps also have a per-line CCD image 
+    # 'image_data' (n_frames, n_lines, n_px)
+    import h5py
+
+    rng = np.random.default_rng(seed)
+    t0 = datetime.datetime(2024, 1, 1, 12, 0, 0,
+                           tzinfo=datetime.timezone.utc)
+    count = 0
+
+    def saturated():
+        return saturate_every > 0 and count % saturate_every == 0
+
+    with h5py.File(path, 'w') as file:
+        for i in range(n_single + n_ramps):
+            time = t0 + datetime.timedelta(minutes=i)
+            group = file.create_group(f'{i + 1}.1')
+            group['start_time'] = np.bytes_(
+                time.strftime('%Y-%m-%dT%H:%M:%S.%f%z'))
+
+            if i < n_single:
+                lam, planck, max_data = synthetic_spectrum(
+                    rng, n_px, temp=rng.uniform(1500, 4000), bg=bg,
+                    noise=noise, saturate=saturated())
+                count += 1
+            else:
+                lams, plancks, maxs, images = [], [], [], []
+                for temp in ramp_temperatures(n_frames):
+                    l, p, m = synthetic_spectrum(
+                        rng, n_px, temp=temp, bg=bg,
+                        noise=noise, saturate=saturated())
+                    count += 1
+                    lams.append(l)
+                    plancks.append(p)
+                    maxs.append(m)
+                    if n_lines:
+                        images.append(hotspot_lines(rng, l, temp, n_lines,
+                                                    noise))
+                lam = np.array(lams)
+                planck = np.array(plancks)
+                max_data = np.array(maxs)
+
+            meas = group.create_group('measurement')
+            meas['T_planck'] = np.zeros(planck.shape[:-1] or 1)
+            meas['spectrum_lambdas'] = lam
+            chunks = (1, n_px) if planck.ndim == 2 else None
+            meas.create_dataset('planck_data', data=planck, chunks=chunks)
+            meas.create_dataset('max_data', data=max_data, chunks=chunks)
+            if n_lines and i >= n_single:
+                meas.create_dataset('image_data', data=np.array(images),
+                                    chunks=(1, n_lines, n_px))
+    return path
+
+def write_ascii(path, n_px=2000, temp=2500, bg=0, noise=0.01,
+                delimiter='\t', header_lines=20, footer_lines=0, seed=0):
+    # two columns text export with a header (and optional footer)
+    # as written by spectrometer software
+    rng = np.random.default_rng(seed)
+    lam, planck, _ = synthetic_spectrum(rng, n_px, temp=temp, bg=bg,
+                                        noise=noise)
+    with open(path, 'w') as file:
+        for i in range(header_lines):
+            file.write(f'# header line {i}: synthetic spectrum\n')
+        for l, p in zip(lam, planck):
+            file.write(f'{l:.4f}{delimiter}{p:.4f}\n')
+        for i in range(footer_lines):
+            file.write(f'>>>>>End of spectral data {i}<<<<<\n')
+    return path
@@ -18,15 +18,53 @@
 
 __version__ = '0.4.3'
 
+import os
 import sys
-from PyQt5.QtWidgets import QApplication
+import time
 
-from h5temperature.mainwindow import MainWindow
+# startup-time measurement: set H5TEMPERATURE_STARTUP_TIME=1 to print
+# the time spent in imports, window creation and until the event loop runs.
+_t0 = time.perf_counter()
+
+
+def __getattr__(name):
+    # MainWindow pulls PyQt5, matplotlib and numpy: only imported when used
+    if name == 'MainWindow':
+        from h5temperature.mainwindow import MainWindow
+        return MainWindow
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def main():
+    timing = os.environ.get('H5TEMPERATURE_STARTUP_TIME')
+    steps = [('start', _t0)]
+
+    # worker processes of the frozen (Windows) executable
+    import multiprocessing
+    multiprocessing.freeze_support()
+
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+
     app = QApplication(sys.argv)
+    steps.append(('QApplication', time.perf_counter()))
+
+    from h5temperature.mainwindow import MainWindow
+    steps.append(('imports', time.perf_counter()))
+
     window = MainWindow()
+    steps.append(('MainWindow', time.perf_counter()))
     window.show()
-    
-    app.exec()
\ No newline at end of file
+
+    if timing:
+        def report():
+            steps.append(('event loop', time.perf_counter()))
+            for (_, t_prev), (name, t) in zip(steps[:-1], steps[1:]):
+                print(f'startup {name}: {1e3 * (t - t_prev):.0f} ms', 
+                      file=sys.stderr)
+            print(f'startup total: {1e3 * (t - _t0):.0f} ms', 
+                  file=sys.stderr)
+        # called once the window is shown and events are processed
+        QTimer.singleShot(0, report)
+
+    app.exec()
@@ -0,0 +1,220 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# Results database: the fit results of all sessions in one SQLite file,
+# with where they come from (file, group, frame) and the sample.
+#
+#   with ResultsDatabase('results.sqlite') as db:
+#       db.add(specs)
+#       hits = db.query(sample='CDMX18', tmin=3000,
+#                       since=datetime.datetime(2025, 2, 10))
+#
+# A fit of the same spectrum (file and name) replaces the previous one.
+# The sample is the folder of the file unless given.
+# Default file: H5TEMPERATURE_DB, or ~/.h5temperature/results.sqlite
+
+import os
+import time
+import sqlite3
+import datetime
+
+
+# columns of get_fit_results, with their SQL type
+RESULT_COLUMNS = (('name', 'TEXT'),
+                  ('time', 'TEXT'),
+                  ('fitted', 'INTEGER'),
+                  ('T_planck', 'REAL'),
+                  ('T_wien', 'REAL'),
+                  ('T_twocolor', 'REAL'),
+                  ('T_std_twocolor', 'REAL'),
+                  ('T_std_planck', 'REAL'),
+                  ('T_std_wien', 'REAL'),
+                  ('T_std_planck_boot', 'REAL'),
+                  ('T_std_wien_boot', 'REAL'),
+                  ('bootstrap', 'INTEGER'),
+                  ('multiplier_planck', 'REAL'),
+                  ('multiplier_wien', 'REAL'),
+                  ('background', 'REAL'),
+                  ('lower_bound', 'REAL'),
+                  ('upper_bound', 'REAL'),
+                  ('delta', 'INTEGER'),
+                  ('usebg', 'INTEGER'),
+                  ('fastplanck', 'INTEGER'),
+                  ('saturated', 'INTEGER'),
+                  ('planck_nfev', 'INTEGER'),
+                  ('rebin', 'INTEGER'),
+                  ('quality_chi2_red', 'REAL'),
+                  ('quality_r2', 'REAL'),
+                  ('quality_autocorr', 'REAL'),
+                  ('quality_planck_wien', 'REAL'),
+                  ('quality_nan_wien', 'REAL'),
+                  ('quality_saturated', 'REAL'))
+
+# where the spectrum comes from, timestamp is the time in seconds since
+# the epoch (for range queries), recorded the time of the insertion
+SOURCE_COLUMNS = (('sample', 'TEXT'),
+                  ('file', 'TEXT'),
+                  ('kind', 'TEXT'),
+                  ('grp', 'TEXT'),
+                  ('frame', 'INTEGER'),
+                  ('timestamp', 'REAL'),
+                  ('recorded', 'REAL'))
+
+COLUMNS = tuple(c for c, _ in SOURCE_COLUMNS + RESULT_COLUMNS)
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS fits ('
+    'id INTEGER PRIMARY KEY, ' +
+    ', '.join(f'{c} {t}' for c, t in SOURCE_COLUMNS + RESULT_COLUMNS) +
+    ', UNIQUE (file, name) ON CONFLICT REPLACE)',
+    'CREATE INDEX IF NOT EXISTS fits_timestamp ON fits (timestamp)',
+    'CREATE INDEX IF NOT EXISTS fits_T_planck ON fits (T_planck)',
+    'CREATE INDEX IF NOT EXISTS fits_sample ON fits (sample, timestamp)',
+    )
+
+
+def default_path():
+    path = os.environ.get('H5TEMPERATURE_DB')
+    if path:
+        return path
+    return os.path.join(os.path.expanduser('~'), '.h5temperature',
+                        'results.sqlite')
+
+def sample_from_path(path):
+    # the folder of the file: data/CDMX18/hc5078_CDMX18.h5 -> CDMX18
+    return os.path.basename(os.path.dirname(os.path.abspath(path)))
+
+def _timestamp(value):
+    # datetime or seconds since the epoch
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return value
+
+
+class ResultsDatabase():
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        # readers (another session, a script) do not block the writer
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            for statement in _SCHEMA:
+                self.conn.execute(statement)
+            # columns added since the file was created
+            existing = [r[1] for r in 
+                        self.conn.execute('PRAGMA table_info(fits)')]
+            for c, t in SOURCE_COLUMNS + RESULT_COLUMNS:
+                if c not in existing:
+                    self.conn.execute(f'ALTER TABLE fits ADD COLUMN {c} {t}')
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def row(self, spec, sample=None):
+        # the values of COLUMNS for a fitted BlackBodySpec
+        results = spec.get_fit_results()
+        source = spec.source or (None, None)
+        kind, path = source[:2]
+        grp, frame = (source[2], source[3]) if kind == 'h5' else (None, None)
+        if path is not None:
+            path = os.path.abspath(path)
+            if sample is None:
+                sample = sample_from_path(path)
+
+        out = dict(sample = sample,
+                   file = path or '',
+                   kind = kind,
+                   grp = grp,
+                   frame = frame,
+                   timestamp = spec.timestamp,
+                   recorded = time.time())
+        for c, t in RESULT_COLUMNS:
+            v = results[c]
+            if v is not None and t != 'TEXT':
+                v = float(v) if t == 'REAL' else int(v)
+            out[c] = v
+        return tuple(out[c] for c in COLUMNS)
+
+    def add(self, specs, sample=None):
+        # records the fit results of specs in one transaction,
+        # unfitted spectra are skipped. Returns the number of rows.
+        rows = [self.row(spec, sample) for spec in specs if spec._fitted]
+        with self.conn:
+            self.conn.executemany(
+                f'INSERT INTO fits ({", ".join(COLUMNS)}) '
+                f'VALUES ({", ".join("?" * len(COLUMNS))})', rows)
+        return len(rows)
+
+    def query(self, sample=None, since=None, until=None, tmin=None,
+              tmax=None, file=None, name=None, max_chi2=None, 
+              fitted=True, order='timestamp', limit=None):
+        # fits matching all the given criteria, as a list of sqlite3.Row
+        # (dict-like, keys COLUMNS and id). since and until: datetime or
+        # seconds since the epoch; tmin and tmax on T_planck; name is a
+        # SQL LIKE pattern ('3.1[%'); max_chi2 on quality_chi2_red.
+        where, args = [], []
+        def add(clause, value):
+            if value is not None:
+                where.append(clause)
+                args.append(value)
+        add('sample = ?', sample)
+        add('timestamp >= ?', _timestamp(since))
+        add('timestamp <= ?', _timestamp(until))
+        add('T_planck >= ?', tmin)
+        add('T_planck <= ?', tmax)
+        add('file = ?', None if file is None else os.path.abspath(file))
+        add('name LIKE ?', name)
+        add('quality_chi2_red <= ?', max_chi2)
+        if fitted:
+            where.append('fitted')
+
+        if order not in COLUMNS:
+            raise ValueError(f'Unknown column {order}')
+        sql = 'SELECT * FROM fits'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        # +: the indexes are for the WHERE clause, not for sorting
+        # (the timestamp index would otherwise scan the whole table)
+        sql += f' ORDER BY +{order}, id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(int(limit))
+        return self.conn.execute(sql, args).fetchall()
+
+    def samples(self):
+        return [r[0] for r in self.conn.execute(
+            'SELECT DISTINCT sample FROM fits WHERE sample IS NOT NULL '
+            'ORDER BY sample')]
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM fits').fetchone()[0]
+
+    def delete(self, ids):
+        with self.conn:
+            self.conn.executemany('DELETE FROM fits WHERE id = ?',
+                                  [(int(i),) for i in ids])
@@ -18,19 +18,49 @@
 import os
 import numpy as np
 import datetime
-import h5py
 import csv
 
-def read_h5file(path):
-    with h5py.File(path, 'r') as file:
+from h5temperature.timing import timed_function
+
+# raw data chunk cache of each dataset of the h5 files. The h5py default 
+# (1 MB) is smaller than a block of frames of a ramp: chunks would be 
+# read (and decompressed) again for every frame.
+H5_CHUNK_CACHE = 2**26
+# 2D datasets are read by blocks of frames of about this size
+H5_BLOCK_BYTES = 2**22
+# extensions of the h5 files, NeXus files included
+H5_EXTENSIONS = ('.h5', '.hdf5', '.nxs')
+
+def is_h5file(path):
+    # h5 or ASCII file, from the extension
+    return path.lower().endswith(H5_EXTENSIONS)
+
+def open_h5file(path, rdcc_nbytes=None):
+    # h5py is only loaded when a file is read
+    import h5py
+
+    if rdcc_nbytes is None:
+        rdcc_nbytes = H5_CHUNK_CACHE
+    # rdcc_nslots: a prime, larger than the number of chunks in the cache
+    return h5py.File(path, 'r', rdcc_nbytes=rdcc_nbytes, rdcc_nslots=10007)
+
+@timed_function('read h5')
+def read_h5file(path, rdcc_nbytes=None, block_bytes=None):
+    with open_h5file(path, rdcc_nbytes) as file:
         out = dict()
         for nam, group in file.items():
             if 'measurement/T_planck' in group:
-                d = get_data_from_h5group(group)
+                d = get_data_from_h5group(group, block_bytes)
+                # to read a spectrum again, see read_source
+                if isinstance(d, dict):
+                    d['source'] = ('h5', path, nam, None)
+                else:
+                    for i, di in enumerate(d):
+                        di['source'] = ('h5', path, nam, i)
                 out[nam] = d
     return out
 
-def get_data_from_h5group(group):
+def get_time_from_h5group(group):
     t1 = str(np.array(group['start_time'])[()])
     try:
         time = datetime.datetime.strptime(t1, "b'%Y-%m-%dT%H:%M:%S.%f%z'")
@@ -41,6 +71,73 @@ def get_data_from_h5group(group):
             time = datetime.datetime.strptime(t1, "b'%Y-%m-%dT%H:%M:%S.%f%z'")
         else:
             time = None
+    return time
+
+def has_frames(group):
+    # frames along the first axis of planck_data, read by blocks
+    planck = group['measurement/planck_data']
+    return planck.ndim == 2 and planck.shape[0] > 1 and planck.shape[1] > 1
+
+def slab_rows(dataset, block_bytes=None):
+    # number of rows in a block of about block_bytes, a multiple of the 
+    # chunk rows of the dataset: each chunk is read once, in file order
+    if block_bytes is None:
+        block_bytes = H5_BLOCK_BYTES
+    row = dataset.dtype.itemsize * int(np.prod(dataset.shape[1:]))
+    rows = max(1, block_bytes // max(row, 1))
+    if dataset.chunks is not None:
+        c = dataset.chunks[0]
+        rows = max(c, rows // c * c)
+    return int(min(rows, dataset.shape[0]))
+
+def iter_slabs(datasets, block_bytes=None, first=0, last=None):
+    # Reads datasets with the same first dimension by blocks of rows, 
+    # aligned on the chunks of the first one. Yields (start, stop, slabs), 
+    # one array (stop - start, ...) per dataset.
+    # The slabs are filled with read_direct in buffers allocated once: 
+    # they are overwritten by the next block, copy what is kept.
+    # Only the rows first:last are read (aligned if first is).
+    n = datasets[0].shape[0] if last is None else \
+        min(last, datasets[0].shape[0])
+    rows = min(slab_rows(datasets[0], block_bytes), max(n - first, 1))
+    buffers = [np.empty((rows,) + ds.shape[1:], dtype=ds.dtype) 
+               for ds in datasets]
+    for start in range(first, n, rows):
+        stop = min(start + rows, n)
+        for ds, buf in zip(datasets, buffers):
+            ds.read_direct(buf, np.s_[start:stop], np.s_[0:stop - start])
+        yield start, stop, [buf[:stop - start] for buf in buffers]
+
+def iter_h5frames(group, block_bytes=None, first=0, last=None):
+    # frames of a group with has_frames, yields (i, data) with data as in 
+    # get_data_from_h5group. planck_data and max_data (and the wavelengths 
+    # when given per frame) are read by blocks: a ramp is never in memory 
+    # at once, and each frame gets its own arrays.
+    # Only the frames first:last when given.
+    time = get_time_from_h5group(group)
+    meas = group['measurement']
+    planck = meas['planck_data']
+    datasets = [planck, meas['max_data']]
+    lam = meas['spectrum_lambdas']
+    if lam.shape == planck.shape:
+        datasets.append(lam)
+        lam = None
+    else:
+        # same wavelengths for all frames
+        lam = np.array(lam).squeeze()
+
+    for start, stop, slabs in iter_slabs(datasets, block_bytes, 
+                                         first, last):
+        for j in range(stop - start):
+            p, m = slabs[0][j].copy(), np.array(slabs[1][j])
+            l = slabs[2][j].copy() if lam is None else lam
+            yield start + j, dict(lam=l, planck=p, max_data=m, time=time)
+
+def get_data_from_h5group(group, block_bytes=None):
+    if has_frames(group):
+        return [d for _, d in iter_h5frames(group, block_bytes)]
+
+    time = get_time_from_h5group(group)
 
     lam = np.array(group['measurement/spectrum_lambdas']).squeeze()
     planck = np.array(group['measurement/planck_data']).squeeze()
@@ -51,6 +148,9 @@ def get_data_from_h5group(group):
         out = dict(lam=lam, planck=planck, max_data=max_data, time=time)
     # manage two dimensional data and return a list of dict:
     elif planck.ndim == 2:
+        if lam.ndim == 1:
+            # same wavelengths for all frames
+            lam = np.broadcast_to(lam, planck.shape)
         out = []
         for l, p, m in zip(lam, planck, max_data):
             out.append( dict(lam=l, planck=p, max_data=m, time=time) )
@@ -59,6 +159,41 @@ def get_data_from_h5group(group):
                          "Expected 1 or 2 dimensions")
     return out
 
+def iter_h5file(path, rdcc_nbytes=None, block_bytes=None):
+    # same content as read_h5file, but yields (key, data) one spectrum at 
+    # a time: 2D groups are read by blocks of frames (iter_h5frames), with 
+    # keys group[i] as in the GUI. Only one block is in memory at once.
+    with open_h5file(path, rdcc_nbytes) as file:
+        for nam, group in file.items():
+            if 'measurement/T_planck' in group:
+                yield from iter_h5group(path, nam, group, block_bytes)
+
+def iter_h5group(path, nam, group, block_bytes=None, first=0, last=None):
+    # (key, data) of the spectra of one group of the open file path, 
+    # see iter_h5file. first:last: range of frames of a group with frames
+    if not has_frames(group):
+        # other layouts are read at once
+        d = get_data_from_h5group(group)
+        if isinstance(d, dict):
+            d['source'] = ('h5', path, nam, None)
+            yield nam, d
+        else:
+            for i, di in enumerate(d[first:last], first):
+                di['source'] = ('h5', path, nam, i)
+                yield f'{nam}[{i}]', di
+        return
+
+    for i, d in iter_h5frames(group, block_bytes, first, last):
+        d['source'] = ('h5', path, nam, i)
+        yield f'{nam}[{i}]', d
+
+def iter_ascii(paths):
+    # get_data_from_ascii one file at a time, yields (name, data)
+    for path in paths:
+        d, = get_data_from_ascii([path])
+        yield d.pop('name'), d
+
+@timed_function('read ascii')
 def get_data_from_ascii(paths):
     out = list()
     for path in paths:
@@ -71,10 +206,166 @@ def get_data_from_ascii(paths):
         lam = darr[:,0]
         planck = darr[:,1]
         # arrange data as in h5 mode:
-        out.append(dict(name=name, lam=lam, planck=planck, time=time))
+        out.append(dict(name=name, lam=lam, planck=planck, time=time,
+                        source=('ascii', path)))
 
     return out
 
+def read_source(source):
+    # lam and planck of a single spectrum from its source,
+    # ('h5', path, group, frame or None) or ('ascii', path) 
+    # as set by read_h5file and get_data_from_ascii
+    if source[0] == 'ascii':
+        darr = customparse_file2data(source[1])
+        return dict(lam=darr[:,0], planck=darr[:,1])
+
+    import h5py
+
+    _, path, nam, frame = source
+    with h5py.File(path, 'r') as file:
+        meas = file[nam]['measurement']
+        lam = meas['spectrum_lambdas']
+        planck = meas['planck_data']
+        if frame is None:
+            return dict(lam=np.array(lam).squeeze(), 
+                        planck=np.array(planck).squeeze())
+        # only the frame is read: frames are along the first axis longer
+        # than 1 (as after squeeze() in get_data_from_h5group), pixels
+        # along the last one
+        long_axes = [i for i, n in enumerate(planck.shape[:-1]) if n > 1]
+        sel = tuple(frame if i == long_axes[0] else 0 
+                    for i in range(planck.ndim - 1)) + (slice(None),)
+        if lam.shape == planck.shape:
+            lam = np.asarray(lam[sel])
+        else:
+            # same wavelengths for all frames
+            lam = np.array(lam).squeeze()
+        return dict(lam=lam, planck=np.asarray(planck[sel]))
+
+class FolderIndex():
+    # mtime index of the ASCII files of a folder: scan() returns the new 
+    # or modified files since the last scan, oldest first, without 
+    # reading them.
+    extensions = ('.txt', '.dat', '.csv', '.asc')
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.mtimes = dict()
+
+    def scan(self):
+        changed = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(self.extensions):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    mtime = entry.stat().st_mtime_ns
+                except OSError:
+                    # removed meanwhile
+                    continue
+                if self.mtimes.get(entry.path) != mtime:
+                    self.mtimes[entry.path] = mtime
+                    changed.append(entry.path)
+
+        changed.sort(key=lambda path: self.mtimes[path])
+        return changed
+
+# curves of BlackBodySpec.get_curves written by write_h5_processed
+PROCESSED_CURVES = ('lam', 'planck', 'wien', 'rawwien', 'twocolor',
+                    'wien_fit', 'wien_residuals', 
+                    'planck_fit', 'planck_residuals')
+
+@timed_function('write processed h5')
+def write_h5_processed(path, data, prepare=None, compression='gzip', 
+                       compression_opts=4, chunk_bytes=2**20):
+    # Exports the processed spectra of data (NestedData, or any mapping 
+    # key -> BlackBodySpec or NestedData) in one HDF5 file with the same
+    # hierarchy: one h5 group per key, with the PROCESSED_CURVES as 
+    # datasets, 1D for single spectra and 2D (frames, px) for groups, 
+    # and the fit results in a 'results' subgroup (one value per frame).
+    # prepare(spec) is called before each spectrum is written, e.g. to fit 
+    # it. Groups are written by blocks of frames of about chunk_bytes 
+    # per curve, which is also the chunk size: only one block is in 
+    # memory at a time.
+    import h5py
+    from h5temperature import __version__
+
+    comp = dict(compression = compression, 
+                compression_opts = compression_opts,
+                shuffle = compression is not None)
+    if compression is None:
+        del comp['compression_opts']
+
+    def h5name(key):
+        return str(key).replace('/', '_')
+
+    def write_results(h5group, results):
+        # results: list of get_fit_results dicts, one per frame
+        res = h5group.create_group('results')
+        for k in results[0]:
+            values = [r[k] for r in results]
+            if all(isinstance(v, str) for v in values):
+                res[k] = np.array(values, dtype=h5py.string_dtype())
+            else:
+                res[k] = np.array([np.nan if v is None else v 
+                                   for v in values], dtype=float)
+
+    with h5py.File(path, 'w') as file:
+        file.attrs['creator'] = f'h5temperature {__version__}'
+        file.attrs['curves'] = list(PROCESSED_CURVES)
+
+        for key, value in data.items():
+            h5group = file.create_group(h5name(key))
+
+            if not hasattr(value, 'flatten'):
+                # single spectrum
+                if prepare is not None:
+                    prepare(value)
+                curves = value.get_curves()
+                h5group.attrs['kind'] = 'spectrum'
+                for k in PROCESSED_CURVES:
+                    h5group.create_dataset(k, data=curves[k], 
+                                           chunks=True, **comp)
+                write_results(h5group, [value.get_fit_results()])
+                continue
+
+            # group of frames
+            specs = list(value.values())
+            n_frames = len(specs)
+            # frames may have different lengths, NaN padded
+            n_px = max(len(spec.lam) for spec in specs)
+            block = int(min(n_frames, max(1, chunk_bytes // (8 * n_px))))
+
+            h5group.attrs['kind'] = 'group'
+            h5group['names'] = np.array([str(k) for k in value.keys()], 
+                                        dtype=h5py.string_dtype())
+            datasets = {k: h5group.create_dataset(k, 
+                                                  shape=(n_frames, n_px),
+                                                  dtype=float,
+                                                  chunks=(block, n_px),
+                                                  fillvalue=np.nan,
+                                                  **comp)
+                        for k in PROCESSED_CURVES}
+
+            results = []
+            for start in range(0, n_frames, block):
+                stop = min(start + block, n_frames)
+                buffers = {k: np.full((stop - start, n_px), np.nan)
+                           for k in PROCESSED_CURVES}
+                for i, spec in enumerate(specs[start:stop]):
+                    if prepare is not None:
+                        prepare(spec)
+                    curves = spec.get_curves()
+                    for k in PROCESSED_CURVES:
+                        buffers[k][i, :len(curves[k])] = curves[k]
+                    results.append(spec.get_fit_results())
+                for k in PROCESSED_CURVES:
+                    datasets[k][start:stop] = buffers[k]
+
+            write_results(h5group, results)
+
 def customparse_file2data(f):
     with open(f, 'r') as file:
         # Skip initial lines to determine the delimiter
@@ -17,7 +17,7 @@
 
 import os
 import numpy as np
-import h5py
+from copy import deepcopy
 from PyQt5.QtWidgets import (QApplication,
                              QWidget,
                              QLabel,
@@ -33,20 +33,51 @@ from PyQt5.QtWidgets import (QApplication,
                              QVBoxLayout,
                              QHBoxLayout,
                              QFileDialog,
+                             QInputDialog,
                              QMessageBox)
 
-from PyQt5.QtCore import Qt, pyqtSlot, QPoint
+from PyQt5.QtCore import (Qt, 
+                          pyqtSlot, 
+                          QPoint, 
+                          QTimer, 
+                          QThreadPool, 
+                          QFileSystemWatcher)
 from PyQt5.QtGui import QIcon, QPixmap
 
 from h5temperature import __version__
-import h5temperature.physics as Ph 
 from h5temperature.formats import (read_h5file, 
-                                   get_data_from_ascii)
-from h5temperature.models import BlackBodySpec, NestedData, TemperaturesBatch
+                                   get_data_from_ascii,
+                                   is_h5file,
+                                   H5_EXTENSIONS,
+                                   write_h5_processed,
+                                   FolderIndex)
+from h5temperature.models import (DEFAULT_PARS,
+                                  BlackBodySpec, 
+                                  NestedData, 
+                                  TemperaturesBatch,
+                                  warmstart_fits)
 from h5temperature.plots import (FourPlotsCanvas,
                                  ChooseDeltaWindow,
+                                 WindowSensitivityWindow,
+                                 MappingWindow,
                                  BatchWindow)
-from h5temperature.tables import SingleFitResultsTable
+from h5temperature.tables import (SingleFitResultsTable, 
+                                  DatabaseWindow, 
+                                  QualityWindow,
+                                  MemoryWindow)
+from h5temperature.memory import (MemoryBudget, 
+                                  MemoryTelemetry, 
+                                  memory_report)
+from h5temperature.timing import profiler, timed, timed_function
+from h5temperature.workers import (FitJob, 
+                                   PipelineJob, 
+                                   MappingJob, 
+                                   BootstrapJob,
+                                   ReportJob)
+
+# file dialog filter of the h5 files
+H5_FILTER = 'NeXus HDF5 file ({})'.format(
+                ' '.join('*' + ext for ext in H5_EXTENSIONS))
 
 
 class MainWindow(QWidget):
@@ -65,14 +96,19 @@ class MainWindow(QWidget):
         # data stored in MainWindow
         self.filepath = str()
         self.data = NestedData()
+        # least recently used spectra are evicted above the limit
+        self.memory = MemoryBudget.from_environ()
+        self.telemetry = MemoryTelemetry(self.memory)
         self.batch = None   # No batch by default
         self.autofit = True # <- automatic fit or not
+        self.livepreview = False # <- refit on parameter change or not
 
         # current parameters in the mainwindow and their default values
-        self.pars = dict(lowerb = 550,
-                         upperb = 900,
-                         delta = 100,
-                         usebg = False)
+        self.pars = deepcopy(DEFAULT_PARS)
+        # resamples of the bootstrap after a batch fit, in a process pool
+        # (bootstrap_batch): pars['bootstrap'] stays 0, the fits of the 
+        # GUI thread never run it
+        self.n_bootstrap = 0
 
         # left layout   
         self.load_button = QPushButton('Load')
@@ -80,6 +116,11 @@ class MainWindow(QWidget):
         self.clear_button = QPushButton('Clear')
         self.exportraw_button = QPushButton('Export current')
 
+        self.export_menu = QMenu(self)
+        self.export_menu.addAction(QAction("Current spectrum (ASCII)", self))
+        self.export_menu.addAction(QAction("Current group (HDF5)", self))
+        self.export_menu.addAction(QAction("All (HDF5)", self))
+
         topleftbuttonslayout = QHBoxLayout()
         topleftbuttonslayout.addWidget(self.load_button)
         topleftbuttonslayout.addWidget(self.reload_button)
@@ -114,29 +155,49 @@ class MainWindow(QWidget):
         self.lowerbound_spinbox = QSpinBox()
         self.upperbound_spinbox = QSpinBox()
         self.delta_spinbox = QSpinBox()
+        self.rebin_spinbox = QSpinBox()
+        self.bootstrap_spinbox = QSpinBox()
         self.usebg_checkbox = QCheckBox('Use background')
+        self.fastplanck_checkbox = QCheckBox('Fast Planck (no background)')
         self.autofit_checkbox = QCheckBox('Auto Fit')
+        self.livepreview_checkbox = QCheckBox('Live preview')
 
         self.lowerbound_spinbox.setMinimum(1)
         self.upperbound_spinbox.setMinimum(1)
         self.delta_spinbox.setMinimum(1)
+        self.rebin_spinbox.setMinimum(1)
         self.lowerbound_spinbox.setMaximum(9999)
         self.upperbound_spinbox.setMaximum(9999)
         self.delta_spinbox.setMaximum(9999)
+        self.rebin_spinbox.setMaximum(1000)
+        self.rebin_spinbox.setToolTip('Pixels averaged per point in the '
+                                      'Wien and Planck fits (1: all pixels)')
+        self.bootstrap_spinbox.setMaximum(100000)
+        self.bootstrap_spinbox.setSingleStep(100)
+        self.bootstrap_spinbox.setToolTip('Resamples of the residual '
+                                          'bootstrap of the fits, run in '
+                                          'the background after each '
+                                          'batch fit (0: none)')
         
         # set default values in Widgets:
         self.lowerbound_spinbox.setValue(self.pars.get('lowerb'))
         self.upperbound_spinbox.setValue(self.pars.get('upperb'))
         self.delta_spinbox.setValue(self.pars.get('delta'))
+        self.rebin_spinbox.setValue(self.pars.get('rebin'))
+        self.bootstrap_spinbox.setValue(self.n_bootstrap)
         self.usebg_checkbox.setChecked(self.pars.get('usebg'))
+        self.fastplanck_checkbox.setChecked(self.pars.get('fastplanck'))
         self.autofit_checkbox.setChecked(self.autofit)
+        self.livepreview_checkbox.setChecked(self.livepreview)
 
         self.choosedelta_button = QPushButton('Choose delta')
+        self.sensitivity_button = QPushButton('Window sensitivity')
         self.fit_button = QPushButton('Fit')
         self.batch_fit_button = QPushButton('Batch fit')
 
         self.batch_menu = QMenu(self)
         self.batch_menu.addAction(QAction("Current group (default)", self))
+        self.batch_menu.addAction(QAction("Current group (warm start)", self))
         # not implemented yet:
 #        self.batch_menu.addAction(QAction("Select", self))
         self.batch_menu.addAction(QAction("All", self))
@@ -145,6 +206,8 @@ class MainWindow(QWidget):
         fitparam_form.addRow('Lower limit (nm):', self.lowerbound_spinbox)
         fitparam_form.addRow('Upper limit (nm):', self.upperbound_spinbox)
         fitparam_form.addRow('2-color delta (px):', self.delta_spinbox)
+        fitparam_form.addRow('Fit rebinning (px):', self.rebin_spinbox)
+        fitparam_form.addRow('Bootstrap resamples:', self.bootstrap_spinbox)
         
         self.results_table = SingleFitResultsTable()
 
@@ -153,8 +216,11 @@ class MainWindow(QWidget):
         fit_layout = QVBoxLayout()
         fit_layout.addLayout(fitparam_form)
         fit_layout.addWidget(self.usebg_checkbox)
+        fit_layout.addWidget(self.fastplanck_checkbox)
         fit_layout.addWidget(self.choosedelta_button)
+        fit_layout.addWidget(self.sensitivity_button)
         fit_layout.addWidget(self.autofit_checkbox)
+        fit_layout.addWidget(self.livepreview_checkbox)
         fit_layout.addWidget(self.fit_button)
         fit_layout.addWidget(self.batch_fit_button)
         fit_layout.addWidget(self.results_table)
@@ -175,20 +241,62 @@ class MainWindow(QWidget):
         self.canvas = FourPlotsCanvas(self)
         self.toolbar = self.canvas.get_NavigationToolbar(self)
 
+        # timings overlay, see Tools menu
+        self.timing_label = QLabel('')
+        self.timing_label.setVisible(profiler.enabled)
+
         plot_layout.addWidget(self.toolbar)
         plot_layout.addWidget(self.canvas)
+        plot_layout.addWidget(self.timing_label)
 
         center_groupbox.setLayout(plot_layout)
 
         # setup other windows
         # self is passed as parent window
         self.choosedelta_win = ChooseDeltaWindow(self)
+        self.sensitivity_win = WindowSensitivityWindow(self)
+        self.mapping_win = MappingWindow(self)
+        self.database_win = DatabaseWindow(self)
+        self.quality_win = QualityWindow(self)
+        self.memory_win = MemoryWindow(self)
         self.batch_win = BatchWindow(self)
 
+        # tools menu
+        self.tools_button = QPushButton('Tools')
+        self.tools_menu = QMenu(self)
+        self.timing_action = QAction("Show timings", self)
+        self.timing_action.setCheckable(True)
+        self.timing_action.setChecked(profiler.enabled)
+        self.tools_menu.addAction(self.timing_action)
+        self.tools_menu.addAction(QAction("Export timing trace", self))
+        self.tools_menu.addSeparator()
+        self.prefetch_action = QAction("Prefetch neighbours", self)
+        self.prefetch_action.setCheckable(True)
+        self.tools_menu.addAction(self.prefetch_action)
+        self.watch_action = QAction("Watch folder", self)
+        self.watch_action.setCheckable(True)
+        self.tools_menu.addAction(self.watch_action)
+        self.tools_menu.addSeparator()
+        self.tools_menu.addAction(QAction("Stream fit files...", self))
+        self.tools_menu.addAction(QAction("Temperature map (CCD lines)", self))
+        self.tools_menu.addAction(QAction("Fit report of group...", self))
+        self.tools_menu.addAction(QAction("Fit quality of batch", self))
+        self.tools_menu.addAction(QAction("Bootstrap errors of batch...", 
+                                          self))
+        self.tools_menu.addAction(QAction("Memory budget...", self))
+        self.tools_menu.addAction(QAction("Memory report...", self))
+        self.tools_menu.addSeparator()
+        self.record_action = QAction("Record fits in database", self)
+        self.record_action.setCheckable(True)
+        self.tools_menu.addAction(self.record_action)
+        self.tools_menu.addAction(QAction("Results database...", self))
+        self.tools_button.setMenu(self.tools_menu)
+
         # about button
         self.about_button = QPushButton('About')
         right_groupbox_about = QVBoxLayout()
         right_groupbox_about.addWidget(right_groupbox)
+        right_groupbox_about.addWidget(self.tools_button)
         right_groupbox_about.addWidget(self.about_button)
 
         layout = QHBoxLayout()
@@ -200,6 +308,79 @@ class MainWindow(QWidget):
         
         self.setLayout(layout)
 
+        # live preview: parameter changes are coalesced by a debounce
+        # timer, then fitted in a single background thread. Only the 
+        # result of the latest job is displayed.
+        self.livepreview_timer = QTimer(self)
+        self.livepreview_timer.setSingleShot(True)
+        self.livepreview_timer.setInterval(300) # ms
+        self.livepreview_pool = QThreadPool(self)
+        self.livepreview_pool.setMaxThreadCount(1)
+        self.livepreview_generation = 0
+        self.livepreview_jobs = []
+
+        # prefetch: after a selection, the next and previous frames of 
+        # the group are fitted in background with the current pars 
+        # (autofit mode only).
+        self.prefetch = True
+        self.prefetch_frames = 3
+        self.prefetch_pool = QThreadPool(self)
+        self.prefetch_pool.setMaxThreadCount(2)
+        self.prefetch_jobs = []
+        self.prefetch_action.setChecked(self.prefetch)
+
+        # watched folder: new or modified ASCII files are loaded when
+        # the folder changes (inotify on linux) and by polling, which
+        # also catches files modified after their creation.
+        self.folder_index = None
+        self.folder_watcher = QFileSystemWatcher(self)
+        self.folder_scan_timer = QTimer(self)
+        self.folder_scan_timer.setSingleShot(True)
+        self.folder_scan_timer.setInterval(250) # ms
+        self.folder_poll_timer = QTimer(self)
+        # watched folders are fitted in background in autofit mode:
+        self.ingest_pool = QThreadPool(self)
+        self.ingest_pool.setMaxThreadCount(1)
+        self.ingest_jobs = []
+
+        # streaming fits of files to a results file, without loading them
+        self.stream_job = None
+        self.stream_pool = QThreadPool(self)
+        self.stream_pool.setMaxThreadCount(1)
+        self.stream_timer = QTimer(self)
+        self.stream_timer.setInterval(500) # ms
+
+        # per-CCD-line temperature maps, one at a time
+        self.mapping_job = None
+        self.mapping_pool = QThreadPool(self)
+        self.mapping_pool.setMaxThreadCount(1)
+
+        # fit reports, rendered in a process pool by the job
+        self.report_job = None
+        self.report_pool = QThreadPool(self)
+        self.report_pool.setMaxThreadCount(1)
+
+        # bootstrap of a batch, in a process pool run by the job
+        self.bootstrap_job = None
+        self.bootstrap_pool = QThreadPool(self)
+        self.bootstrap_pool.setMaxThreadCount(1)
+
+        # results database (database.py), opened when first needed.
+        # Fits are recorded in bulk once the event loop is idle: a batch
+        # is one transaction.
+        self.database = None
+        self.record_fits = False
+        self.pending_records = []
+        self.record_timer = QTimer(self)
+        self.record_timer.setSingleShot(True)
+        self.record_timer.setInterval(0)
+
+        # memory telemetry, always on: a sample is a few microseconds
+        self.telemetry_timer = QTimer(self)
+        self.telemetry_timer.setInterval(10000) # ms
+        self.telemetry_timer.start()
+        self.telemetry.sample()
+
         self.create_connects()
 
     def create_connects(self):
@@ -210,6 +391,11 @@ class MainWindow(QWidget):
         self.about_button.clicked.connect(self.show_about)
 
         self.exportraw_button.clicked.connect(self.export_current_raw)
+        self.exportraw_button.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.exportraw_button.customContextMenuRequested.connect(
+                lambda pos: self.show_any_menu(pos, self.exportraw_button, 
+                                                    self.export_menu))
+        self.export_menu.triggered.connect(self.export_processed)
 
         self.dataset_tree.currentItemChanged.connect(
             lambda: self.update('dataset_tree'))
@@ -228,6 +414,9 @@ class MainWindow(QWidget):
         self.choosedelta_button.clicked.connect(self.choose_delta)
         self.choosedelta_win.delta_changed.connect(self.update_delta)
 
+        self.sensitivity_button.clicked.connect(self.window_sensitivity)
+        self.sensitivity_win.window_changed.connect(self.update_window)
+
         # on change in parameters widgets it is updated in self.pars
         self.lowerbound_spinbox.valueChanged.connect(
                 lambda x: self.pars.__setitem__('lowerb', x))
@@ -235,11 +424,31 @@ class MainWindow(QWidget):
                 lambda x: self.pars.__setitem__('upperb', x))
         self.delta_spinbox.valueChanged.connect(
                 lambda x: self.pars.__setitem__('delta', x))
+        self.rebin_spinbox.valueChanged.connect(
+                lambda x: self.pars.__setitem__('rebin', x))
+        self.bootstrap_spinbox.valueChanged.connect(
+                lambda x: setattr(self, 'n_bootstrap', x))
         self.usebg_checkbox.stateChanged.connect(
                 lambda: self.pars.__setitem__('usebg', 
                     self.usebg_checkbox.isChecked()))
+        self.fastplanck_checkbox.stateChanged.connect(
+                lambda: self.pars.__setitem__('fastplanck', 
+                    self.fastplanck_checkbox.isChecked()))
         self.autofit_checkbox.stateChanged.connect(
                 lambda b: setattr(self, 'autofit', bool(b)))
+        self.livepreview_checkbox.stateChanged.connect(
+                lambda b: setattr(self, 'livepreview', bool(b)))
+
+        # any change of the parameters restarts the debounce timer
+        for signal in (self.lowerbound_spinbox.valueChanged,
+                       self.upperbound_spinbox.valueChanged,
+                       self.delta_spinbox.valueChanged,
+                       self.rebin_spinbox.valueChanged,
+                       self.usebg_checkbox.stateChanged,
+                       self.fastplanck_checkbox.stateChanged,
+                       self.livepreview_checkbox.stateChanged):
+            signal.connect(self.schedule_livepreview)
+        self.livepreview_timer.timeout.connect(self.start_livepreview)
 
         self.export_results_button.clicked.connect(self.export_results)
 
@@ -249,6 +458,25 @@ class MainWindow(QWidget):
 #        self.usebg_checkbox.stateChanged.connect(self.update)
 
         self.batch_menu.triggered.connect(self.batch_fit)
+        self.tools_menu.triggered.connect(self.tools)
+
+        self.folder_watcher.directoryChanged.connect(
+                lambda path: self.folder_scan_timer.start())
+        self.folder_scan_timer.timeout.connect(self.scan_folder)
+        self.folder_poll_timer.timeout.connect(self.scan_folder)
+
+        # refresh the timings once the canvas is actually drawn
+        self.canvas.drawn.connect(self.update_timing_label)
+        self.stream_timer.timeout.connect(self.update_stream_label)
+        self.stream_timer.timeout.connect(self.update_mapping_label)
+        self.stream_timer.timeout.connect(self.update_report_label)
+        self.stream_timer.timeout.connect(self.update_bootstrap_label)
+        self.record_timer.timeout.connect(self.flush_records)
+        self.database_win.hit_chosen.connect(self.open_database_hit)
+        self.quality_win.key_chosen.connect(self.select_key)
+        self.telemetry_timer.timeout.connect(self.telemetry.sample)
+        self.memory_win.refresh_requested.connect(self.show_memory_report)
+        self.batch_win.key_chosen.connect(self.select_key)
 
     @pyqtSlot(QPoint, QWidget, QMenu)
     def show_any_menu(self, pos, clicked_widget, menu):
@@ -262,14 +490,14 @@ class MainWindow(QWidget):
 
     #   options |= QFileDialog.DontUseNativeDialog
         paths, file_filter = QFileDialog.getOpenFileNames(self,
-            "Load file", "", "NeXus HDF5 file (*.h5 *.hdf5);;"
+            "Load file", "", H5_FILTER + ";;"
                              "ASCII File (*.txt *.dat *.csv *.asc);;"
                              "Any File (*.*)",
             options=options)
 
         if paths:
             # H5 CASE:
-            if file_filter == 'NeXus HDF5 file (*.h5 *.hdf5)':
+            if file_filter == H5_FILTER or all(map(is_h5file, paths)):
                 if len(paths) > 1:
                     # It would be easy to load successively each file,
                     # but what do we do with reload button? 
@@ -290,33 +518,517 @@ class MainWindow(QWidget):
                     self.data[di['name']] = BlackBodySpec(**di)
                 
                 self.data.sort_chrono()
+                self.memory.track(self.data.flatten().values())
+                self.populate_tree()
+
+    @pyqtSlot(QAction)
+    def tools(self, action):
+        if action.text() == "Show timings":
+            profiler.enable(action.isChecked())
+            self.timing_label.setVisible(action.isChecked())
+            self.update_timing_label()
+        elif action.text() == "Export timing trace":
+            self.export_timing_trace()
+        elif action.text() == "Prefetch neighbours":
+            self.prefetch = action.isChecked()
+            if not self.prefetch:
+                self.prefetch_pool.clear()
+        elif action.text() == "Watch folder":
+            if action.isChecked():
+                folder = QFileDialog.getExistingDirectory(self, 
+                                        "h5temperature: Watch folder")
+                if not folder or not self.start_watch(folder):
+                    action.setChecked(False)
+            else:
+                self.stop_watch()
+        elif action.text() == "Stream fit files...":
+            self.stream_fit()
+        elif action.text() == "Temperature map (CCD lines)":
+            self.temperature_map()
+        elif action.text() == "Fit report of group...":
+            self.fit_report()
+        elif action.text() == "Fit quality of batch":
+            self.show_quality()
+        elif action.text() == "Bootstrap errors of batch...":
+            self.bootstrap_batch()
+        elif action.text() == "Memory budget...":
+            self.set_memory_budget()
+        elif action.text() == "Memory report...":
+            self.show_memory_report()
+        elif action.text() == "Record fits in database":
+            self.record_fits = action.isChecked() and \
+                               self.open_database() is not None
+            action.setChecked(self.record_fits)
+        elif action.text() == "Results database...":
+            self.show_database()
+
+    def start_watch(self, folder):
+        # the files of the folder are added to an ASCII session only:
+        # returns False with a HDF5 file loaded
+        if self.filepath:
+            QMessageBox.critical(self, 'Error',
+                        'The watched files are ASCII spectra, they cannot '
+                        'be added to a HDF5 file: clear the data first.')
+            return False
+        self.stop_watch()
+        self.folder_index = FolderIndex(folder)
+        # slower polling when the folder is watched by the system
+        if self.folder_watcher.addPath(folder):
+            self.folder_poll_timer.start(2000)
+        else:
+            self.folder_poll_timer.start(500)
+        self.currentfilename_label.setText(folder.split('/')[-1] + '/')
+        self.watch_action.setChecked(True)
+        self.scan_folder()
+        return True
+
+    def stop_watch(self):
+        if self.folder_watcher.directories():
+            self.folder_watcher.removePaths(self.folder_watcher.directories())
+        self.folder_poll_timer.stop()
+        self.folder_scan_timer.stop()
+        self.folder_index = None
+        self.watch_action.setChecked(False)
+
+    @pyqtSlot()
+    def scan_folder(self):
+        if self.folder_index is None:
+            return
+        try:
+            paths = self.folder_index.scan()
+        except OSError as e:
+            print(f"Error while scanning {self.folder_index.folder}: {e}")
+            return
+
+        for path in paths:
+            try:
+                di, = get_data_from_ascii([path])
+                spec = BlackBodySpec(**di)
+            except Exception:
+                # probably still being written, 
+                # it is read again when modified
+                continue
+
+            self.data.insert_chrono(di['name'], spec)
+            self.insert_tree_item(di['name'])
+            self.memory.touch(spec)
+
+            if self.autofit:
+                job = FitJob(di['name'], spec, self.pars,
+                             is_stale = lambda job: job.pars != self.pars)
+                job.signals.finished.connect(self.finish_background_fit)
+                self.ingest_jobs.append(job)
+                self.ingest_pool.start(job)
+
+    def insert_tree_item(self, key):
+        # (re)insert the top level item of key at the position of key
+        # in self.data, before the item of the next key
+        current = self.dataset_tree.currentItem()
+        was_current = current is not None and current.text(0) == key
+
+        for old in self.dataset_tree.findItems(key, Qt.MatchExactly):
+            self.dataset_tree.takeTopLevelItem(
+                self.dataset_tree.indexOfTopLevelItem(old))
+
+        keys = list(self.data.keys())
+        ind = self.dataset_tree.topLevelItemCount()
+        for next_key in keys[keys.index(key) + 1:]:
+            found = self.dataset_tree.findItems(next_key, Qt.MatchExactly)
+            if found:
+                ind = self.dataset_tree.indexOfTopLevelItem(found[0])
+                break
+
+        item = QTreeWidgetItem([key])
+        self.dataset_tree.insertTopLevelItem(ind, item)
+        if was_current:
+            self.dataset_tree.setCurrentItem(item)
+
+    def stream_fit(self):
+        # fits all spectra of the chosen files with the current pars,
+        # results go directly to a text file (see pipeline.py)
+        if self.stream_job is not None:
+            QMessageBox.critical(self, 'Error',
+            'Streaming fits are already running')
+            return
+
+        paths, _ = QFileDialog.getOpenFileNames(self,
+                            "h5temperature: Files to fit", 
+                            "",
+                            H5_FILTER + ";;All Files (*)")
+        if not paths:
+            return
+        output, _ = QFileDialog.getSaveFileName(self,
+                            "h5temperature: Results file", 
+                            "",
+                            "Text File (*.txt);;All Files (*)")
+        if not output:
+            return
+        if not output.endswith('.txt'):
+            output += '.txt'
+
+        self.stream_job = PipelineJob(paths, self.pars, output)
+        self.stream_job.signals.finished.connect(self.finish_stream_fit)
+        self.stream_pool.start(self.stream_job)
+        self.timing_label.setVisible(True)
+        self.stream_timer.start()
+
+    @pyqtSlot()
+    def update_stream_label(self):
+        if self.stream_job is not None and \
+                self.stream_job.pipeline is not None:
+            self.timing_label.setText('Streaming fits: ' + 
+                                      self.stream_job.pipeline.stats_text())
+
+    @pyqtSlot(object)
+    def finish_stream_fit(self, job):
+        self.update_stream_label()
+        self.stream_job = None
+        self.stop_progress_timer()
+
+        if job.error is not None:
+            QMessageBox.critical(self, 'Error', job.error)
+        elif job.pipeline.errors:
+            QMessageBox.warning(self, 'Warning',
+                f'{len(job.pipeline.errors)} spectra could not be fitted '
+                f'(first: {job.pipeline.errors[0][0]}: '
+                f'{job.pipeline.errors[0][1]})')
+
+    def temperature_map(self):
+        # fits all CCD lines of all frames of the current h5 group
+        item = self.dataset_tree.currentItem()
+        if not self.filepath or item is None:
+            QMessageBox.critical(self, 'Error',
+            'Temperature maps need a group of an HDF5 file')
+            return
+        if self.mapping_job is not None:
+            QMessageBox.critical(self, 'Error',
+            'A temperature map is already being computed')
+            return
+        if item.parent():
+            item = item.parent()
+
+        self.mapping_job = MappingJob(self.filepath, item.text(0), self.pars)
+        self.mapping_job.signals.finished.connect(self.finish_temperature_map)
+        self.mapping_pool.start(self.mapping_job)
+        self.timing_label.setVisible(True)
+        self.stream_timer.start()
+
+    @pyqtSlot()
+    def update_mapping_label(self):
+        job = self.mapping_job
+        if job is not None and job.total:
+            self.timing_label.setText(f'Temperature map of {job.group}: '
+                                      f'{job.done}/{job.total} frames')
+
+    @pyqtSlot(object)
+    def finish_temperature_map(self, job):
+        self.mapping_job = None
+        self.stop_progress_timer()
+
+        if job.error is not None:
+            QMessageBox.critical(self, 'Error', job.error)
+            return
+        self.mapping_win.set_data(job.result)
+        self.mapping_win.canvas.draw_idle()
+        if not self.mapping_win.isVisible():
+            self.mapping_win.show()
+        else:
+            self.mapping_win.activateWindow()
+
+    def fit_report(self):
+        # four plots of every spectrum of the current group (or of the
+        # current spectrum) with the current pars, see reports.py
+        item = self.dataset_tree.currentItem()
+        if item is None:
+            QMessageBox.critical(self, 'Error', 'Nothing to report')
+            return
+        if self.report_job is not None:
+            QMessageBox.critical(self, 'Error',
+            'A report is already being written')
+            return
+        if item.parent():
+            item = item.parent()
+        value = self.data[item.text(0)]
+        specs = list(value.values()) if isinstance(value, NestedData) \
+                else [value]
+
+        fmt, ok = QInputDialog.getItem(self, 
+                            "h5temperature: Fit report",
+                            f"Format of the {len(specs)} pages:", 
+                            ["PNG", "PDF"], 0, False)
+        if not ok:
+            return
+        folder = QFileDialog.getExistingDirectory(self, 
+                            "h5temperature: Folder of the report")
+        if not folder:
+            return
+
+        self.report_job = ReportJob(specs, folder, fmt.lower(), self.pars)
+        self.report_job.signals.finished.connect(self.finish_fit_report)
+        self.report_pool.start(self.report_job)
+        self.timing_label.setVisible(True)
+        self.stream_timer.start()
+
+    @pyqtSlot()
+    def update_report_label(self):
+        job = self.report_job
+        if job is not None:
+            self.timing_label.setText(f'Fit report: {job.done}/{job.total} '
+                                      'pages')
+
+    @pyqtSlot(object)
+    def finish_fit_report(self, job):
+        self.report_job = None
+        self.stop_progress_timer()
+
+        if job.error is not None:
+            QMessageBox.critical(self, 'Error', job.error)
+        else:
+            QMessageBox.information(self, 'h5temperature', 
+                                    f'Report written: {job.index}')
+
+    def bootstrap_batch(self, n_boot=None):
+        # residual bootstrap of all the fits of the batch, in a process 
+        # pool (uncertainty.py). n_boot None: asked
+        if self.batch is None:
+            QMessageBox.critical(self, 'Error', 
+            'No batch: fit a group or all spectra with Batch fit first')
+            return
+        if self.bootstrap_job is not None:
+            QMessageBox.critical(self, 'Error',
+            'A bootstrap is already running')
+            return
+        if n_boot is None:
+            n_boot, ok = QInputDialog.getInt(self,
+                    "h5temperature: Bootstrap errors",
+                    f"Resamples for each of the {self.batch.n_points} fits:",
+                    self.n_bootstrap or 200, 10, 100000, 100)
+            if not ok:
+                return
+
+        self.bootstrap_job = BootstrapJob(self.batch.measurements, n_boot,
+                                          self.pars.get('bootstrap_seed') 
+                                          or 0)
+        self.bootstrap_job.signals.finished.connect(self.finish_bootstrap)
+        self.bootstrap_pool.start(self.bootstrap_job)
+        self.timing_label.setVisible(True)
+        self.stream_timer.start()
+
+    @pyqtSlot()
+    def update_bootstrap_label(self):
+        job = self.bootstrap_job
+        if job is not None:
+            self.timing_label.setText(f'Bootstrap: {job.done}/{job.total} '
+                                      'fits')
+
+    @pyqtSlot(object)
+    def finish_bootstrap(self, job):
+        self.bootstrap_job = None
+        self.stop_progress_timer()
+
+        if job.error is not None:
+            QMessageBox.critical(self, 'Error', job.error)
+            return
+        job.commit()
+        for spec in job.specs:
+            self.record_fit(spec)
+        if self.batch is not None:
+            self.batch.extract_all()
+            if self.quality_win.isVisible():
+                self.quality_win.set_batch(self.batch)
+        item = self.dataset_tree.currentItem()
+        if item is not None:
+            current = self.data.find_by_key(item.text(0))
+            if current is not None and current._fitted:
+                self.results_table.set_values(current)
+
+    def show_quality(self):
+        if self.batch is None:
+            QMessageBox.critical(self, 'Error', 
+            'No batch: fit a group or all spectra with Batch fit first')
+            return
+        self.quality_win.set_batch(self.batch)
+        if not self.quality_win.isVisible():
+            self.quality_win.show()
+        else:
+            self.quality_win.activateWindow()
+
+    @pyqtSlot(str)
+    def select_key(self, key):
+        # displays the spectrum of key, e.g. chosen in another window
+        found = self.dataset_tree.findItems(key, 
+                                    Qt.MatchExactly | Qt.MatchRecursive)
+        if found:
+            self.dataset_tree.setCurrentItem(found[0])
+            self.dataset_tree.scrollToItem(found[0])
+
+    def stop_progress_timer(self):
+        # the progress of the background jobs shares the timing label
+        if self.stream_job is None and self.mapping_job is None and \
+                self.report_job is None and self.bootstrap_job is None:
+            self.stream_timer.stop()
+            self.timing_label.setVisible(profiler.enabled)
+
+    def memory_report(self, top=20):
+        # memory of the arrays of the session, see memory.memory_report
+        figures = dict(main = self.canvas.fig,
+                       batch = self.batch_win.canvas.fig,
+                       delta = self.choosedelta_win.canvas.fig,
+                       sensitivity = self.sensitivity_win.fig,
+                       mapping = self.mapping_win.fig)
+        return memory_report(self.data, self.batch, figures, top)
+
+    def show_memory_report(self):
+        self.telemetry.sample()
+        self.memory_win.set_report(self.memory_report(), self.telemetry)
+        if not self.memory_win.isVisible():
+            self.memory_win.show()
+        else:
+            self.memory_win.activateWindow()
+
+    def set_memory_budget(self):
+        limit = self.memory.limit
+        mb, ok = QInputDialog.getInt(self, 
+                    "h5temperature: Memory budget",
+                    "Memory for the spectra in MB (0: no limit).\n"
+                    "Spectra not used recently are read again from their\n"
+                    "file when needed.\n\n"
+                    f"Currently {self.memory.usage_text()}",
+                    0 if limit is None else limit // 2**20, 0, 10**6)
+        if ok:
+            self.memory.set_limit(mb * 2**20 if mb > 0 else None)
+
+    def open_database(self):
+        # the results database, None (with a message) if it cannot be opened
+        if self.database is None:
+            from h5temperature.database import ResultsDatabase
+            try:
+                self.database = ResultsDatabase()
+            except Exception as e:
+                QMessageBox.critical(self, 'Error', 
+                    f'Cannot open the results database: {e}')
+        return self.database
+
+    def record_fit(self, current):
+        if self.record_fits and current._fitted:
+            self.pending_records.append(current)
+            self.record_timer.start()
+
+    @pyqtSlot()
+    def flush_records(self):
+        specs, self.pending_records = self.pending_records, []
+        try:
+            self.database.add(specs)
+        except Exception as e:
+            print(f"Error while recording fits: {e}")
+        if self.database_win.isVisible():
+            self.database_win.set_database(self.database)
+
+    def show_database(self):
+        if self.open_database() is None:
+            return
+        self.database_win.set_database(self.database)
+        if not self.database_win.isVisible():
+            self.database_win.show()
+        else:
+            self.database_win.activateWindow()
+
+    @pyqtSlot(object)
+    def open_database_hit(self, hit):
+        # loads the file of a hit of the database window, if needed,
+        # and selects its spectrum in the tree
+        path = hit['file']
+        if not path or not os.path.exists(path):
+            QMessageBox.critical(self, 'Error', f'File not found: {path}')
+            return
+
+        found = self.dataset_tree.findItems(hit['name'], 
+                                    Qt.MatchExactly | Qt.MatchRecursive)
+        if hit['kind'] == 'h5':
+            if not self.filepath or \
+                    os.path.abspath(self.filepath) != path:
+                # as a file loaded with the load button
+                self.filepath = path
+                self.load_h5file_content()
                 self.populate_tree()
+                self.currentfilename_label.setText(path.split('/')[-1])
+                found = []
+        elif not found:
+            di, = get_data_from_ascii([path])
+            spec = BlackBodySpec(**di)
+            self.data.insert_chrono(di['name'], spec)
+            self.insert_tree_item(di['name'])
+            self.memory.touch(spec)
+
+        if not found:
+            found = self.dataset_tree.findItems(hit['name'], 
+                                        Qt.MatchExactly | Qt.MatchRecursive)
+        if not found:
+            QMessageBox.critical(self, 'Error', 
+                f'{hit["name"]} not found in {path}')
+            return
+        self.dataset_tree.setCurrentItem(found[0])
+        self.dataset_tree.scrollToItem(found[0])
+        self.activateWindow()
+
+    def use_spectrum(self, current):
+        # current becomes the most recently used spectrum of the memory 
+        # budget, it is read again from its file if it was evicted
+        try:
+            self.memory.touch(current)
+        except RuntimeError as e:
+            QMessageBox.critical(self, 'Error', str(e))
+            return False
+        return True
+
+    def update_timing_label(self):
+        if profiler.enabled:
+            self.timing_label.setText(profiler.overlay_text())
+
+    def export_timing_trace(self):
+        options =  QFileDialog.Options() 
+        filename, _ = QFileDialog.getSaveFileName(self,
+                                    "h5temperature: Export timing trace", 
+                                    "",
+                                    "Chrome trace (*.json);;All Files (*)", 
+                                    options=options)
+        if filename:
+            if not filename.endswith('.json'):
+                filename += '.json'
+            profiler.export_chrome_trace(filename)
 
     @pyqtSlot()
     def reload_h5file(self):
-        # No mechanism for RELOAD when using ASCII files yet.
         # In ascii mode, self.filepath remain None.
-        # In future, use the folder and search for new ascii files in it.  
+        # RELOAD then scans the watched folder, if any.
         if self.filepath:
             self.load_h5file_content()
             self.populate_tree()
+        elif self.folder_index is not None:
+            self.scan_folder()
 
     def load_h5file_content(self):
         # read h5 file and store in self.data:
-        extracted = read_h5file(self.filepath)
-        for k, v in extracted.items():
-            if isinstance(v, dict):
-                self.data[k] = BlackBodySpec(k, **v)
-            elif isinstance(v, list):
-                group = NestedData()
-                for i, vi in enumerate(v):
-                    # define the keys in subitems with [i]
-                    key = f'{k}[{i}]'
-                    group[key] = BlackBodySpec(key, **vi)
-                self.data[k] = group
-
-        self.data.sort_chrono()
-
+        # no watched ASCII files in a HDF5 session
+        self.stop_watch()
+        with timed('load'):
+            extracted = read_h5file(self.filepath)
+            for k, v in extracted.items():
+                if isinstance(v, dict):
+                    self.data[k] = BlackBodySpec(k, **v)
+                elif isinstance(v, list):
+                    group = NestedData()
+                    for i, vi in enumerate(v):
+                        # define the keys in subitems with [i]
+                        key = f'{k}[{i}]'
+                        group[key] = BlackBodySpec(key, **vi)
+                    self.data[k] = group
+
+            self.data.sort_chrono()
+            self.memory.track(self.data.flatten().values())
+        self.update_timing_label()
+
+    @timed_function('populate tree')
     def populate_tree(self):
         if self.data:
             previous = [self.dataset_tree.topLevelItem(x).text(0) 
@@ -351,31 +1063,57 @@ class MainWindow(QWidget):
                     if not '.txt' in filename:
                         filename += '.txt'
                         
-                # create empty array of len(lam) to be saved in txt
-                twocolor_ = np.empty( len(current.lam) )
-                # fill with NaN
-                twocolor_.fill(np.nan)
-
-                # create nans of length delta (px)
-                nans = np.empty(current.pars['delta'])
-                nans.fill(np.nan)
-
-                # nans of length delta at the end:
-                dat1 = np.concatenate([current.twocolor, nans])
-                # populate twocolor_ only where data should be, the rest is nan
-                twocolor_[current.ind_interval] = dat1
-
-                data_ = np.column_stack((current.lam,
-                                         current.planck,
-                                         current.wien,
-                                         current.rawwien,
-                                         twocolor_))
+                curves = current.get_curves()
+                data_ = np.column_stack([curves[k] for k in ('lam',
+                                                             'planck',
+                                                             'wien',
+                                                             'rawwien',
+                                                             'twocolor')])
                 np.savetxt(filename, 
                            data_, 
                            delimiter='\t', 
                            comments='',
                            header='lambda\tplanck\twien\traw_wien\ttwocolor')
 
+    @pyqtSlot(QAction)
+    def export_processed(self, action):
+        if action.text() == "Current spectrum (ASCII)":
+            self.export_current_raw()
+            return
+
+        if action.text() == "Current group (HDF5)":
+            item = self.dataset_tree.currentItem()
+            if item is not None and item.parent():
+                item = item.parent()
+            if item is None or item.childCount() == 0:
+                QMessageBox.critical(self, 'Error', 'No group selected')
+                return
+            data = {item.text(0): self.data[item.text(0)]}
+        else:
+            data = self.data
+
+        if not len(data):
+            QMessageBox.critical(self, 'Error', 'Nothing to export')
+            return
+
+        options =  QFileDialog.Options() 
+        filename, _ = QFileDialog.getSaveFileName(self,
+                                    "h5temperature: Export to HDF5", 
+                                    "",
+                                    "HDF5 File (*.h5);;All Files (*)", 
+                                    options=options)
+        if filename:
+            if not is_h5file(filename):
+                filename += '.h5'
+            # spectra are fitted with the current pars as in batch fits
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            try:
+                write_h5_processed(filename, data, prepare=self.eval_fits)
+            except Exception as e:
+                QMessageBox.critical(self, 'Error', f'Export failed: {e}')
+            finally:
+                QApplication.restoreOverrideCursor()
+
     @pyqtSlot(int)
     def update_delta(self, x):
         self.delta_spinbox.setValue(x)
@@ -388,12 +1126,9 @@ class MainWindow(QWidget):
         if item is not None:
             current = self.data.find_by_key(item.text(0))
 
-            # calculate stdev vs. delta: could be done somewhere else?
+            # calculate stdev vs. delta
             alldeltas = np.array(range(1,300)) # in px
-            allstddevs = np.array( [np.nanstd(Ph.temp2color(
-                                    current.lam[current.ind_interval], 
-                                    current.wien[current.ind_interval], 
-                                    di)) for di in alldeltas ] )
+            allstddevs = current.twocolor_stddevs(alldeltas)
     
             self.choosedelta_win.set_data(alldeltas, allstddevs)
             self.choosedelta_win.set_vline(current.pars['delta'])
@@ -405,11 +1140,49 @@ class MainWindow(QWidget):
             else:
                 self.choosedelta_win.activateWindow()
 
+    @pyqtSlot(int, int)
+    def update_window(self, lower, upper):
+        self.lowerbound_spinbox.setValue(lower)
+        self.upperbound_spinbox.setValue(upper)
+        self.update('window_sensitivity')
+
+    @pyqtSlot()
+    def window_sensitivity(self):
+        item = self.dataset_tree.currentItem()
+
+        if item is not None:
+            current = self.data.find_by_key(item.text(0))
+            if current is None:
+                return
+            # not fitted yet: the delta of the main window is used
+            if current.pars['delta'] is None:
+                current.set_pars(self.pars)
+
+            # all windows with 5 nm steps over the spectrum
+            step = 5
+            lowers = np.arange(np.floor(np.min(current.lam)), 
+                               np.max(current.lam), step)
+            uppers = lowers + step
+
+            maps = current.window_sensitivity(lowers, uppers)
+
+            self.sensitivity_win.set_data(lowers, uppers, *maps)
+            self.sensitivity_win.set_marker(current.pars['lowerb'], 
+                                            current.pars['upperb'])
+            self.sensitivity_win.canvas.draw_idle()
+
+            if not self.sensitivity_win.isVisible():
+                self.sensitivity_win.show()
+            else:
+                self.sensitivity_win.activateWindow()
+
     @pyqtSlot()
     def clear_all(self):
+        self.stop_watch()
         self.filepath = str()
         self.currentfilename_label.setText('')
         self.data = NestedData()
+        self.memory.clear()
         self.dataset_tree.clear()
         self.results_table.clearContents()
         self.batch = None
@@ -417,28 +1190,26 @@ class MainWindow(QWidget):
         self.canvas.clear_all()
         self.choosedelta_win.clear_canvas()
 
-        # we should clear batch plot here
+        self.batch_win.clear()
 
     def eval_fits(self, current):
+        if not self.use_spectrum(current):
+            return
         if not current.pars == self.pars:
-            current.set_pars(self.pars)
             # eval all quantities for a given spectrum
             try:
-                # start with wien to get a reasonable initial value for planck:
-                current.eval_wien_fit()
-                current.eval_planck_fit()            
-    
-                # Refit wien again, accounting for bg obtained in Planck:
-                if current.pars['usebg']:
-                    current.eval_wien_fit()
-                # eval two color at the end in all cases
-                current.eval_twocolor()
-    
+                with timed('fits'):
+                    current.eval_fits(self.pars)
             except Exception as e:
                 QMessageBox.critical(self, 'Error', str(e))
+            else:
+                self.record_fit(current)
+            # size of the fit curves
+            self.memory.touch(current)
 
 
     @pyqtSlot(str)
+    @timed_function('update')
     def update(self, called_from):
         # clear all plots and fit results table:
         self.canvas.clear_all()
@@ -461,6 +1232,8 @@ class MainWindow(QWidget):
                 item = self.dataset_tree.currentItem()
 
             current = self.data.find_by_key(item.text(0))
+            if not self.use_spectrum(current):
+                return
          
             # if autofit, or called from fitbutton or delta_changed
             # we do the fit:
@@ -468,17 +1241,10 @@ class MainWindow(QWidget):
                 self.eval_fits(current)
 
             # in any case we update display!
-            self.canvas.update_data(current)
-            if current._fitted:
-                self.canvas.update_fits(current)
-                self.results_table.set_values(current)
+            self.display(current, item.text(0))
 
-            # propagate change to the batch widget:
-            # current.name is always the parent name in the group, this may change
-            # or a class for groups ?  
-            if self.batch and (item.text(0) in self.batch.keys):
-                self.batch.extract_all()
-                self.batch_win.replot(self.batch)
+            if called_from == 'dataset_tree':
+                self.start_prefetch(item)
 
         # no item selected:
 #        else:
@@ -495,6 +1261,128 @@ class MainWindow(QWidget):
 #    @pyqtSlot()
 #    def update_fit():
 
+    def display(self, current, key):
+        self.canvas.update_data(current)
+        if current._fitted:
+            self.canvas.update_fits(current)
+            self.results_table.set_values(current)
+
+        # propagate change to the batch widget:
+        # current.name is always the parent name in the group, this may change
+        # or a class for groups ?  
+        if self.batch and (key in self.batch.index):
+            # only this spectrum changed: the zoom of the batch is kept
+            self.batch.update(key)
+            self.batch_win.set_current(key)
+            if self.quality_win.isVisible():
+                self.quality_win.set_batch(self.batch)
+
+    def start_prefetch(self, item):
+        # previous jobs are for another selection: the queued ones are 
+        # dropped, the running ones will be committed if still valid.
+        self.prefetch_pool.clear()
+        self.prefetch_jobs = [job for job in self.prefetch_jobs 
+                              if job.started]
+
+        parent = item.parent()
+        if not (self.prefetch and self.autofit) or parent is None:
+            return
+
+        # next frames first: +1, -1, +2, -2...
+        ind = parent.indexOfChild(item)
+        for dist in range(1, self.prefetch_frames + 1):
+            for i in (ind + dist, ind - dist):
+                if 0 <= i < parent.childCount():
+                    key = parent.child(i).text(0)
+                    spec = self.data[parent.text(0)][key]
+                    if spec.pars == self.pars:
+                        continue
+                    job = FitJob(key, spec, self.pars, 
+                                 is_stale = lambda job: 
+                                    job.pars != self.pars)
+                    job.signals.finished.connect(self.finish_background_fit)
+                    self.prefetch_jobs.append(job)
+                    self.prefetch_pool.start(job)
+
+    @pyqtSlot(object)
+    def finish_background_fit(self, job):
+        for jobs in (self.prefetch_jobs, self.ingest_jobs):
+            if job in jobs:
+                jobs.remove(job)
+
+        if job.cancelled or job.error:
+            return
+        current = self.data.find_by_key(job.key)
+        # spectrum replaced or pars changed meanwhile, 
+        # or already fitted on selection:
+        if current is not job.origin or job.pars != self.pars \
+                or current.pars == job.pars:
+            return
+        job.commit(current)
+        self.memory.touch(current)
+        self.record_fit(current)
+
+        # repaint if displayed but not fitted yet
+        item = self.dataset_tree.currentItem()
+        if item is not None and item.text(0) == job.key:
+            self.canvas.clear_all()
+            self.results_table.clearContents()
+            self.display(current, job.key)
+
+    @pyqtSlot()
+    def schedule_livepreview(self):
+        if self.livepreview:
+            # restarted at each change: fires once changes stop
+            self.livepreview_timer.start()
+
+    @pyqtSlot()
+    def start_livepreview(self):
+        item = self.dataset_tree.currentItem()
+        if item is None or item.childCount() > 0:
+            return
+        current = self.data.find_by_key(item.text(0))
+        if current is None or current.pars == self.pars:
+            return
+
+        # new generation: queued and running jobs become stale
+        self.livepreview_generation += 1
+        self.livepreview_pool.clear()
+        self.livepreview_jobs = [job for job in self.livepreview_jobs 
+                                 if job.started]
+
+        job = FitJob(item.text(0), current, self.pars,
+                     tag = self.livepreview_generation,
+                     is_stale = lambda job: 
+                        job.tag != self.livepreview_generation)
+        job.signals.finished.connect(self.finish_livepreview)
+        self.livepreview_jobs.append(job)
+        self.livepreview_pool.start(job)
+
+    @pyqtSlot(object)
+    def finish_livepreview(self, job):
+        if job in self.livepreview_jobs:
+            self.livepreview_jobs.remove(job)
+
+        # superseded: a newer job is queued or running
+        if job.cancelled or job.tag != self.livepreview_generation:
+            return
+
+        current = self.data.find_by_key(job.key)
+        if current is not job.origin:
+            return
+        if job.error:
+            QMessageBox.critical(self, 'Error', job.error)
+            return
+        job.commit(current)
+        self.record_fit(current)
+
+        # only painted if still displayed
+        item = self.dataset_tree.currentItem()
+        if item is not None and item.text(0) == job.key:
+            self.canvas.clear_all()
+            self.results_table.clearContents()
+            self.display(current, job.key)
+
     @pyqtSlot(QAction)
     def batch_fit(self, action):
         # show the batch window        
@@ -506,7 +1394,8 @@ class MainWindow(QWidget):
         keys_to_fit = dict()
 
         # Group mode:
-        if action.text() == "Current group (default)":
+        if action.text() in ("Current group (default)",
+                             "Current group (warm start)"):
             item = self.dataset_tree.currentItem()
             if item:
                 # item is the parent:
@@ -554,6 +1443,26 @@ class MainWindow(QWidget):
         # eval all fits and create batch_data from keys_to_fit
         # General to all modes
         if len(keys_to_fit) > 0:
+            self.batch_win.setWindowTitle('h5temperature batch')
+
+            if action.text() == "Current group (warm start)":
+                # frames of the group are fitted first, each one seeded 
+                # from its neighbour; eval_fits below then skips them.
+                group_data = [self.data[k][subk] 
+                              for k, subks in keys_to_fit.items() 
+                              for subk in subks]
+
+                stats = warmstart_fits(group_data, self.pars)
+                for spec in group_data:
+                    self.record_fit(spec)
+                for name, err in stats['errors'].items():
+                    QMessageBox.critical(self, 'Error', f'{name}: {err}')
+
+                self.batch_win.setWindowTitle(
+                    'h5temperature batch (warm start: '
+                    f'{stats["seeded"]}/{len(group_data)} seeded, '
+                    f'{stats["total_nfev"]} Planck evaluations)')
+
             batch_data = list()
             for k, subks in keys_to_fit.items():
                 # single measurement case:
@@ -571,6 +1480,10 @@ class MainWindow(QWidget):
 
             self.batch = TemperaturesBatch(batch_data)
             self.batch_win.replot(self.batch)
+            if self.quality_win.isVisible():
+                self.quality_win.set_batch(self.batch)
+            if self.n_bootstrap and self.bootstrap_job is None:
+                self.bootstrap_batch(self.n_bootstrap)
         else:
             QMessageBox.critical(self, 'Error',
             'Nothing to process in batch')
@@ -0,0 +1,204 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# Temperature mapping along the slit: every line (row) of the CCD image is
+# a spectrum from a different position across the hotspot. All lines of a
+# frame are fitted at once with the batched solvers (Planck without
+# background, Wien and two-color), giving a temperature profile per frame
+# and a (frames, lines) temperature image per group.
+#
+# The per-line image is any dataset of the group with one more dimension
+# than planck_data and the same number of pixels.
+
+import warnings
+import concurrent.futures
+
+import numpy as np
+
+import h5temperature.physics as Ph
+from h5temperature.solvers import (fit_window, 
+                                   weighted_linear_fit, 
+                                   planck_linear_fit)
+from h5temperature.formats import open_h5file
+
+
+SATURATION = 2**16 - 1
+
+
+def find_line_image(group):
+    # name of the per-line CCD image dataset in an h5 group, None if absent
+    import h5py
+
+    planck = group['measurement/planck_data']
+    ndim = len([s for s in planck.shape if s > 1])
+    n_px = planck.shape[-1]
+    skip = ('planck_data', 'max_data', 'spectrum_lambdas')
+
+    found = []
+    def visit(name, obj):
+        if isinstance(obj, h5py.Dataset) and \
+                not name.endswith(skip) and \
+                obj.ndim >= 2 and obj.shape[-1] == n_px and \
+                len([s for s in obj.shape if s > 1]) == ndim + 1:
+            found.append(name)
+    group.visititems(visit)
+    return found[0] if found else None
+
+def fit_lines(lam, lines, pars, min_signal=0.05):
+    # all lines of a frame at once: lines (n_lines, n_px), lam (n_px,)
+    # sorted. Lines with a maximum below min_signal times the strongest
+    # line are not fitted (NaN). Returns a dict of arrays (n_lines,).
+    ind = fit_window(lam, pars['lowerb'], pars['upperb'])
+    lam = lam[ind]
+    data = lines[:, ind]
+    n_lines = len(lines)
+
+    with warnings.catch_warnings(), np.errstate(all='ignore'):
+        # all-NaN lines are expected outside of the hotspot
+        warnings.simplefilter('ignore', RuntimeWarning)
+
+        saturated = np.max(lines, axis=-1) >= SATURATION
+        signal = np.nanmax(data, axis=-1) if data.size else \
+                 np.full(n_lines, np.nan)
+        fitted = signal >= min_signal * np.nanmax(signal)
+        # only the lines with signal are fitted
+        data = data[fitted].astype(float)
+
+        wien = Ph.wien(lam, data.copy())
+        a, b = weighted_linear_fit(1 / lam, wien, np.ones_like(wien))
+        T_wien = 1e9 / a
+        eps_wien = np.exp(- b * Ph.h * Ph.c / Ph.k)
+
+        eps_planck, T_planck, _ = planck_linear_fit(lam, data)
+
+        # two-color of each line, as physics.temp2color
+        d = pars['delta']
+        m = max(len(lam) - d, 0)
+        twocolor = 1e9 * (1/lam[:m] - 1/lam[d:d + m]) \
+                   / (wien[:, :m] - wien[:, d:d + m])
+        T_twocolor = np.nanmean(twocolor, axis=-1)
+        T_std_twocolor = np.nanstd(twocolor, axis=-1)
+
+    out = dict(T_planck = T_planck,
+               eps_planck = eps_planck,
+               T_wien = T_wien,
+               eps_wien = eps_wien,
+               T_twocolor = T_twocolor,
+               T_std_twocolor = T_std_twocolor)
+    for k, v in out.items():
+        out[k] = np.full(n_lines, np.nan)
+        out[k][fitted] = v
+    out['signal'] = signal
+    out['saturated'] = saturated
+    return out
+
+
+class TemperatureMap():
+    # results of map_group, arrays (n_frames, n_lines)
+    fields = ('T_planck', 'eps_planck', 'T_wien', 'eps_wien',
+              'T_twocolor', 'T_std_twocolor', 'signal', 'saturated')
+
+    def __init__(self, name, n_frames, n_lines, pars):
+        self.name = name
+        self.pars = dict(pars)
+        self.n_frames = n_frames
+        self.n_lines = n_lines
+        for k in self.fields:
+            dtype = bool if k == 'saturated' else float
+            setattr(self, k, np.full((n_frames, n_lines),
+                                     False if dtype is bool else np.nan,
+                                     dtype=dtype))
+
+    def set_frame(self, frame, results):
+        for k in self.fields:
+            getattr(self, k)[frame] = results[k]
+
+    def profile(self, frame):
+        # temperatures along the slit for one frame
+        return {k: getattr(self, k)[frame] for k in self.fields}
+
+
+def map_group(path, group_name, pars, dataset=None, frames=None,
+              min_signal=0.05, workers=None, block_bytes=2**26,
+              progress=None):
+    # Fits all lines of all frames of an h5 group.
+    # dataset: name of the per-line image in the group (default: found
+    # by find_line_image); frames: optional list of frame indices.
+    # The image is read by blocks of frames of about block_bytes, the
+    # frames of a block are fitted in a thread pool of workers threads.
+    # progress(done, total) is called after each block.
+    # The background is not fitted (pars['usebg'] is ignored).
+    with open_h5file(path) as file:
+        group = file[group_name]
+        if dataset is None:
+            dataset = find_line_image(group)
+            if dataset is None:
+                raise ValueError(f'No per-line CCD image in {group_name}')
+        image = group[dataset]
+
+        # frames are along the non singleton leading axis, if any
+        lead = image.shape[:-2]
+        n_lines, n_px = image.shape[-2:]
+        n_frames = int(np.prod(lead)) if lead else 1
+        axis = next((i for i, s in enumerate(lead) if s > 1), 0)
+        if n_frames not in (1, lead[axis] if lead else 1):
+            raise ValueError(f'Unexpected shape of {dataset}: {image.shape}')
+
+        lam = np.array(group['measurement/spectrum_lambdas']).squeeze()
+        if lam.ndim == 1:
+            lam = np.broadcast_to(lam, (n_frames, n_px))
+
+        if frames is None:
+            frames = range(n_frames)
+        # increasing order for h5py selections
+        frames = sorted(set(frames))
+
+        out = TemperatureMap(group_name, len(frames), n_lines, pars)
+
+        def fit_frame(args):
+            i, lines = args
+            ordind = np.argsort(lam[frames[i]])
+            return i, fit_lines(lam[frames[i]][ordind], lines[:, ordind],
+                                pars, min_signal)
+
+        block = max(1, block_bytes // (n_lines * n_px * image.dtype.itemsize))
+        if lead and image.chunks is not None:
+            # whole chunks per block
+            c = image.chunks[axis]
+            block = max(c, block // c * c)
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            for start in range(0, len(frames), block):
+                indices = list(range(start, min(start + block, len(frames))))
+                if lead:
+                    # one read per block, a slice for contiguous frames
+                    sel = [frames[i] for i in indices]
+                    index = [0] * len(lead)
+                    if sel[-1] - sel[0] == len(sel) - 1:
+                        index[axis] = slice(sel[0], sel[-1] + 1)
+                    else:
+                        index[axis] = sel
+                    slab = image[tuple(index)].reshape(-1, n_lines, n_px)
+                    lines = list(slab)
+                else:
+                    lines = [image[()]]
+
+                for i, results in executor.map(fit_frame,
+                                               zip(indices, lines)):
+                    out.set_frame(i, results)
+                if progress is not None:
+                    progress(indices[-1] + 1, len(frames))
+    return out
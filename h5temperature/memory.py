@@ -0,0 +1,343 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# Memory budget of the loaded spectra.
+# Spectra are touched when used; when the arrays of all spectra exceed the
+# limit, the least recently used ones are evicted (BlackBodySpec.evict):
+# their arrays are dropped and read again from their file on next access.
+# The limit can be set at startup with H5TEMPERATURE_MEMORY_MB.
+#
+# Telemetry: memory_report() accounts the arrays of the session by 
+# category, group and spectrum (walks all objects: on demand), 
+# MemoryTelemetry samples the process and the budget periodically 
+# (cheap: can be left on) for the growth over time.
+
+import os
+import time
+import weakref
+import collections
+
+import numpy as np
+
+
+def process_rss():
+    # resident memory of the process in bytes, None if unknown
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemoryBudget():
+    def __init__(self, limit=None):
+        # limit in bytes for the arrays of all spectra, None: no limit
+        self.limit = limit
+        # id(spec) -> [weakref, nbytes], least recently used first
+        self._resident = collections.OrderedDict()
+        # id(spec) -> weakref
+        self._evicted = dict()
+        self.total = 0
+        self.n_evictions = 0
+        self.n_restores = 0
+
+    @classmethod
+    def from_environ(cls):
+        mb = os.environ.get('H5TEMPERATURE_MEMORY_MB')
+        return cls(int(float(mb) * 2**20) if mb else None)
+
+    def set_limit(self, limit):
+        self.limit = limit
+        self.enforce()
+
+    def _forget(self, key):
+        # weakref callback: the spectrum was deleted
+        entry = self._resident.pop(key, None)
+        if entry is not None:
+            self.total -= entry[1]
+        self._evicted.pop(key, None)
+
+    def touch(self, spec, enforce=True):
+        # spec is about to be used: it is read again if evicted (may raise
+        # RuntimeError), becomes the most recently used and its size is 
+        # updated.
+        key = id(spec)
+        entry = self._resident.pop(key, None)
+        if entry is not None:
+            ref, old = entry
+        else:
+            ref = self._evicted.pop(key, None)
+            if ref is None:
+                ref = weakref.ref(spec, lambda r, key=key: self._forget(key))
+            old = 0
+        if spec._evicted:
+            try:
+                spec.restore()
+            except Exception:
+                self._evicted[key] = ref
+                raise
+            self.n_restores += 1
+
+        nbytes = spec.nbytes()
+        self.total += nbytes - old
+        self._resident[key] = [ref, nbytes]
+        if enforce:
+            self.enforce()
+
+    def track(self, specs):
+        # newly loaded spectra, the last ones are the most recently used
+        for spec in specs:
+            self.touch(spec, enforce=False)
+        self.enforce()
+
+    def enforce(self):
+        # evicts the least recently used spectra until the total is below
+        # the limit, never the most recently used one.
+        # Returns the number of evicted spectra.
+        if self.limit is None:
+            return 0
+        count = 0
+        skipped = []
+        while self.total > self.limit and len(self._resident) > 1:
+            key, (ref, nbytes) = self._resident.popitem(last=False)
+            spec = ref()
+            if spec is None:
+                self.total -= nbytes
+                continue
+            released = spec.evict()
+            if released == 0 and not spec._evicted:
+                # no source, cannot be evicted
+                skipped.append((key, [ref, nbytes]))
+                continue
+            self.total -= nbytes
+            self._evicted[key] = ref
+            self.n_evictions += 1
+            count += 1
+        # specs without source keep their place, as least recently used
+        for key, entry in reversed(skipped):
+            self._resident[key] = entry
+            self._resident.move_to_end(key, last=False)
+        return count
+
+    def clear(self):
+        self._resident.clear()
+        self._evicted.clear()
+        self.total = 0
+
+    def usage(self):
+        return dict(limit = self.limit,
+                    spectra_bytes = self.total,
+                    resident = len(self._resident),
+                    evicted = len(self._evicted),
+                    evictions = self.n_evictions,
+                    restores = self.n_restores,
+                    process_rss = process_rss())
+
+    def usage_text(self):
+        u = self.usage()
+        mb = 2**20
+        limit = 'no limit' if u['limit'] is None else \
+                f"limit {u['limit'] / mb:.0f} MB"
+        text = (f"spectra: {u['spectra_bytes'] / mb:.1f} MB ({limit}), "
+                f"{u['resident']} in memory, {u['evicted']} evicted")
+        if u['process_rss'] is not None:
+            text += f", process: {u['process_rss'] / mb:.0f} MB"
+        return text
+
+
+# arrays of BlackBodySpec by category, other arrays are in 'other'
+SPEC_CATEGORIES = dict(raw = ('lam', 'invlam', 'planck', 'saturated_ind'),
+                       wien = ('rawwien', 'wien'),
+                       fits = ('planck_fit', 'wien_fit'),
+                       residuals = ('planck_residuals', 'wien_residuals'),
+                       twocolor = ('twocolor',))
+
+_CATEGORY_OF = {name: c for c, names in SPEC_CATEGORIES.items() 
+                for name in names}
+
+
+def _owned_nbytes(a, seen):
+    # bytes of the memory of a, counted once per buffer: views count
+    # their whole base (they keep it alive), the first time only
+    base = a
+    while isinstance(base.base, np.ndarray):
+        base = base.base
+    if id(base) in seen:
+        return 0
+    seen.add(id(base))
+    return base.nbytes
+
+def arrays_nbytes(values, seen):
+    # bytes of the arrays in values (also in lists, tuples and dicts)
+    total = 0
+    for v in values:
+        if isinstance(v, np.ndarray):
+            total += _owned_nbytes(v, seen)
+        elif isinstance(v, (list, tuple)) and v and \
+                isinstance(v[0], np.ndarray):
+            total += arrays_nbytes(v, seen)
+        elif isinstance(v, dict):
+            total += arrays_nbytes(v.values(), seen)
+    return total
+
+def spec_nbytes(spec, seen=None):
+    # bytes of the arrays of a BlackBodySpec by category
+    if seen is None:
+        seen = set()
+    out = dict.fromkeys(list(SPEC_CATEGORIES) + ['other'], 0)
+    for name, v in spec.__dict__.items():
+        if isinstance(v, np.ndarray):
+            out[_CATEGORY_OF.get(name, 'other')] += _owned_nbytes(v, seen)
+    return out
+
+def figure_nbytes(fig, seen=None):
+    # bytes of the data of the artists of a matplotlib figure (lines, 
+    # collections, images): approximate, their rendering caches are not
+    # included
+    if seen is None:
+        seen = set()
+    total = 0
+    # not fig.findobj(): it would create the ticks of all axes
+    artists = [a for ax in fig.axes 
+               for a in (ax.lines + ax.collections + ax.images + 
+                         ax.patches)]
+    for artist in artists:
+        d = vars(artist)
+        total += arrays_nbytes(d.values(), seen)
+        # paths of collections
+        for path in d.get('_paths') or ():
+            total += _owned_nbytes(path.vertices, seen)
+    return total
+
+def memory_report(data, batch=None, figures=None, top=10):
+    # memory of the arrays of the session: data (NestedData) by category, 
+    # group and spectrum, the top largest spectra, the batch and figures 
+    # (dict name -> Figure). Returns a dict, see report_text.
+    seen = set()
+    categories = dict.fromkeys(list(SPEC_CATEGORIES) + ['other'], 0)
+    groups = dict()
+    spectra = []
+    n_evicted = 0
+    for group, value in data.items():
+        specs = value.flatten() if hasattr(value, 'flatten') \
+                else {group: value}
+        groups[group] = 0
+        for key, spec in specs.items():
+            nbytes = spec_nbytes(spec, seen)
+            size = sum(nbytes.values())
+            for c, v in nbytes.items():
+                categories[c] += v
+            groups[group] += size
+            spectra.append((size, key))
+            n_evicted += bool(spec._evicted)
+
+    spectra.sort(reverse=True)
+    batch_nbytes = 0 if batch is None else \
+                   arrays_nbytes(vars(batch).values(), seen)
+    figures_nbytes = {name: figure_nbytes(fig, seen)
+                      for name, fig in (figures or dict()).items()}
+
+    spectra_total = sum(categories.values())
+    return dict(time = time.time(),
+                total = spectra_total + batch_nbytes + 
+                        sum(figures_nbytes.values()),
+                spectra = spectra_total,
+                n_spectra = len(spectra),
+                n_evicted = n_evicted,
+                categories = categories,
+                groups = dict(sorted(groups.items(), 
+                                     key=lambda kv: -kv[1])),
+                largest = [(key, size) for size, key in spectra[:top]],
+                batch = batch_nbytes,
+                figures = figures_nbytes,
+                process_rss = process_rss())
+
+def report_text(report, telemetry=None):
+    # the report as text, with the growth of telemetry if given
+    mb = 2**20
+    def line(name, nbytes):
+        return f'  {name:<30} {nbytes / mb:10.2f} MB'
+
+    lines = [f"arrays: {report['total'] / mb:.2f} MB, "
+             f"{report['n_spectra']} spectra "
+             f"({report['n_evicted']} evicted)"]
+    if report['process_rss'] is not None:
+        lines[0] += f", process: {report['process_rss'] / mb:.0f} MB"
+    lines.append('by category:')
+    lines += [line(c, v) for c, v in report['categories'].items()]
+    lines.append(line('batch', report['batch']))
+    lines += [line(f'figure {name}', v) 
+              for name, v in report['figures'].items()]
+    lines.append('by group:')
+    lines += [line(g, v) for g, v in report['groups'].items()]
+    lines.append('largest spectra:')
+    lines += [line(k, v) for k, v in report['largest']]
+    if telemetry is not None:
+        lines.append(telemetry.growth_text())
+    return '\n'.join(lines)
+
+
+class MemoryTelemetry():
+    # periodic samples of the process memory and of the budget, the last
+    # maxlen ones are kept (12 h at one sample per 10 s)
+    def __init__(self, budget=None, maxlen=4320):
+        self.budget = budget
+        self.samples = collections.deque(maxlen=maxlen)
+
+    def sample(self):
+        s = dict(time = time.time(), 
+                 process_rss = process_rss())
+        if self.budget is not None:
+            s.update(spectra_bytes = self.budget.total,
+                     resident = len(self.budget._resident),
+                     evicted = len(self.budget._evicted))
+        self.samples.append(s)
+        return s
+
+    def growth(self, key='process_rss', since=None):
+        # least squares slope of key in bytes per second over the samples
+        # (after since, seconds since the epoch), None if less than 2
+        samples = [s for s in self.samples 
+                   if s.get(key) is not None and 
+                   (since is None or s['time'] >= since)]
+        if len(samples) < 2:
+            return None
+        t = np.array([s['time'] for s in samples])
+        v = np.array([s[key] for s in samples], dtype=float)
+        if np.ptp(t) < 60:
+            # too short to extrapolate
+            return None
+        return np.polyfit(t - t[0], v, 1)[0]
+
+    def growth_text(self):
+        mb = 2**20
+        if not self.samples:
+            return 'growth: no sample'
+        span = self.samples[-1]['time'] - self.samples[0]['time']
+        text = f'growth over {span / 60:.0f} min:'
+        for key, name in (('process_rss', 'process'), 
+                          ('spectra_bytes', 'spectra')):
+            g = self.growth(key)
+            if g is None:
+                return text + ' not enough samples'
+            text += f' {name} {g * 3600 / mb:+.1f} MB/h'
+        return text
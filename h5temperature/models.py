@@ -17,16 +17,65 @@
 
 
 import numpy as np
-import h5py
+import time
 import datetime
-from scipy.optimize import curve_fit
 from copy import deepcopy
 
 import h5temperature.physics as Ph
+from h5temperature.solvers import (fit_window,
+                                   rebin_mean,
+                                   weighted_linear_std,
+                                   planck_covariance,
+                                   planck_gauss_newton,
+                                   planck_linear_fit, 
+                                   wien_window_map,
+                                   twocolor_window_map)
+from h5temperature.quality import QUALITY_METRICS, fit_quality, suspicious
+from h5temperature.uncertainty import UNCERTAINTIES, bootstrap_task
+from h5temperature.timing import timed_function
+
+
+# default fit parameters of the application
+DEFAULT_PARS = dict(lowerb = 550,
+                    upperb = 900,
+                    delta = 100,
+                    usebg = False,
+                    fastplanck = False,
+                    # pixels per bin of the Wien and Planck fits, or the
+                    # number of points in the fit window if rebin_points
+                    rebin = 1,
+                    rebin_points = None,
+                    # resamples of the bootstrap of each fit (0: none),
+                    # and the seed of their random generators
+                    bootstrap = 0,
+                    bootstrap_seed = 0)
+
+
+# Gauss-Newton steps after the curve_fit with background (0: none).
+# dogbox stops on the relative decrease of the cost, short of the minimum
+# in the flat valley of eps, T and bg: by up to several std deviations of
+# T when bg is close to 0 (benchmarks, check_polish).
+POLISH_STEPS = 3
+
+# seeded Planck fits (warmstart_fits): at most SEED_STEPS Gauss-Newton 
+# steps from the seed, converged when the relative change of T is below
+# SEED_XTOL, else the curve_fit starts from where they stopped
+SEED_STEPS = 6
+SEED_XTOL = 1e-8
 
 
 class BlackBodySpec():
-    def __init__(self, name, lam, planck, max_data=None, time=None):
+    # large arrays, dropped by evict() and recomputed by restore()
+    _evictable = ('lam', 'invlam', 'planck', 'rawwien', 'wien', 
+                  'ind_interval', 
+                  'twocolor', 'wien_fit', 'wien_residuals', 
+                  'planck_fit', 'planck_residuals')
+
+    def __init__(self, name, lam, planck, max_data=None, time=None, 
+                 source=None):
+        # source: where to read lam and planck again, 
+        # ('h5', path, group, frame or None) or ('ascii', path), 
+        # see formats.read_source
 
         # reordering...
         ordind = np.argsort(lam)
@@ -37,12 +86,15 @@ class BlackBodySpec():
         
         self.name = name
         self.time = time
+        self.source = source
+        self._evicted = False
         
         if self.time:
             self.timestamp = self.time.timestamp()
         else:
             self.timestamp = None
 
+        self.invlam = 1 / self.lam
         self.rawwien = Ph.wien(self.lam, self.planck)
         
         # wien initialized as rawwien:
@@ -53,7 +105,8 @@ class BlackBodySpec():
         self.pars = dict(lowerb = None,
                          upperb = None,
                          delta  = None,
-                         usebg  = None)
+                         usebg  = None,
+                         fastplanck = None)
 
         # fitted flag 
         self._fitted = False
@@ -81,24 +134,159 @@ class BlackBodySpec():
         self.wien_residuals = None
         self.T_wien = None
         self.eps_wien = None
+        # from the covariance of the fit
+        self.T_std_wien = None
 
         self.planck_fit = None
         self.planck_residuals = None
         self.T_planck = None
         self.eps_planck = None
+        self.T_std_planck = None
+        # number of Planck model evaluations used by the last fit
+        self.planck_nfev = None
+        # pixels per bin of the last Wien and Planck fits
+        self.rebin = None
+        # QUALITY_METRICS of the last fit
+        self.quality = None
+        # residual bootstrap of the last fit (uncertainty.py), number of
+        # resamples and std deviations
+        self.bootstrap = None
+        self.T_std_planck_boot = None
+        self.T_std_wien_boot = None
+
 
+    def __getattr__(self, name):
+        # only called for missing attributes: 
+        # the arrays of an evicted spectrum are read again on access
+        if name in BlackBodySpec._evictable and \
+                self.__dict__.get('_evicted'):
+            self.restore()
+            return self.__dict__[name]
+        raise AttributeError(f"'BlackBodySpec' object has no attribute "
+                             f"'{name}'")
+
+    def nbytes(self):
+        # memory used by the arrays
+        return sum(v.nbytes for v in self.__dict__.values() 
+                   if isinstance(v, np.ndarray))
+
+    def evict(self):
+        # drops the large arrays, fit results and pars are kept.
+        # Only possible with a source to read them again.
+        # Returns the number of bytes released.
+        if self.source is None or self._evicted:
+            return 0
+        nbytes = self.nbytes()
+        for name in BlackBodySpec._evictable:
+            self.__dict__.pop(name, None)
+        self._evicted = True
+        return nbytes - self.nbytes()
+
+    def restore(self):
+        # reads lam and planck from the source and recomputes the fit 
+        # curves from the stored fit parameters, without fitting again
+        from h5temperature.formats import read_source
+        try:
+            d = read_source(self.source)
+        except Exception as e:
+            raise RuntimeError(f'{self.name}: cannot read the spectrum '
+                               f'again from {self.source[1]}: {e}')
+
+        ordind = np.argsort(d['lam'])
+        self.lam = d['lam'][ordind]
+        self.planck = d['planck'][ordind]
+        self.invlam = 1 / self.lam
+        self.rawwien = Ph.wien(self.lam, self.planck)
+        self.wien = self.rawwien
+        self.ind_interval = None
+        for name in ('twocolor', 'wien_fit', 'wien_residuals', 
+                     'planck_fit', 'planck_residuals'):
+            setattr(self, name, None)
+        self._evicted = False
+
+        if self.pars['lowerb'] is None:
+            return
+        self.set_pars(self.pars)
+        lam = self.lam_win
+
+        if self.bg:
+            self.wien = Ph.wien(self.lam, self.planck, self.bg)
+        if self.T_planck is not None:
+            self.planck_fit = Ph.planck(lam, self.eps_planck, 
+                                        self.T_planck, self.bg)
+            self.planck_residuals = self.planck_win - self.planck_fit
+        if self.T_wien is not None:
+            # inverse of eval_wien_fit
+            a = 1e9 / self.T_wien
+            b = - np.log(self.eps_wien) * Ph.k / (Ph.h * Ph.c)
+            self.wien_fit = a * self.invlam_win + b
+            self.wien_residuals = self.wien_win - self.wien_fit
+        if self.T_twocolor is not None:
+            self.eval_twocolor()
 
     def set_pars(self, pars):
         # deepcopy necessary otherwise always point to the mainwindow pars!!
         self.pars = deepcopy(pars)
-        self.ind_interval = np.logical_and(self.lam >= self.pars['lowerb'], 
-                                           self.lam <= self.pars['upperb'])
+        # lam is sorted: the fit window is contiguous, a slice
+        self.ind_interval = fit_window(self.lam, self.pars['lowerb'], 
+                                       self.pars['upperb'])
+
+    # the arrays in the fit window, views (no copy) through the slice
+    @property
+    def lam_win(self):
+        return self.lam[self.ind_interval]
+
+    @property
+    def invlam_win(self):
+        return self.invlam[self.ind_interval]
+
+    @property
+    def planck_win(self):
+        return self.planck[self.ind_interval]
+
+    @property
+    def wien_win(self):
+        return self.wien[self.ind_interval]
+
+    def rebin_factor(self):
+        # pixels per bin of the Wien and Planck fits: pars rebin, or from
+        # rebin_points, a number of points in the fit window
+        points = self.pars.get('rebin_points')
+        if points:
+            return max(1, len(self.lam_win) // int(points))
+        return max(1, int(self.pars.get('rebin') or 1))
+
+    def fit_data(self):
+        # lam and planck of the Planck fit, with the sigma of curve_fit:
+        # the window, or means of bins of rebin_factor() pixels, weighted
+        # by their number of pixels to keep the least squares of the 
+        # full resolution
+        factor = self.rebin_factor()
+        if factor == 1:
+            return self.lam_win, self.planck_win, None
+        lam, data, n = rebin_mean(factor, self.lam_win, self.planck_win)
+        return lam, data, 1 / np.sqrt(n)
 
+    def wien_fit_data(self):
+        # 1/lam, wien and weights of the Wien fit: the valid pixels of
+        # the window, or the means of bins of rebin_factor() valid pixels
+        # weighted by their number of pixels: same line as the full 
+        # resolution (linear model)
+        factor = self.rebin_factor()
+        if factor == 1:
+            # in cases of I-bg < 0, the wien fct returns np.nan:
+            # we keep only valid data for the fit.
+            keepind = np.isfinite(self.wien_win)
+            x1 = self.invlam_win[keepind]
+            return x1, self.wien_win[keepind], np.ones(len(x1))
+        return rebin_mean(factor, self.invlam_win, self.wien_win)
+
+    @timed_function('two-color')
     def eval_twocolor(self):
 
         # calculate 2color 
-        self.twocolor = Ph.temp2color(self.lam[self.ind_interval], 
-                                      self.wien[self.ind_interval], 
+        self.twocolor = Ph.temp2color(self.lam_win, 
+                                      self.wien_win, 
                                       self.pars['delta'])
 
         # namean/std for cases where I-bg < 0, it returns nan
@@ -106,42 +294,67 @@ class BlackBodySpec():
         self.T_std_twocolor = np.nanstd(self.twocolor)
         
 
-    def eval_wien_fit(self):
+    def twocolor_stddevs(self, deltas):
+        # two-color std deviation in the fit interval for each delta (px)
+        return np.array([np.nanstd(Ph.temp2color(self.lam_win, 
+                                                 self.wien_win, 
+                                                 di)) for di in deltas])
 
-        # in cases of I-bg < 0, the wien fct returns np.nan:
-        # we keep only valid data for the fit.
-        keepind = np.isfinite(self.wien[self.ind_interval])
-        
-        x1 = (1/self.lam[self.ind_interval])[keepind]
-        y1 = (self.wien[self.ind_interval])[keepind]
+    def window_sensitivity(self, lowers, uppers):
+        # T wien, two-color mean and std for all windows (lower, upper)
+        # with the current wien (background) and delta
+        T_wien = wien_window_map(self.lam, self.wien, lowers, uppers)
+        T_twocolor, T_std_twocolor = twocolor_window_map(self.lam, 
+                                                         self.wien, 
+                                                         self.pars['delta'],
+                                                         lowers, uppers)
+        return T_wien, T_twocolor, T_std_twocolor
 
-        a, b = np.polyfit(x1, y1, 1) # order = 1, linear
+    @timed_function('Wien fit')
+    def eval_wien_fit(self):
+
+        x1, y1, w1 = self.wien_fit_data()
+        a, b = np.polyfit(x1, y1, 1, w = np.sqrt(w1)) # order = 1, linear
         
-        self.wien_fit = a / self.lam[self.ind_interval] + b
-        self.wien_residuals = self.wien[self.ind_interval] - self.wien_fit
+        self.wien_fit = a * self.invlam_win + b
+        self.wien_residuals = self.wien_win - self.wien_fit
 
         self.T_wien = 1e9 * 1/a # in K ; as wien fonction use lam in m
+        # T = 1e9 / a: dT = T * da / a
+        a_std = weighted_linear_std(x1, y1, w1, np.asarray(a), np.asarray(b))
+        self.T_std_wien = float(abs(self.T_wien * a_std / a))
         # no factor required for b:
         self.eps_wien = np.exp(- b * Ph.h * Ph.c / Ph.k)
        
 
-    def eval_planck_fit(self):
+    @timed_function('Planck fit')
+    def eval_planck_fit(self, seed=None):
 
         # flag _fitted here in planck:
         if not self._fitted:
             self._fitted = True
 
-        # initial temperature value for the fit...
-        if self.T_wien:
+        # closed-form solver, without background only:
+        if self.pars.get('fastplanck') and not self.pars['usebg']:
+            self.eval_planck_linear()
+            return
+
+        # initial values for the fit...
+        # seed = (eps, T, bg) e.g. from a neighbouring frame
+        if seed is not None:
+            eps_guess, Tguess, bg_guess = self.seed_p0(seed)
+        elif self.T_wien:
             Tguess = self.T_wien
             eps_guess = self.eps_wien
+            bg_guess = 0
         else:
             Tguess = 2000
             eps_guess = 1e-6
+            bg_guess = 0
 
         if self.pars['usebg']:
                        # eps     ,   temp ,        bg
-            p0      =  (eps_guess,   Tguess,        0)
+            p0      =  (eps_guess,   Tguess, bg_guess)
             pbounds = ((        0,        0,        0),
                        (  +np.inf,      2e4,  +np.inf))
         else:
@@ -150,17 +363,31 @@ class BlackBodySpec():
             pbounds = ((        0,        0),
                        (  +np.inf,      2e4))
 
-        p_planck, cov_planck = curve_fit(Ph.planck, 
-                                         self.lam[self.ind_interval], 
-                                         self.planck[self.ind_interval],                         
-                                         p0 = p0,
-                                         bounds = pbounds,
-                                         method = 'dogbox')    
+        # count model evaluations to measure the effect of the seed
+        nfev = [0]
+
+        # the data are rebinned for the fit only, the curves below are on
+        # all pixels
+        lam, data, sigma = self.fit_data()
+        weights = None if sigma is None else 1 / sigma**2
 
-        self.planck_fit = Ph.planck(self.lam[self.ind_interval], *p_planck)
-        self.planck_residuals = self.planck[self.ind_interval]-self.planck_fit
+        p_planck = None
+        if seed is not None:
+            p_planck = self.seeded_planck_fit(lam, data, weights, p0, nfev)
+        if p_planck is None:
+            p_planck = self.curve_planck_fit(lam, data, sigma, p0, pbounds,
+                                             nfev)
+
+        self.planck_fit = Ph.planck(self.lam_win, *p_planck)
+        self.planck_residuals = self.planck_win-self.planck_fit
         self.T_planck = p_planck[1]
         self.eps_planck = p_planck[0]
+        # the covariance of curve_fit drops the direction of bg (its SVD
+        # cutoff, eps and bg have very different scales): computed with
+        # scaled parameters instead
+        cov = planck_covariance(lam, data, *p_planck, weights = weights)
+        self.T_std_planck = float(np.sqrt(cov[1, 1]))
+        self.planck_nfev = nfev[0]
 
         if self.pars['usebg']:
             self.bg = p_planck[2]
@@ -169,9 +396,266 @@ class BlackBodySpec():
             self.bg = 0
             self.wien = self.rawwien
 
+    def curve_planck_fit(self, lam, data, sigma, p0, pbounds, nfev):
+        # curve_fit of the Planck formula from p0, polished with 
+        # background. nfev[0] counts the Planck evaluations.
+        # scipy.optimize is slow to import, only loaded for the first fit
+        from scipy.optimize import curve_fit
+
+        def planck_counted(lamb, *p):
+            nfev[0] += 1
+            return Ph.planck(lamb, *p)
+
+        # analytic jacobian instead of finite differences
+        def planck_jac(lamb, *p):
+            return Ph.planck_jac(lamb, *p)
+
+        p_planck, _ = curve_fit(planck_counted, 
+                                lam, 
+                                data,                         
+                                p0 = p0,
+                                sigma = sigma,
+                                bounds = pbounds,
+                                method = 'dogbox',
+                                jac = planck_jac)    
+
+        weights = None if sigma is None else 1 / sigma**2
+        if self.pars['usebg'] and POLISH_STEPS:
+            # dogbox stops on the relative decrease of the cost: in the 
+            # flat valley of eps, T and bg it stops short of the minimum,
+            # at a T depending on the start. Gauss-Newton steps reach it, 
+            # kept if the SSE is lower.
+            def sse(p):
+                r = (data - Ph.planck(lam, *p))**2
+                return np.nansum(r if weights is None else weights * r)
+            polished = [float(v) for v in 
+                        planck_gauss_newton(lam, data, *p_planck, 
+                                            weights = weights, 
+                                            steps = POLISH_STEPS)]
+            nfev[0] += POLISH_STEPS + 2
+            if sse(polished) <= sse(p_planck):
+                p_planck = np.array(polished)
+        return p_planck
+
+    def seeded_planck_fit(self, lam, data, weights, p0, nfev):
+        # Gauss-Newton steps from a seed close to the minimum, one Planck
+        # evaluation (with its jacobian) each: no curve_fit, no polishing.
+        # Returns the parameters, None if not converged within SEED_STEPS
+        # (the curve_fit then starts from the seed).
+        eps, temp = p0[0], p0[1]
+        bg = p0[2] if self.pars['usebg'] else None
+        for _ in range(SEED_STEPS):
+            eps, new_temp, bg = planck_gauss_newton(lam, data, eps, temp, 
+                                                    bg, weights, steps = 1)
+            nfev[0] += 1
+            if not np.isfinite(new_temp):
+                return None
+            converged = abs(new_temp - temp) <= SEED_XTOL * temp
+            temp = new_temp
+            if converged:
+                p = (eps, temp) if bg is None else (eps, temp, bg)
+                return np.array([float(v) for v in p])
+        return None
+
+    def eval_planck_linear(self):
+        # linearized Planck fit in Wien coordinates with Newton polishing
+        # replaces curve_fit when there is no background.
+        lam, data, sigma = self.fit_data()
+        # weighted as the curve_fit when rebinned
+        weights = None if sigma is None else 1 / sigma**2
+        eps, temp, nfev = planck_linear_fit(lam, data, weights = weights)
+        # covariance of (log(eps), T), as the curve_fit
+        cov = planck_covariance(lam, data, eps, temp, weights = weights)
+        self.T_std_planck = float(np.sqrt(cov[1, 1]))
+
+        self.planck_fit = Ph.planck(self.lam_win, eps, temp)
+        self.planck_residuals = self.planck_win-self.planck_fit
+        self.T_planck = temp
+        self.eps_planck = eps
+        self.planck_nfev = nfev + 1
+
+        self.bg = 0
+        self.wien = self.rawwien
+
+    def compare_planck_solvers(self):
+        # discrepancy of the linearized Planck solver versus the full
+        # curve_fit, for the current pars without background
+        fits = dict()
+        for fast in (True, False):
+            spec = deepcopy(self)
+            # no bootstrap: called from the GUI thread
+            pars = dict(spec.pars, usebg = False, fastplanck = fast,
+                        bootstrap = 0)
+            spec.eval_fits(pars)
+            fits[fast] = spec
+
+        fast, full = fits[True], fits[False]
+        return dict(T_fast = fast.T_planck,
+                    T_full = full.T_planck,
+                    delta_T = fast.T_planck - full.T_planck,
+                    multiplier_fast = fast.eps_planck,
+                    multiplier_full = full.eps_planck,
+                    rel_delta_multiplier = (fast.eps_planck / 
+                                            full.eps_planck - 1),
+                    nfev_fast = fast.planck_nfev,
+                    nfev_full = full.planck_nfev)
+
+    def compare_rebin(self, factors=(2, 5, 10, 20)):
+        # temperatures with the Wien and Planck fits rebinned by factors,
+        # versus the full resolution, with the current pars. The times
+        # are flat below a few thousand pixels: the fixed cost of the 
+        # curve_fit dominates.
+        # Returns one dict per factor, 1 (full resolution) first.
+        out = []
+        for factor in (1,) + tuple(factors):
+            spec = deepcopy(self)
+            pars = dict(spec.pars, rebin = factor, rebin_points = None,
+                        bootstrap = 0)
+            t0 = time.perf_counter()
+            spec.eval_fits(pars)
+            elapsed = time.perf_counter() - t0
+            if factor == 1:
+                full = spec
+            out.append(dict(rebin = factor,
+                            points = len(spec.fit_data()[0]),
+                            T_planck = spec.T_planck,
+                            delta_T_planck = spec.T_planck - full.T_planck,
+                            T_wien = spec.T_wien,
+                            delta_T_wien = spec.T_wien - full.T_wien,
+                            time = elapsed))
+        return out
+
+    def bootstrap_inputs(self, n_boot, seed=0):
+        # arrays of the last Wien and Planck fits for 
+        # uncertainty.bootstrap_task, without the spectrum itself
+        lam, data, sigma = self.fit_data()
+        weights = np.ones(len(lam)) if sigma is None else 1 / sigma**2
+        if self.pars['usebg']:
+            p = (self.eps_planck, self.T_planck, self.bg)
+        else:
+            p = (self.eps_planck, self.T_planck)
+        return dict(name = self.name,
+                    seed = seed,
+                    n_boot = int(n_boot),
+                    planck = (lam, data, weights, p),
+                    wien = self.wien_fit_data())
+
+    def eval_bootstrap(self, n_boot, seed=0):
+        # residual bootstrap of the last fit, in this thread
+        self.set_bootstrap(bootstrap_task(self.bootstrap_inputs(n_boot, 
+                                                                seed)))
+
+    def set_bootstrap(self, result):
+        # result of uncertainty.bootstrap_task
+        self.bootstrap = result['bootstrap']
+        self.T_std_planck_boot = result['T_std_planck_boot']
+        self.T_std_wien_boot = result['T_std_wien_boot']
+
+    def seed_p0(self, seed):
+        # seed is (eps, T) or (eps, T, bg). Only T is taken from the seed:
+        # for a given T the Planck curve is linear in eps and bg, they are
+        # solved by least squares on the fit interval (eps, T and bg are 
+        # strongly correlated, extrapolated separately they would start
+        # off the valley of the minimum)
+        Tguess = min(max(seed[1], 1), 2e4)
+        lam, data = self.lam_win, self.planck_win
+        keep = np.isfinite(data)
+        shape = Ph.planck(lam[keep], 1, Tguess)
+        eps_guess = np.sum(shape * data[keep]) / np.sum(shape**2)
+        # a bg seed on its bound (0) can stall dogbox on the seeded T,
+        # it is then started slightly above:
+        bg_guess = 1e-2 * np.max(np.abs(self.planck_win))
+        if self.pars['usebg']:
+            a = np.vstack([shape, np.ones(len(shape))]).T
+            (eps_bg, bg_bg), *_ = np.linalg.lstsq(a, data[keep], rcond=None)
+            if bg_bg > 0 and eps_bg > 0:
+                eps_guess, bg_guess = eps_bg, bg_bg
+        return eps_guess, Tguess, bg_guess
+
+    def seed_misfit(self, seed):
+        # rms deviation of the seeded Planck curve to the data 
+        # in the fit interval
+        eps_guess, Tguess, bg_guess = self.seed_p0(seed)
+        if not self.pars['usebg']:
+            bg_guess = 0
+        lam = self.lam_win
+        data = self.planck_win
+        model = Ph.planck(lam, eps_guess, Tguess, bg_guess)
+        return np.sqrt(np.mean((data - model)**2))
+
+    def get_seed(self):
+        # converged Planck parameters, used to seed a neighbouring frame
+        return (self.eps_planck, self.T_planck, self.bg)
+
+    def eval_fits(self, pars, seed=None):
+        # eval all quantities for a given spectrum
+        self.set_pars(pars)
+
+        if seed is None:
+            # start with wien to get a reasonable initial value for planck:
+            self.eval_wien_fit()
+            self.eval_planck_fit()
+
+            # Refit wien again, accounting for bg obtained in Planck:
+            if self.pars['usebg']:
+                self.eval_wien_fit()
+        else:
+            # the seed replaces the Wien pre-fit, 
+            # Wien is fitted once after Planck
+            self.eval_planck_fit(seed)
+            self.eval_wien_fit()
+
+        # eval two color at the end in all cases
+        self.eval_twocolor()
+        self.eval_quality()
+        self.rebin = self.rebin_factor()
+
+        # the bootstrap of a previous fit does not hold anymore
+        self.set_bootstrap(dict(bootstrap = None,
+                                T_std_planck_boot = None,
+                                T_std_wien_boot = None))
+        if self.pars.get('bootstrap'):
+            self.eval_bootstrap(self.pars['bootstrap'], 
+                                self.pars.get('bootstrap_seed') or 0)
+
+    def eval_quality(self):
+        # fit quality metrics in the fit window, see quality.py
+        saturated = np.zeros(len(self.lam), dtype=bool)
+        saturated[self.saturated_ind.astype(int)] = True
+        q = fit_quality(self.planck_win,
+                        self.planck_residuals,
+                        self.wien_win,
+                        self.T_planck, self.T_wien,
+                        saturated[self.ind_interval],
+                        n_params = 3 if self.pars['usebg'] else 2)
+        self.quality = {k: float(v) for k, v in q.items()}
+
+    def get_curves(self):
+        # all curves on the full lam, NaN where not defined: outside of
+        # the fit interval, before fitting, and for the last delta px of
+        # the two-color.
+        out = dict(lam = self.lam,
+                   planck = self.planck,
+                   wien = self.wien,
+                   rawwien = self.rawwien)
+
+        for name in ('twocolor', 
+                     'wien_fit', 'wien_residuals',
+                     'planck_fit', 'planck_residuals'):
+            curve = np.full(len(self.lam), np.nan)
+            values = getattr(self, name)
+            if values is not None:
+                start = self.ind_interval.start
+                curve[start:start + len(values)] = values
+            out[name] = curve
+        return out
+
     def get_fit_results(self):
-        dt1 = datetime.datetime.fromtimestamp(self.timestamp)
-        dt1_str = dt1.strftime('%Y-%m-%dT%H:%M:%S.%f%z')
+        if self.timestamp is not None:
+            dt1 = datetime.datetime.fromtimestamp(self.timestamp)
+            dt1_str = dt1.strftime('%Y-%m-%dT%H:%M:%S.%f%z')
+        else:
+            dt1_str = ''
         out = dict(name = self.name,
                    time = dt1_str,
                    fitted = self._fitted,
@@ -179,6 +663,11 @@ class BlackBodySpec():
                    T_wien = self.T_wien,
                    T_twocolor = self.T_twocolor,
                    T_std_twocolor = self.T_std_twocolor,
+                   T_std_planck = self.T_std_planck,
+                   T_std_wien = self.T_std_wien,
+                   T_std_planck_boot = self.T_std_planck_boot,
+                   T_std_wien_boot = self.T_std_wien_boot,
+                   bootstrap = self.bootstrap,
                    multiplier_planck = self.eps_planck,
                    multiplier_wien = self.eps_wien,
                    background = self.bg,
@@ -186,7 +675,13 @@ class BlackBodySpec():
                    upper_bound = self.pars['upperb'],
                    delta = self.pars['delta'],
                    usebg = self.pars['usebg'],
-                   saturated = self._saturated)
+                   fastplanck = self.pars.get('fastplanck'),
+                   saturated = self._saturated,
+                   planck_nfev = self.planck_nfev,
+                   rebin = self.rebin)
+        for k in QUALITY_METRICS:
+            out[f'quality_{k}'] = None if self.quality is None \
+                                  else self.quality[k]
         return out
 
 
@@ -268,6 +763,173 @@ class NestedData():
             print(f"Error(s) occurred while sorting: {e}")
 #            return False
 
+    def insert_chrono(self, key, value):
+        # insert value at its chronological position, assuming the data
+        # is already sorted: bisection on the timestamps instead of a sort,
+        # with a shortcut for the common case of a value appended at the end.
+        # An existing key is replaced (and moved if its time changed).
+        # Returns the position of key.
+        if not isinstance(value, (BlackBodySpec, NestedData)):
+            raise ValueError("Value must be BlackBodySpec or NestedData")
+        if key in self._data:
+            del self._data[key]
+
+        def timestamp(k, v):
+            if isinstance(v, NestedData):
+                v = v[f'{k}[0]']
+            return v.timestamp if v.timestamp is not None else 0
+
+        t = timestamp(key, value)
+        keys = list(self._data.keys())
+        if not keys or timestamp(keys[-1], self._data[keys[-1]]) <= t:
+            self._data[key] = value
+            return len(keys)
+
+        # bisection on the (sorted) timestamps
+        lo, hi = 0, len(keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if timestamp(keys[mid], self._data[keys[mid]]) <= t:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        items = list(self._data.items())
+        items.insert(lo, (key, value))
+        self._data = dict(items)
+        return lo
+
+
+def warmstart_fits(measurements, pars, seed_tol=0.5):
+    # Fit measurements (e.g. the frames of a ramp) in chronological order, 
+    # seeding each Planck fit from the converged neighbouring frames: 
+    # the seed is linearly extrapolated from the two previous frames.
+    # The seed is used only if the rms misfit of its Planck curve exceeds
+    # the one of the fit of the previous frame by less than a fraction 
+    # seed_tol, both relative to the maximum of the data (misfits scale 
+    # with the intensity along a ramp). A seeded frame skips the Wien 
+    # pre-fit and the curve_fit (BlackBodySpec.seeded_planck_fit), the 
+    # others are fitted as in eval_fits.
+    # A seeded fit whose reduced chi-square is significantly above the 
+    # one of the previous frame (3 sigma of its noise) may have stopped 
+    # in another minimum: it is fitted again from the cold start and the
+    # fit with the lower SSE is kept.
+    # Measurements already fitted with pars are skipped but still provide 
+    # a seed to the next one.
+    # Returns a dict with the number of Planck evaluations per measurement.
+    def kfun(meas):
+        return meas.timestamp if meas.timestamp is not None else 0
+
+    def sse(meas):
+        return np.nansum(meas.planck_residuals**2)
+
+    def misfit(meas, rms):
+        return rms / np.nanmax(np.abs(meas.planck_win))
+
+    ordered = sorted(measurements, key=kfun)
+
+    stats = dict(nfev = dict(),
+                 seeded = 0,
+                 fallback = 0,
+                 skipped = 0,
+                 errors = dict())
+    # converged parameters of the previous frames:
+    previous = []
+    chi2_previous = None
+    misfit_previous = None
+    for meas in ordered:
+        if meas._fitted and meas.pars == pars:
+            stats['skipped'] += 1
+            previous = (previous + [np.array(meas.get_seed())])[-2:]
+            chi2_previous = meas.quality['chi2_red']
+            misfit_previous = misfit(meas, np.sqrt(np.nanmean(
+                                                meas.planck_residuals**2)))
+            continue
+
+        meas.set_pars(pars)
+        seed = None
+        if len(previous) == 2:
+            seed = 2 * previous[1] - previous[0]
+        elif len(previous) == 1:
+            seed = previous[0]
+
+        if seed is not None:
+            if not np.isfinite(seed).all() or \
+                    not misfit(meas, meas.seed_misfit(seed)) <= \
+                        (1 + seed_tol) * misfit_previous:
+                seed = None
+        try:
+            meas.eval_fits(pars, seed)
+            nfev = meas.planck_nfev
+            if seed is not None:
+                stats['seeded'] += 1
+                chi2 = meas.quality['chi2_red']
+                # std deviation of the reduced chi-square of noise
+                chi2_std = np.sqrt(2 / max(len(meas.planck_residuals), 1))
+                if chi2_previous is not None and \
+                        not chi2 <= chi2_previous + 3 * chi2_std:
+                    # possibly another minimum: fitted again cold
+                    stats['fallback'] += 1
+                    seeded, sse_seeded = dict(meas.__dict__), sse(meas)
+                    meas.eval_fits(pars)
+                    nfev += meas.planck_nfev
+                    if sse(meas) > sse_seeded:
+                        meas.__dict__.update(seeded)
+        except Exception as e:
+            stats['errors'][meas.name] = str(e)
+            previous = []
+        else:
+            stats['nfev'][meas.name] = nfev
+            previous = (previous + [np.array(meas.get_seed())])[-2:]
+            chi2_previous = meas.quality['chi2_red']
+            misfit_previous = misfit(meas, np.sqrt(np.nanmean(
+                                                meas.planck_residuals**2)))
+
+    stats['total_nfev'] = sum(stats['nfev'].values())
+    return stats
+
+
+def compare_warmstart(measurements, pars, tol=0.1):
+    # warm-started fits of copies of measurements versus independent
+    # (cold) fits. ok if all T_planck agree within tol times their 
+    # std deviation and no warm fit has a larger SSE.
+    warm = deepcopy(measurements)
+    cold = deepcopy(measurements)
+    for meas in warm + cold:
+        meas._fitted = False
+    t0 = time.perf_counter()
+    stats = warmstart_fits(warm, pars)
+    t1 = time.perf_counter()
+    for meas in cold:
+        meas.eval_fits(pars)
+    t2 = time.perf_counter()
+
+    delta_T = np.array([w.T_planck - c.T_planck for w, c in zip(warm, cold)])
+    sigma = np.array([c.T_std_planck for c in cold])
+    sse_warm = np.array([np.nansum(w.planck_residuals**2) for w in warm])
+    sse_cold = np.array([np.nansum(c.planck_residuals**2) for c in cold])
+    return dict(max_delta_T = float(np.max(np.abs(delta_T))),
+                max_delta_T_sigma = float(np.max(np.abs(delta_T) / sigma)),
+                n_worse_sse = int(np.sum(sse_warm > sse_cold * (1 + 1e-9))),
+                seeded = stats['seeded'],
+                fallback = stats['fallback'],
+                nfev_warm = stats['total_nfev'],
+                nfev_cold = sum(c.planck_nfev for c in cold),
+                time_warm = t1 - t0,
+                time_cold = t2 - t1,
+                ok = bool(np.all(np.abs(delta_T) <= tol * sigma) and
+                          np.all(sse_warm <= sse_cold * (1 + 1e-9))))
+
+
+def local_datetime64(time):
+    # acquisition time as a local datetime64 without timezone, as 
+    # displayed; NaT if unknown. numpy would convert an aware datetime to 
+    # UTC, with a warning.
+    if time is None:
+        return np.datetime64('NaT', 'us')
+    if time.tzinfo is not None:
+        time = time.astimezone().replace(tzinfo=None)
+    return np.datetime64(time, 'us')
 
 class TemperaturesBatch():
     def __init__(self, measurements):
@@ -281,6 +943,13 @@ class TemperaturesBatch():
         self.plancks = np.empty(self.n_points)
         self.wiens = np.empty(self.n_points)
         self.stddevs = np.empty(self.n_points)
+        # acquisition times (local, as displayed), NaT if unknown
+        self.times = np.empty(self.n_points, dtype='datetime64[us]')
+        # one array per quality metric, NaN for spectra without fit
+        self.quality = {k: np.empty(self.n_points) for k in QUALITY_METRICS}
+        # same for the uncertainties of the temperatures
+        self.uncertainties = {k: np.empty(self.n_points) 
+                              for k in UNCERTAINTIES}
 
         self.extract_all()
 
@@ -289,13 +958,87 @@ class TemperaturesBatch():
     # otherwise if extract all is called, I have to overwrite self.keys()
     # but the length remains the same. Hence I do not use 'append'.
     def extract_all(self):
-        # populate everything
-        for i, meas in enumerate(self.measurements):
-            # keys is a list
-            self.keys[i] = meas.name
-
-            # np.arrays
-            self.frames[i] = i
-            self.plancks[i] = meas.T_planck
-            self.wiens[i] = meas.T_wien
-            self.stddevs[i] = meas.T_std_twocolor
\ No newline at end of file
+        # populate everything, by columns: batches can be long
+        ms = self.measurements
+        self.keys[:] = [meas.name for meas in ms]
+        self.frames[:] = np.arange(self.n_points)
+        # None (not fitted) gives NaN
+        self.plancks[:] = np.array([meas.T_planck for meas in ms], 
+                                   dtype=float)
+        self.wiens[:] = np.array([meas.T_wien for meas in ms], dtype=float)
+        self.stddevs[:] = np.array([meas.T_std_twocolor for meas in ms], 
+                                   dtype=float)
+        self.times[:] = [local_datetime64(meas.time) for meas in ms]
+        for k in UNCERTAINTIES:
+            self.uncertainties[k][:] = np.array([getattr(meas, k) 
+                                                 for meas in ms], dtype=float)
+        qualities = [meas.quality or dict() for meas in ms]
+        for k in QUALITY_METRICS:
+            self.quality[k][:] = np.array([q.get(k, np.nan) 
+                                           for q in qualities], dtype=float)
+        # position of each key, for update()
+        self.index = {k: i for i, k in enumerate(self.keys)}
+
+    def update(self, key):
+        # extracts again the spectrum key only (e.g. fitted again),
+        # returns its position, None if not in the batch
+        i = self.index.get(key)
+        if i is not None:
+            self.extract(i)
+        return i
+
+    def extract(self, i):
+        meas = self.measurements[i]
+        # keys is a list
+        self.keys[i] = meas.name
+
+        # np.arrays
+        self.frames[i] = i
+        self.plancks[i] = meas.T_planck
+        self.wiens[i] = meas.T_wien
+        self.stddevs[i] = meas.T_std_twocolor
+        self.times[i] = local_datetime64(meas.time)
+        for k in UNCERTAINTIES:
+            v = getattr(meas, k)
+            self.uncertainties[k][i] = np.nan if v is None else v
+
+        quality = meas.quality or dict()
+        for k in QUALITY_METRICS:
+            self.quality[k][i] = quality.get(k, np.nan)
+
+    def columns(self):
+        # all per-fit values, arrays of n_points by name
+        out = dict(frame = self.frames,
+                   T_planck = self.plancks,
+                   T_wien = self.wiens,
+                   T_std_twocolor = self.stddevs)
+        out.update(self.uncertainties)
+        out.update(self.quality)
+        return out
+
+    def select(self, sort=None, reverse=False, **ranges):
+        # indices of the fits with each given column in its (min, max) 
+        # range, None for no bound, optionally sorted by a column:
+        #   batch.select(chi2_red=(3, None), sort='chi2_red', reverse=True)
+        columns = self.columns()
+        keep = np.ones(self.n_points, dtype=bool)
+        for k, (lo, hi) in ranges.items():
+            # NaN never matches a bound
+            if lo is not None:
+                keep &= columns[k] >= lo
+            if hi is not None:
+                keep &= columns[k] <= hi
+        ind = np.flatnonzero(keep)
+        if sort is not None:
+            # stable: equal values keep the frame order, NaN last
+            order = np.argsort(columns[sort][ind], kind='stable')
+            if reverse:
+                # NaN first, as the largest values
+                order = order[::-1]
+            ind = ind[order]
+        return ind
+
+    def suspicious(self, limits=None):
+        # indices of the fits with a quality metric outside of its limits
+        # (quality.QUALITY_LIMITS by default)
+        return np.flatnonzero(suspicious(self.quality, limits))
\ No newline at end of file
@@ -16,20 +16,29 @@
 #   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
 
 
+import os
+import warnings
+import importlib.util
 import numpy as np
 
 h = 6.62607015e-34   # Planck's constant in J/s
 c = 299792458        # Speed of light in m/s
 k = 1.380649 * 1e-23 # Boltzmann constant in J/K
 
+# Two implementations of the functions below: 'numpy' and 'numba' (fused
+# loops compiled by numba, when installed). The backend is chosen at 
+# import: numba if available, unless H5TEMPERATURE_BACKEND=numpy (or 
+# numba/auto). set_backend() switches at runtime, e.g. for benchmarks.
+# The numba kernels are only compiled at their first call.
+
 # all function takes lamb in nm
-def planck(lamb, eps, temp, bg = 0):
+def _planck_numpy(lamb, eps, temp, bg = 0):
     lamb = lamb * 1e-9 # now in meters
     f = eps * ( 2*np.pi*h*c**2 / (lamb**5) ) / ( np.exp(h * c / (lamb * k * temp) ) - 1) + bg
 
     return f
 
-def wien(lamb, I, bg = 0):
+def _wien_numpy(lamb, I, bg = 0):
     lamb = lamb * 1e-9 # now in meters
 
     I2 = I - bg
@@ -39,8 +48,193 @@ def wien(lamb, I, bg = 0):
     
     return f
 
-def temp2color(lamb, wien, deltapx):    
-    n = np.array( [ 1/lamb[k] - 1/lamb[k + deltapx] for k in range(len(lamb)-deltapx)] )
-    d = np.array( [wien[k] - wien[k + deltapx] for k in range(len(lamb)-deltapx)] )
+def _temp2color_numpy(lamb, wien, deltapx):    
+    # pairs (k, k + deltapx) as slices
+    m = max(len(lamb) - deltapx, 0)
+    n = 1/lamb[:m] - 1/lamb[deltapx:deltapx + m]
+    d = wien[:m] - wien[deltapx:deltapx + m]
+
+    return(1e9 * n/d)
+
+def _planck_jac_numpy(lamb, eps, temp, bg = None):
+    # jacobian of planck with respect to (eps, temp) or (eps, temp, bg),
+    # one row per lamb, for curve_fit
+    lamb = lamb * 1e-9 # now in meters
+    u = h * c / (lamb * k * temp)
+    d_eps = ( 2*np.pi*h*c**2 / (lamb**5) ) / np.expm1(u)
+    # exp(u) / (exp(u) - 1) written to avoid overflows
+    d_temp = eps * d_eps * u / temp / (-np.expm1(-u))
+    if bg is None:
+        return np.column_stack((d_eps, d_temp))
+    return np.column_stack((d_eps, d_temp, np.ones_like(lamb)))
+
+
+_kernels = None
+
+def _numba_kernels():
+    # compiled once, then cached on disk by numba
+    global _kernels
+    if _kernels is not None:
+        return _kernels
+
+    import numba
+
+    jit = numba.njit(cache=True, error_model='numpy')
+    a = 2*np.pi*h*c**2
+    hc_k = h * c / k
+    k_hc = k / (h*c)
+
+    # l**5 as products: pow() is the slowest operation of the loops
+    @jit
+    def planck_kernel(lamb, eps, temp, bg, out):
+        for i in range(lamb.size):
+            l = lamb[i] * 1e-9
+            l2 = l * l
+            out[i] = eps * (a / (l2 * l2 * l)) \
+                     / (np.exp(hc_k / (l * temp)) - 1) + bg
+
+    @jit
+    def wien_kernel(lamb, I, bg, out):
+        for i in range(I.size):
+            l = lamb[i] * 1e-9
+            l2 = l * l
+            I2 = I[i] - bg
+            if I2 < 0:
+                out[i] = np.nan
+            else:
+                out[i] = k_hc * np.log(a / (I2 * (l2 * l2 * l)))
+
+    @jit
+    def temp2color_kernel(lamb, wien, deltapx, out):
+        for i in range(out.size):
+            out[i] = 1e9 * (1/lamb[i] - 1/lamb[i + deltapx]) \
+                     / (wien[i] - wien[i + deltapx])
+
+    @jit
+    def planck_jac_kernel(lamb, eps, temp, out):
+        for i in range(lamb.size):
+            l = lamb[i] * 1e-9
+            l2 = l * l
+            u = hc_k / (l * temp)
+            d_eps = (a / (l2 * l2 * l)) / np.expm1(u)
+            out[i, 0] = d_eps
+            out[i, 1] = eps * d_eps * u / temp / (-np.expm1(-u))
+            if out.shape[1] > 2:
+                out[i, 2] = 1.
+
+    _kernels = dict(planck = planck_kernel,
+                    wien = wien_kernel,
+                    temp2color = temp2color_kernel,
+                    planck_jac = planck_jac_kernel)
+    return _kernels
+
+def _flat(x):
+    return np.ascontiguousarray(x, dtype=np.float64)
+
+# the kernels handle one spectrum with scalar parameters, the common case.
+# Broadcasting (several spectra at once, solvers.py) goes to numpy, 
+# already vectorized over all spectra.
+
+def _planck_numba(lamb, eps, temp, bg = 0):
+    if np.ndim(lamb) != 1 or np.ndim(eps) or np.ndim(temp) or np.ndim(bg):
+        return _planck_numpy(lamb, eps, temp, bg)
+    out = np.empty(len(lamb))
+    _numba_kernels()['planck'](_flat(lamb), float(eps), float(temp), 
+                               float(bg), out)
+    return out
+
+def _wien_numba(lamb, I, bg = 0):
+    if np.ndim(lamb) != 1 or np.shape(I) != np.shape(lamb) or np.ndim(bg):
+        return _wien_numpy(lamb, I, bg)
+    out = np.empty(len(lamb))
+    _numba_kernels()['wien'](_flat(lamb), _flat(I), float(bg), out)
+    return out
+
+def _temp2color_numba(lamb, wien, deltapx):
+    out = np.empty(max(len(lamb) - deltapx, 0))
+    _numba_kernels()['temp2color'](_flat(lamb), _flat(wien), deltapx, out)
+    return out
+
+def _planck_jac_numba(lamb, eps, temp, bg = None):
+    lamb = _flat(lamb)
+    out = np.empty((len(lamb), 2 if bg is None else 3))
+    _numba_kernels()['planck_jac'](lamb, float(eps), float(temp), out)
+    return out
+
+
+_backends = dict(numpy = dict(planck = _planck_numpy,
+                              wien = _wien_numpy,
+                              temp2color = _temp2color_numpy,
+                              planck_jac = _planck_jac_numpy),
+                 numba = dict(planck = _planck_numba,
+                              wien = _wien_numba,
+                              temp2color = _temp2color_numba,
+                              planck_jac = _planck_jac_numba))
+
+def numba_available():
+    # without importing it
+    return importlib.util.find_spec('numba') is not None
+
+def set_backend(name = 'auto'):
+    # 'numpy', 'numba' or 'auto' (numba if available)
+    # replaces the functions planck, wien, temp2color and planck_jac of 
+    # this module: use them as physics.planck(...), not imported by name.
+    global backend, planck, wien, temp2color, planck_jac
+
+    if name == 'auto':
+        name = 'numba' if numba_available() else 'numpy'
+    if name not in _backends:
+        raise ValueError(f"Unknown backend '{name}', "
+                         "expected 'numpy', 'numba' or 'auto'")
+    if name == 'numba' and not numba_available():
+        raise ImportError("numba is not installed")
+
+    funcs = _backends[name]
+    planck = funcs['planck']
+    wien = funcs['wien']
+    temp2color = funcs['temp2color']
+    planck_jac = funcs['planck_jac']
+    backend = name
+
+# names of the numba functions that ran once, i.e. compiled fine
+_compiled = set()
+
+def _is_compile_error(e):
+    # numba failing to import or to compile (typing, lowering) a kernel,
+    # not a bad input
+    if isinstance(e, ImportError):
+        return True
+    try:
+        from numba.core.errors import NumbaError
+    except ImportError:
+        return False
+    return isinstance(e, NumbaError)
+
+def _fallback_on_error(func, name):
+    # numba may fail to compile (e.g. in frozen executables), at the 
+    # first call of each kernel: the numpy backend is used from then on.
+    # Other errors, and all errors after a successful first call, are
+    # raised.
+    def wrapper(*args, **kwargs):
+        if name in _compiled:
+            return func(*args, **kwargs)
+        try:
+            out = func(*args, **kwargs)
+        except Exception as e:
+            if not _is_compile_error(e):
+                raise
+            warnings.warn(f"numba backend unavailable ({e}), using numpy",
+                          RuntimeWarning, stacklevel=2)
+            set_backend('numpy')
+            return _backends['numpy'][name](*args, **kwargs)
+        _compiled.add(name)
+        return out
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+for _name, _func in _backends['numba'].items():
+    _backends['numba'][_name] = _fallback_on_error(_func, _name)
+
 
-    return(1e9 * n/d)
\ No newline at end of file
+backend = None
+set_backend(os.environ.get('H5TEMPERATURE_BACKEND', 'auto'))
@@ -0,0 +1,360 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# Streaming fits: read -> fit -> write, one spectrum at a time.
+#
+#   with TextResultsWriter('results.txt') as writer:
+#       pipeline = Pipeline(iter_h5file('scan.h5'), pars, writer)
+#       pipeline.run()
+#
+#   python -m h5temperature.pipeline scan1.h5 scan2.h5 -o results.txt
+#
+# A reader thread pulls (name, data) from the source, fitter threads
+# fit them and the writer (in the calling thread) appends the results
+# in the source order. Queues are bounded and the number of spectra in
+# flight is limited, so memory does not depend on the size of the
+# campaign: a slow writer or slow fits block the reader.
+
+import os
+import sys
+import time
+import queue
+import argparse
+import threading
+import multiprocessing
+import concurrent.futures
+
+from h5temperature.models import DEFAULT_PARS, BlackBodySpec
+from h5temperature.formats import iter_h5file, iter_ascii, is_h5file
+
+
+_STOP = object()
+
+
+def fit_spectrum(name, data, pars):
+    # the work of a fitter, also runs in worker processes
+    spec = BlackBodySpec(name, **data)
+    spec.eval_fits(pars)
+    return spec.get_fit_results()
+
+def iter_files(paths, rdcc_nbytes=None):
+    # (name, data) of all spectra of h5 and ASCII files, file by file.
+    # with several h5 files, names are prefixed by the file name.
+    # rdcc_nbytes: chunk cache of the h5 files (formats.open_h5file)
+    prefix = sum(is_h5file(path) for path in paths) > 1
+    for path in paths:
+        if is_h5file(path):
+            for key, d in iter_h5file(path, rdcc_nbytes):
+                if prefix:
+                    key = f'{os.path.basename(path)}/{key}'
+                yield key, d
+        else:
+            yield from iter_ascii([path])
+
+
+class TextResultsWriter():
+    # the tab separated file of MainWindow.export_results,
+    # written line by line
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.header = None
+
+    def write(self, results):
+        if self.header is None:
+            self.header = list(results.keys())
+            self.file.write('\t'.join(self.header) + '\n')
+        self.file.write('\t'.join(str(results[k]) for k in self.header)
+                        + '\n')
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StageCounter():
+    # items processed and busy time of one stage, over all its threads
+    def __init__(self, threads):
+        self.threads = threads
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.
+        self._lock = threading.Lock()
+
+    def add(self, busy, error=False):
+        with self._lock:
+            self.items += 1
+            self.errors += error
+            self.busy += busy
+
+
+class Pipeline():
+    def __init__(self, source, pars, writer, workers=None, maxsize=None,
+                 processes=False):
+        # source: iterable of (name, data), data as BlackBodySpec kwargs
+        # writer: any object with a write(results) method
+        # workers: number of fitter threads (default: number of CPUs)
+        # maxsize: size of the queues (default: 4 per worker)
+        # processes: fits run in a process pool of the same size, the
+        # fitter threads then only wait for them.
+        self.source = source
+        self.pars = dict(DEFAULT_PARS, **pars)
+        self.writer = writer
+        self.workers = workers or os.cpu_count() or 1
+        self.maxsize = maxsize or 4 * self.workers
+        self.processes = processes
+
+        self.in_queue = queue.Queue(self.maxsize)
+        # never full: the writer always empties it, and in flight
+        # spectra are limited by self.slots
+        self.out_queue = queue.Queue()
+        # spectra read but not written yet
+        self.max_in_flight = 2 * self.maxsize + self.workers
+        self.slots = threading.BoundedSemaphore(self.max_in_flight)
+
+        self.counters = dict(read = StageCounter(1),
+                             fit = StageCounter(self.workers),
+                             write = StageCounter(1))
+        # (name, error message) of failed fits, the pipeline goes on
+        self.errors = []
+        # exception of the reader or writer, the pipeline stops
+        self.failure = None
+        self._abort = threading.Event()
+        self._start = None
+        self._stop = None
+
+    def abort(self):
+        self._abort.set()
+
+    def _put(self, q, item):
+        # blocking put, gives up on abort
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q):
+        # blocking get, None on abort
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def _acquire_slot(self):
+        while not self._abort.is_set():
+            if self.slots.acquire(timeout=0.1):
+                return True
+        return False
+
+    def reader(self):
+        counter = self.counters['read']
+        source = iter(self.source)
+        index = 0
+        try:
+            while self._acquire_slot():
+                t0 = time.perf_counter()
+                try:
+                    name, data = next(source)
+                except StopIteration:
+                    break
+                counter.add(time.perf_counter() - t0)
+                if not self._put(self.in_queue, (index, name, data)):
+                    break
+                index += 1
+        except Exception as e:
+            self.failure = e
+            self.abort()
+        finally:
+            for _ in range(self.workers):
+                self._put(self.in_queue, _STOP)
+
+    def fitter(self, executor):
+        counter = self.counters['fit']
+        while True:
+            item = self._get(self.in_queue)
+            if item is None or item is _STOP:
+                break
+            index, name, data = item
+            t0 = time.perf_counter()
+            results, error = None, None
+            try:
+                if executor is not None:
+                    results = executor.submit(fit_spectrum, name, data,
+                                              self.pars).result()
+                else:
+                    results = fit_spectrum(name, data, self.pars)
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+            counter.add(time.perf_counter() - t0, error is not None)
+            self._put(self.out_queue, (index, name, results, error))
+        self._put(self.out_queue, _STOP)
+
+    def write_all(self):
+        # results are written in the source order, the ones arriving
+        # early wait in pending
+        counter = self.counters['write']
+        pending = dict()
+        next_index = 0
+        stops = 0
+        while stops < self.workers:
+            item = self._get(self.out_queue)
+            if item is None:
+                return
+            if item is _STOP:
+                stops += 1
+                continue
+            index, name, results, error = item
+            pending[index] = (name, results, error)
+            while next_index in pending:
+                name, results, error = pending.pop(next_index)
+                next_index += 1
+                if error is None:
+                    t0 = time.perf_counter()
+                    self.writer.write(results)
+                    counter.add(time.perf_counter() - t0)
+                else:
+                    self.errors.append((name, error))
+                self.slots.release()
+
+    def run(self):
+        # blocks until the source is exhausted, returns stats()
+        self._start = time.perf_counter()
+        executor = None
+        if self.processes:
+            # no fork: the workers would be forked from the fitter threads
+            # while the reader holds locks (h5py...)
+            executor = concurrent.futures.ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+        threads = [threading.Thread(target=self.reader, daemon=True)]
+        threads += [threading.Thread(target=self.fitter, args=(executor,),
+                                     daemon=True)
+                    for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            self.write_all()
+        except BaseException as e:
+            self.failure = e
+            self.abort()
+        finally:
+            for thread in threads:
+                thread.join()
+            if executor is not None:
+                executor.shutdown()
+            self._stop = time.perf_counter()
+
+        if self.failure is not None:
+            raise self.failure
+        return self.stats()
+
+    def stats(self):
+        # per stage: items, errors, throughput (items/s of wall time) and
+        # utilization (busy fraction of the stage threads),
+        # plus the current queue levels. Can be called while running.
+        if self._start is None:
+            elapsed = 0.
+        else:
+            elapsed = (self._stop or time.perf_counter()) - self._start
+
+        out = dict(elapsed = elapsed,
+                   in_queue = self.in_queue.qsize(),
+                   out_queue = self.out_queue.qsize(),
+                   errors = len(self.errors))
+        for name, c in self.counters.items():
+            out[name] = dict(items = c.items,
+                             errors = c.errors,
+                             busy = c.busy,
+                             throughput = c.items / elapsed if elapsed else 0,
+                             utilization = (c.busy / (elapsed * c.threads)
+                                            if elapsed else 0))
+        return out
+
+    def stats_text(self):
+        s = self.stats()
+        return (f"{s['write']['items']} written, "
+                f"{s['errors']} errors in {s['elapsed']:.1f} s | " +
+                ' | '.join(f"{k}: {s[k]['throughput']:.1f}/s "
+                           f"({100 * s[k]['utilization']:.0f}% busy)"
+                           for k in self.counters))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='h5temperature streaming fits of h5 and ASCII files')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('-o', '--output', required=True,
+                        help='tab separated results file')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--processes', action='store_true',
+                        help='fit in processes instead of threads')
+    parser.add_argument('--maxsize', type=int, default=None,
+                        help='size of the queues')
+    parser.add_argument('--chunk-cache', type=float, default=None,
+                        help='chunk cache of the h5 files in MB')
+    parser.add_argument('--lowerb', type=float,
+                        default=DEFAULT_PARS['lowerb'])
+    parser.add_argument('--upperb', type=float,
+                        default=DEFAULT_PARS['upperb'])
+    parser.add_argument('--delta', type=int, default=DEFAULT_PARS['delta'])
+    parser.add_argument('--usebg', action='store_true')
+    parser.add_argument('--fastplanck', action='store_true')
+    parser.add_argument('--rebin', type=int, default=1,
+                        help='pixels per point in the Wien and Planck fits')
+    parser.add_argument('--rebin-points', type=int, default=None,
+                        help='points in the fit window (instead of --rebin)')
+    parser.add_argument('--bootstrap', type=int, default=0,
+                        help='resamples of the residual bootstrap of each fit')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the bootstrap')
+    args = parser.parse_args()
+
+    pars = dict(lowerb = args.lowerb,
+                upperb = args.upperb,
+                delta = args.delta,
+                usebg = args.usebg,
+                fastplanck = args.fastplanck,
+                rebin = args.rebin,
+                rebin_points = args.rebin_points,
+                bootstrap = args.bootstrap,
+                bootstrap_seed = args.seed)
+
+    rdcc_nbytes = None
+    if args.chunk_cache is not None:
+        rdcc_nbytes = int(args.chunk_cache * 2**20)
+
+    with TextResultsWriter(args.output) as writer:
+        pipeline = Pipeline(iter_files(args.paths, rdcc_nbytes), pars, writer,
+                            args.workers, args.maxsize, args.processes)
+        pipeline.run()
+
+    for name, error in pipeline.errors:
+        print(f'{name}: {error}', file=sys.stderr)
+    print(pipeline.stats_text(), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -17,45 +17,49 @@
 
 
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+# pyplot is not needed for embedded figures and is slow to import
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT
+from matplotlib.collections import LineCollection
+from matplotlib.ticker import MaxNLocator, ScalarFormatter
+import matplotlib.dates as mdates
 from PyQt5.QtWidgets import (QWidget,
                              QVBoxLayout,
-                             QHBoxLayout)
+                             QHBoxLayout,
+                             QCheckBox,
+                             QLabel)
 from PyQt5.QtCore import Qt, pyqtSignal
 
+from h5temperature.figures import FourPlots
+from h5temperature.timing import timed, timed_function
+
+
+class FourPlotsCanvas(FourPlots, FigureCanvasQTAgg):
+
+    # emitted after each rendering of the figure
+    drawn = pyqtSignal()
 
-class FourPlotsCanvas(FigureCanvasQTAgg):
     def __init__(self, parent=None):
 
-        self.fig, self.axes = plt.subplots(2, 2, constrained_layout=True)
+        self.fig = Figure(constrained_layout=True)
 
         super().__init__(self.fig)
 
-        self.ax_planck_res = self.axes[0,0].twinx()
-        self.ax_wien_res = self.axes[0,1].twinx()
-
-        self.create_all()
+        self.create_axes()
 
     def get_NavigationToolbar(self, parent):
         self.navigation_toolbar = NavigationToolbar2QT(self, parent)
         self.navigation_toolbar.setStyleSheet("font-size: 18px;")
         return self.navigation_toolbar
         
-    def create_all(self):
-        self.create_artists()
-        self.create_labels()
-        self.create_legends()
-        self.create_texts()
-
-        # required to have residuals BEHIND data points :
-        self.axes[0,0].set_zorder(2)
-        self.axes[0,0].set_frame_on(False)
-        self.axes[0,1].set_zorder(2)
-        self.axes[0,1].set_frame_on(False)
+    def draw(self):
+        # actual rendering, draw_idle ends here
+        with timed('draw'):
+            super().draw()
+        self.drawn.emit()
 
+    @timed_function('canvas fits')
     def update_fits(self, current):
 #        self.set_data(current)   # already called in mainwindow through 
                                   # updatedata 
@@ -66,12 +70,14 @@ class FourPlotsCanvas(FigureCanvasQTAgg):
 
         self.draw_idle()
 
+    @timed_function('canvas data')
     def update_data(self, current):
         self.set_data(current)
         self.autoscale(current)
 
         self.draw_idle()
 
+    @timed_function('canvas all')
     def update_all(self, current):
         self.set_data(current)
         self.set_fits(current)
@@ -92,338 +98,10 @@ class FourPlotsCanvas(FigureCanvasQTAgg):
         self.create_all()
         self.draw_idle()
 
-    def create_legends(self):
-        # legends
-        self.axes[0,0].legend(loc='upper left')
-        self.ax_planck_res.legend(loc='upper right')
-        self.axes[0,1].legend(loc='upper left')   
-        self.ax_wien_res.legend(loc='upper right')
-        self.axes[1,0].legend() 
-        self.axes[1,1].legend()
-
-    def create_labels(self):
-        # Planck
-        self.axes[0,0].set_xlabel('wavelength (nm)')
-        self.axes[0,0].set_ylabel('intensity (arb. unit)')
-
-        self.ax_planck_res.set_ylabel('Planck fit residuals')
-
-        # Wien
-        self.axes[0,1].set_xlabel('1/wavelength (1/nm)')
-        self.axes[0,1].set_ylabel('Wien')
-
-        self.ax_wien_res.set_ylabel('Wien fit residuals')
-
-        # Two color
-        self.axes[1,0].set_xlabel('wavelength (nm)')
-        self.axes[1,0].set_ylabel('two-color temperature (K)')
-
-        # Two color Histogram
-        self.axes[1,1].set_xlabel('two-color temperature (K)')
-        self.axes[1,1].set_ylabel('frequency')
-
-        # fix for a matplotlib bug?
-        # https://github.com/matplotlib/matplotlib/issues/28268
-        self.ax_planck_res.yaxis.set_label_position('right') 
-        self.ax_wien_res.yaxis.set_label_position('right') 
-
-    def create_artists(self):
-        self.planck_data_pts = self.axes[0,0].scatter([], [], 
-                                      edgecolor='k',
-                                      facecolor='royalblue',
-                                      alpha=.3,
-                                      s=15, 
-                                      zorder=5,
-                                      label='Planck data')
-        
-        self.wien_data_pts = self.axes[0,1].scatter([], [], 
-                                      edgecolor='k',
-                                      facecolor='royalblue',
-                                      alpha=.3,
-                                      s=15, 
-                                      zorder=5,
-                                      label='Wien data')
-
-        self.rawwien_data_pts = self.axes[0,1].scatter([], [], 
-                                      edgecolor='k',
-                                      facecolor='lightcoral',
-                                      marker='^',
-                                      alpha=.3,
-                                      s=15, 
-                                      zorder=0,
-                                      label='Wien data (no bg)')
-
-        self.twocolor_data_pts = self.axes[1,0].scatter([], [],
-                                      edgecolor='k',
-                                      facecolor='royalblue',
-                                      alpha=.3,
-                                      s=15, 
-                                      zorder=5,
-                                      label='two-color data')
-
-        (self.hist_counts, self.hist_bins, 
-            self.hist_patches) = self.axes[1,1].hist([],
-                                    color='darkblue',
-                                    bins = 70,
-                                    alpha=.5, 
-                                    zorder=5,
-                                    label='two-color histogram')
-
-        # plot fits:
-        self.planck_fit_line, = self.axes[0,0].plot([], [],
-                                   color='r',
-                                   linewidth=2.5,
-                                   zorder=7,
-                                   label='Planck fit')
-
-        self.planck_bg = self.axes[0,0].axhline(0,
-                                      color='k',
-                                      linewidth=1.5,
-                                      linestyle='dashed',
-                                      zorder=3,
-                                      label='background')            
-
-        self.planck_res_pts = self.ax_planck_res.scatter([], [], 
-                                          edgecolor='gray',
-                                          facecolor='none',
-                                          linewidth=1.5,
-                                          alpha=0.2,
-                                          s=15, 
-                                          zorder=0,
-                                          label='residuals')
-
-        self.wien_fit_line, = self.axes[0,1].plot([], [], 
-                                   c='r', 
-                                   linewidth=2.5, 
-                                   zorder=7,
-                                   label='Wien fit')
-
-        self.wien_res_pts = self.ax_wien_res.scatter([], [], 
-                                        edgecolor='gray',
-                                        facecolor='none',
-                                        linewidth=1.5,
-                                        alpha=0.2,
-                                        s=15, 
-                                        zorder=0,
-                                        label='residuals')
-
-        self.twocolor_line = self.axes[1,0].axhline(color='r',
-                                      linestyle='dashed',
-                                      linewidth=2.5,
-                                      zorder=7,
-                                      label='mean')            
-
-        self.planck_lowlim_line = self.axes[0,0].axvline(
-                                      color='g',
-                                      linewidth=0.8,
-                                      linestyle='solid',
-                                      zorder=3)
-
-        self.planck_highlim_line = self.axes[0,0].axvline(
-                                      color='g',
-                                      linewidth=0.8,
-                                      linestyle='solid',
-                                      zorder=3)
-
-        self.wien_lowlim_line = self.axes[0,1].axvline(
-                                      color='g',
-                                      linewidth=0.8,
-                                      linestyle='solid',
-                                      zorder=3)
-
-        self.wien_highlim_line = self.axes[0,1].axvline(
-                                      color='g',
-                                      linewidth=0.8,
-                                      linestyle='solid',
-                                      zorder=3)
-
-        self.saturation_rect = patches.Rectangle((0.5, 0.5), 0, 0, 
-            linewidth=0, edgecolor='None', facecolor='r', alpha=0.4)
-
-    def create_texts(self):
-        self.planck_text = self.axes[0,0].text(0.05, 0.65, 
-                            '',
-                            size=15, 
-                            color='r', 
-                            zorder=10,
-                            transform=self.axes[0,0].transAxes)
-
-        self.wien_text = self.axes[0,1].text(0.05, 0.65, 
-                            '',
-                            size=15, 
-                            color='r', 
-                            zorder=10,
-                            transform=self.axes[0,1].transAxes)
-        
-        self.twocolor_text = self.axes[1,0].text(0.2, 0.7, 
-                            '',
-                            size=15, 
-                            color='r', 
-                            zorder=10,
-                            transform=self.axes[1,0].transAxes)
-
-        self.twocolor_err_text = self.axes[1,1].text(0.05, 0.8, 
-                            '',
-                            size=15, 
-                            color='r', 
-                            zorder=10,
-                            transform=self.axes[1,1].transAxes)
-
-    def set_texts(self, current):
-
-        self.planck_text.set_text(
-                    'T$_{{Planck}}$= {:.0f} K'.format(current.T_planck))
-        self.wien_text.set_text(
-                    'T$_{{Wien}}$= {:.0f} K'.format(current.T_wien))
-        self.twocolor_text.set_text(
-                    'T$_{{two\\mathrm{{-}}color}}$= {:.0f} K'.format(current.T_twocolor))
-        self.twocolor_err_text.set_text(
-                    'std. dev = {:.0f} K'.format(current.T_std_twocolor))
-
-    def set_data(self, current):
-
-        self.planck_data_pts.set_offsets(np.c_[current.lam, current.planck])
-        self.wien_data_pts.set_offsets(np.c_[1 / current.lam, current.wien])
-
-        if current._saturated:
-            rect_xmin = np.min( current.lam[current.saturated_ind] )
-            rect_ymin = np.min( current.planck[current.saturated_ind] )
-            rect_w = np.ptp( current.lam[current.saturated_ind] )
-            rect_h = np.ptp( current.planck[current.saturated_ind] )
-            self.saturation_rect.set_xy((rect_xmin, rect_ymin))
-            self.saturation_rect.set_width(rect_w)
-            self.saturation_rect.set_height(rect_h)
-
-            self.axes[0,0].add_patch(self.saturation_rect)
-
-        else:
-            self.saturation_rect.set_width(0)
-            self.saturation_rect.set_height(0)            
-
-    def set_fits(self, current):
-
-        self.twocolor_data_pts.set_offsets(
-            np.c_[current.lam[current.ind_interval][:-current.pars['delta']], 
-                  current.twocolor])
-
-        # could be calculated in the model instead of here
-        # avoiding NaNs
-        self.hist_counts, self.hist_bins = np.histogram(
-                current.twocolor[np.isfinite(current.twocolor)], bins=70)
-
-        # equal-width bins
-        dbins = (self.hist_bins[1] - self.hist_bins[0])
-
-        for rect, h, x in zip(self.hist_patches, 
-                              self.hist_counts, 
-                              self.hist_bins[:-1]):
-            rect.set_height(h)
-            rect.set_x(x)
-            rect.set_width(dbins)
-
-        self.planck_fit_line.set_data(current.lam[current.ind_interval],
-                                      current.planck_fit)
-
-        self.planck_res_pts.set_offsets(np.c_[current.lam[current.ind_interval], 
-                                              current.planck_residuals])
-
-        if current.pars['usebg']:
-            self.planck_bg.set_ydata([current.bg])
-            self.rawwien_data_pts.set_offsets(np.c_[1 / current.lam, current.rawwien])
-
-            self.planck_bg.set_visible(True)
-            self.rawwien_data_pts.set_visible(True)
-
-        else:
-            self.planck_bg.set_visible(False)
-            self.rawwien_data_pts.set_visible(False)
-
-        self.wien_fit_line.set_data(1 / current.lam[current.ind_interval], 
-                                    current.wien_fit)
-
-        self.wien_res_pts.set_offsets(np.c_[1 / current.lam[current.ind_interval], 
-                                            current.wien_residuals])
-
-        self.twocolor_line.set_ydata([current.T_twocolor, current.T_twocolor])
-
-    def set_fitslim(self, current):
-
-        self.planck_lowlim_line.set_xdata(
-                    [current.pars['lowerb'], current.pars['lowerb']])
-
-        self.planck_highlim_line.set_xdata(
-                    [current.pars['upperb'], current.pars['upperb']])
-
-        self.wien_lowlim_line.set_xdata(
-                    [1/current.pars['upperb'], 1/current.pars['upperb']])
-
-        self.wien_highlim_line.set_xdata(
-                    [1/current.pars['lowerb'], 1/current.pars['lowerb']])
-
-
-    def autoscale(self, current):
-        # Custom Autoscales...
-        # planck:
-        if current._fitted:
-            self.axes[0,0].set_xlim([current.pars['lowerb'] - 100, 
-                                 current.pars['upperb'] + 100])
-
-            self.axes[0,0].set_ylim([np.min( current.planck_fit - \
-                                         0.4*np.ptp(current.planck_fit)),
-                                         np.max( current.planck_fit + \
-                                         0.5*np.ptp(current.planck_fit))])
-            self.ax_planck_res.set_ylim([
-                np.min( current.planck_residuals ),
-                np.max( current.planck_residuals ) ])
-
-            # wien:
-            self.axes[0,1].set_xlim(
-                [np.min( 1 / current.lam[current.ind_interval] - 0.0002 ),
-                 np.max( 1 / current.lam[current.ind_interval] + 0.0002 )])
-    
-            self.axes[0,1].set_ylim([np.min( current.wien_fit - \
-                                             0.5*np.ptp(current.wien_fit)),
-                                             np.max( current.wien_fit + \
-                                             0.5*np.ptp(current.wien_fit))])
-    
-            self.ax_wien_res.set_ylim([
-                np.nanmin( current.wien_residuals ),
-                np.nanmax( current.wien_residuals )])
-    
-            # 2color:
-            self.axes[1,0].set_xlim([current.pars['lowerb'] - 20,
-                                     current.pars['upperb'] + 10])
-            self.axes[1,0].set_ylim(
-                [current.T_twocolor - 5 * current.T_std_twocolor, 
-                 current.T_twocolor + 5 * current.T_std_twocolor])
-    
-            # histogram
-            self.axes[1,1].set_xlim(
-                [current.T_twocolor - 5 * current.T_std_twocolor,
-                 current.T_twocolor + 5 * current.T_std_twocolor])
-
-            self.axes[1,1].set_ylim([0, 1.4*np.max(self.hist_counts)])
-
-        else:
-            # Planck:
-            self.axes[0,0].set_xlim([np.min(current.lam)-100, 
-                                     np.max(current.lam)+100 ])
-            self.axes[0,0].set_ylim([np.min(current.planck),
-                                     np.max(current.planck)])
-
-            # Wien:
-            self.axes[0,1].set_xlim(
-                [np.min( 1 / current.lam - 0.0002 ),
-                 np.max( 1 / current.lam + 0.0002 )])
-    
-            self.axes[0,1].set_ylim([np.min(current.wien),
-                                     np.max(current.wien)])
-
-
 class SinglePlotCanvas(FigureCanvasQTAgg):
     def __init__(self, parent=None):
-        self.fig, self.ax = plt.subplots(
-            constrained_layout=True)
+        self.fig = Figure(constrained_layout=True)
+        self.ax = self.fig.subplots()
 
         super().__init__(self.fig)
 
@@ -498,10 +176,95 @@ class ChooseDeltaWindow(QWidget):
 
 
 
-class BatchWindow(QWidget):
+class WindowSensitivityWindow(QWidget):
+
+    # lower and upper bounds (nm) picked in the maps
+    window_changed = pyqtSignal(int, int)
+
     def __init__(self, parent):
         super().__init__(parent, Qt.Window)
 
+        self.resize(1200, 450)
+
+        self.setWindowTitle('Fit window sensitivity')
+        self.setStyleSheet("background-color: white")
+
+        self.fig = Figure(constrained_layout=True)
+        self.axes = self.fig.subplots(1, 3, sharex=True, sharey=True)
+        self.canvas = FigureCanvasQTAgg(self.fig)
+        self.toolbar = NavigationToolbar2QT(self.canvas, self)     
+        self.toolbar.setStyleSheet("font-size: 18px;")
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.toolbar)
+        layout.addWidget(self.canvas)
+
+        self.setLayout(layout)
+
+        self.create_artists()
+
+        # click event
+        self.canvas.mpl_connect('button_press_event', self.choose)
+
+    def create_artists(self):
+        titles = ['T Wien (K)', 'T two-color (K)', 'two-color std dev (K)']
+        self.images = []
+        self.markers = []
+        for ax, title in zip(self.axes, titles):
+            ax.set_title(title)
+            ax.set_xlabel('upper limit (nm)')
+            im = ax.imshow(np.full((2, 2), np.nan), 
+                           origin='lower', 
+                           aspect='auto',
+                           cmap='viridis',
+                           interpolation='nearest')
+            self.fig.colorbar(im, ax=ax)
+            marker, = ax.plot([], [], 
+                              marker='+', 
+                              color='r', 
+                              markersize=15, 
+                              markeredgewidth=2)
+            self.images.append(im)
+            self.markers.append(marker)
+        self.axes[0].set_ylabel('lower limit (nm)')
+
+    def set_data(self, lowers, uppers, *maps):
+        extent = [uppers[0], uppers[-1], lowers[0], lowers[-1]]
+        for im, m in zip(self.images, maps):
+            im.set_data(m)
+            im.set_extent(extent)
+            if np.isfinite(m).any():
+                # robust color scale, edges of the maps are noisy
+                im.set_clim(*np.nanpercentile(m, [5, 95]))
+        self.axes[0].set_xlim(extent[:2])
+        self.axes[0].set_ylim(extent[2:])
+
+    def set_marker(self, lower, upper):
+        for marker in self.markers:
+            marker.set_data([upper], [lower])
+
+    def choose(self, event):
+        if event.inaxes in self.axes and self.toolbar.mode == '':
+            lower, upper = int(event.ydata), int(event.xdata)
+            if lower < upper:
+                self.set_marker(lower, upper)
+                self.window_changed.emit(lower, upper)
+                self.canvas.draw_idle()
+
+
+class BatchWindow(QWidget):
+    # temperatures of the batch against the frame or the acquisition time.
+    # Markers and error bars are single artists whose data is replaced:
+    # beyond max_points in the visible range, only the min and max 
+    # temperatures of bins of points are drawn, spikes remain visible.
+    # A click displays the nearest spectrum (key_chosen), found by 
+    # bisection on the sorted x.
+
+    key_chosen = pyqtSignal(str)
+
+    def __init__(self, parent, max_points=4000):
+        super().__init__(parent, Qt.Window)
+
         self.resize(800, 600)
 
         self.setWindowTitle('h5temperature batch')
@@ -510,46 +273,293 @@ class BatchWindow(QWidget):
         self.canvas = SinglePlotCanvas(self)
         self.toolbar = NavigationToolbar2QT(self.canvas, self)     
         self.toolbar.setStyleSheet("font-size: 18px;")
+        self.time_box = QCheckBox('Time axis')
+        self.status_label = QLabel()
+
+        top = QHBoxLayout()
+        top.addWidget(self.toolbar)
+        top.addWidget(self.time_box)
 
         layout = QVBoxLayout()
-        layout.addWidget(self.toolbar)
+        layout.addLayout(top)
         layout.addWidget(self.canvas)
+        layout.addWidget(self.status_label)
 
         self.setLayout(layout)
 
+        self.max_points = max_points
+        self.batch = None
+        # x of all points, sorted x of the points with a valid x and 
+        # their indices in the batch
+        self.x = np.empty(0)
+        self.sorted_x = np.empty(0)
+        self.order = np.empty(0, dtype=int)
+        self.current = None
+
+        self.create_artists()
+
+        self.time_box.toggled.connect(self.set_xaxis)
+        self.canvas.ax.callbacks.connect('xlim_changed', self.update_points)
         # click event
-#        self.canvas.mpl_connect('button_press_event', self.choose)
+        self.canvas.mpl_connect('button_press_event', self.choose)
+
+    def create_artists(self):
+        ax = self.canvas.ax
+        ax.set_ylabel('Temperature (K)')
+        self.errorbars = LineCollection([], colors='royalblue', 
+                                        linewidths=1)
+        ax.add_collection(self.errorbars)
+        self.planck_pts, = ax.plot([], [], 'o', color='royalblue', 
+                                   markersize=7, label='Planck')
+        self.wien_pts, = ax.plot([], [], 'v', color='orange', 
+                                 markersize=7, label='Wien')
+        self.current_pt, = ax.plot([], [], 'o', markersize=13,
+                                   markerfacecolor='none', 
+                                   markeredgecolor='r', 
+                                   markeredgewidth=2)
+        ax.legend(handles=[self.planck_pts, self.wien_pts])
+        self.set_xlabels()
+
+    def set_xlabels(self):
+        ax = self.canvas.ax
+        if self.time_box.isChecked():
+            ax.set_xlabel('Time')
+            locator = mdates.AutoDateLocator()
+            ax.xaxis.set_major_locator(locator)
+            ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+        else:
+            ax.set_xlabel('Frame')
+            ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+            ax.xaxis.set_major_formatter(ScalarFormatter())
+
+    def clear(self):
+        self.batch = None
+        self.x = np.empty(0)
+        self.sorted_x = np.empty(0)
+        self.order = np.empty(0, dtype=int)
+        self.current = None
+        self.update_points()
+        self.canvas.draw_idle()
 
     def replot(self, batch):
-        self.canvas.ax.clear()
+        self.batch = batch
+        if self.time_box.isChecked() and np.isnat(batch.times).all():
+            # no acquisition time, set_xaxis calls replot again
+            self.time_box.setChecked(False)
+            return
+
+        if self.time_box.isChecked():
+            # days, the unit of matplotlib dates
+            self.x = mdates.date2num(batch.times)
+        else:
+            self.x = batch.frames
+        # x is only sorted by frames: ramps of several groups may overlap 
+        # in time, NaN (no time) last
+        self.order = np.argsort(self.x, kind='stable')
+        self.order = self.order[:np.count_nonzero(np.isfinite(self.x))]
+        self.sorted_x = self.x[self.order]
+        self.current = None
+
+        ax = self.canvas.ax
+        if len(self.sorted_x):
+            xmin, xmax = self.sorted_x[0], self.sorted_x[-1]
+            margin = .5 if not self.time_box.isChecked() else \
+                     max(.02 * (xmax - xmin), 1 / 86400)
+            ax.set_xlim([xmin - margin, xmax + margin])
+        temps = batch.plancks[np.isfinite(batch.plancks)]
+        if len(temps):
+            ax.set_ylim([np.min(temps) - 200, np.max(temps) + 200])
+        # set_xlim updates the points, unless the limits did not change
+        self.update_points()
+        self.canvas.draw_idle()
 
-        self.canvas.ax.set_xlabel('Frame')
-        self.canvas.ax.set_ylabel('Temperature (K)')
-
-        self.canvas.ax.errorbar(batch.frames, batch.plancks, 
-                                xerr=None,
-                                yerr=batch.stddevs,
-                                fmt='o',
-                                capsize=2,
-                                color='royalblue',
-                                linestyle=None,
-                                markersize=7,
-                                label='Planck')
-
-        self.canvas.ax.errorbar(batch.frames, batch.wiens,
-                                xerr = None, 
-                                yerr = None,
-                                fmt='v',
-                                capsize=3,
-                                color='orange',
-                                linestyle=None,
-                                markersize=7,
-                                label='Wien')
-
-        self.canvas.ax.legend()
-
-        self.canvas.ax.set_xlim([-.5, np.max(batch.frames)+.5])
-        self.canvas.ax.set_ylim([np.min(batch.plancks) - 200, 
-                                 np.max(batch.plancks) + 200])
-
-        self.canvas.draw()
\ No newline at end of file
+    def set_xaxis(self):
+        self.set_xlabels()
+        if self.batch is not None:
+            self.replot(self.batch)
+        else:
+            self.canvas.draw_idle()
+
+    def visible(self):
+        # indices in the batch of the points to draw in the x range
+        xmin, xmax = self.canvas.ax.get_xlim()
+        i0, i1 = np.searchsorted(self.sorted_x, [xmin, xmax])
+        ind = self.order[i0:i1]
+        n = len(ind)
+        if n <= self.max_points:
+            return ind
+
+        # bins of step points, 4 points kept per bin
+        step = -(-4 * n // self.max_points)
+        pad = -n % step
+        rows = np.arange((n + pad) // step)[:, None] * step
+        keep = []
+        for temps in (self.batch.plancks, self.batch.wiens):
+            y = np.pad(temps[ind], (0, pad), constant_values=np.nan)
+            y = y.reshape(-1, step)
+            nan = np.isnan(y)
+            keep.append(np.argmin(np.where(nan, np.inf, y), axis=1))
+            keep.append(np.argmax(np.where(nan, -np.inf, y), axis=1))
+        pos = np.unique(rows + np.array(keep).T)
+        return ind[pos[pos < n]]
+
+    def update_points(self, ax=None):
+        # the data of the artists for the current x range (also called 
+        # when the x limits change: zoom, pan)
+        if self.batch is None or not len(self.order):
+            for line in (self.planck_pts, self.wien_pts, self.current_pt):
+                line.set_data([], [])
+            self.errorbars.set_segments([])
+            self.status_label.setText('')
+            return
+
+        ind = self.visible()
+        x = self.x[ind]
+        plancks = self.batch.plancks[ind]
+        std = self.batch.stddevs[ind]
+        self.planck_pts.set_data(x, plancks)
+        self.wien_pts.set_data(x, self.batch.wiens[ind])
+        self.errorbars.set_segments(
+            np.stack([np.c_[x, plancks - std], np.c_[x, plancks + std]], 
+                     axis=1))
+
+        if self.current is not None:
+            self.current_pt.set_data([self.x[self.current]], 
+                                     [self.batch.plancks[self.current]])
+        else:
+            self.current_pt.set_data([], [])
+
+        self.status_label.setText(f'{self.batch.n_points} spectra, '
+                                  f'{len(ind)} points drawn. '
+                                  'Click a point to display its spectrum.')
+
+    def set_current(self, key):
+        # marks the spectrum key (displayed in the main window)
+        if self.batch is None:
+            return
+        self.current = self.batch.index.get(key)
+        self.update_points()
+        self.canvas.draw_idle()
+
+    def choose(self, event):
+        ax = self.canvas.ax
+        if event.inaxes is not ax or self.toolbar.mode != '' or \
+                self.batch is None or event.button != 1:
+            return
+
+        # candidates within tol pixels in x
+        tol = 8
+        xmin, xmax = ax.get_xlim()
+        dx = tol * (xmax - xmin) / ax.bbox.width
+        i0, i1 = np.searchsorted(self.sorted_x, 
+                                 [event.xdata - dx, event.xdata + dx])
+        ind = self.order[i0:i1]
+        if not len(ind):
+            return
+
+        # nearest Planck or Wien marker on screen
+        dist = np.full(len(ind), np.inf)
+        for temps in (self.batch.plancks, self.batch.wiens):
+            xy = ax.transData.transform(np.c_[self.x[ind], temps[ind]])
+            d = np.hypot(xy[:, 0] - event.x, xy[:, 1] - event.y)
+            dist = np.fmin(dist, d)
+        best = np.argmin(dist)
+        if dist[best] <= tol:
+            self.key_chosen.emit(self.batch.keys[ind[best]])
+
+class MappingWindow(QWidget):
+    # temperature image (frames, CCD lines) of a group and the profile
+    # along the slit of the frame selected in the image
+
+    def __init__(self, parent):
+        super().__init__(parent, Qt.Window)
+
+        self.resize(1100, 500)
+
+        self.setWindowTitle('Temperature map')
+        self.setStyleSheet("background-color: white")
+
+        self.fig = Figure(constrained_layout=True)
+        self.axes = self.fig.subplots(1, 2)
+        self.canvas = FigureCanvasQTAgg(self.fig)
+        self.toolbar = NavigationToolbar2QT(self.canvas, self)     
+        self.toolbar.setStyleSheet("font-size: 18px;")
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.toolbar)
+        layout.addWidget(self.canvas)
+
+        self.setLayout(layout)
+
+        self.tmap = None
+        self.create_artists()
+
+        # click event
+        self.canvas.mpl_connect('button_press_event', self.choose)
+
+    def create_artists(self):
+        ax_im, ax_pr = self.axes
+
+        ax_im.set_title('T Planck (K)')
+        ax_im.set_xlabel('CCD line')
+        ax_im.set_ylabel('Frame')
+        self.image = ax_im.imshow(np.full((2, 2), np.nan), 
+                                  origin='lower', 
+                                  aspect='auto',
+                                  cmap='inferno',
+                                  interpolation='nearest')
+        self.fig.colorbar(self.image, ax=ax_im)
+        self.frame_line = ax_im.axhline(0, color='c', linewidth=1)
+
+        ax_pr.set_xlabel('CCD line')
+        ax_pr.set_ylabel('Temperature (K)')
+        self.profile_planck, = ax_pr.plot([], [], 'o', color='royalblue',
+                                          markersize=3, label='Planck')
+        self.profile_wien, = ax_pr.plot([], [], 'v', color='orange',
+                                        markersize=3, label='Wien')
+        self.profile_twocolor, = ax_pr.plot([], [], '-', color='k',
+                                            linewidth=1, label='two-color')
+        self.profile_band = None
+        ax_pr.legend()
+
+    def set_data(self, tmap):
+        self.tmap = tmap
+        self.setWindowTitle(f'Temperature map: {tmap.name}')
+        self.image.set_data(tmap.T_planck)
+        self.image.set_extent([-.5, tmap.n_lines - .5, 
+                               -.5, tmap.n_frames - .5])
+        if np.isfinite(tmap.T_planck).any():
+            self.image.set_clim(*np.nanpercentile(tmap.T_planck, [1, 99]))
+        self.set_frame(0)
+
+    def set_frame(self, frame):
+        tmap = self.tmap
+        profile = tmap.profile(frame)
+        lines = np.arange(tmap.n_lines)
+
+        self.frame_line.set_ydata([frame])
+        self.profile_planck.set_data(lines, profile['T_planck'])
+        self.profile_wien.set_data(lines, profile['T_wien'])
+        self.profile_twocolor.set_data(lines, profile['T_twocolor'])
+        if self.profile_band is not None:
+            self.profile_band.remove()
+        tc = profile['T_twocolor']
+        std = profile['T_std_twocolor']
+        self.profile_band = self.axes[1].fill_between(lines, 
+                                                      tc - std, tc + std,
+                                                      color='k', 
+                                                      alpha=0.15, 
+                                                      linewidth=0)
+        self.axes[1].set_title(f'Frame {frame}')
+
+        self.axes[1].set_xlim(-.5, tmap.n_lines - .5)
+        temps = profile['T_planck'][np.isfinite(profile['T_planck'])]
+        if len(temps):
+            self.axes[1].set_ylim(np.min(temps) - 200, np.max(temps) + 200)
+
+    def choose(self, event):
+        if event.inaxes is self.axes[0] and self.toolbar.mode == '' \
+                and self.tmap is not None:
+            frame = int(np.clip(round(event.ydata), 0, self.tmap.n_frames - 1))
+            self.set_frame(frame)
+            self.canvas.draw_idle()
@@ -0,0 +1,114 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# Fit quality metrics, in the fit window.
+# As in solvers.py, all functions work along the last axis: several
+# spectra (2D arrays, one per row, NaN padded) are evaluated at once.
+#
+#   chi2_red    reduced chi-square of the Planck fit, with the noise
+#               estimated from the data (differences of neighbouring
+#               pixels): ~1 for a good fit, larger for a misfit
+#   r2          coefficient of determination of the Planck fit
+#   autocorr    lag-1 autocorrelation of the Planck residuals: close to
+#               0 for noise, close to 1 for a systematic misfit
+#   planck_wien relative difference T_wien / T_planck - 1
+#   nan_wien    fraction of the Wien pixels which are not finite
+#               (intensity below the background)
+#   saturated   fraction of the pixels which are saturated
+
+import warnings
+
+import numpy as np
+
+
+QUALITY_METRICS = ('chi2_red', 'r2', 'autocorr', 'planck_wien',
+                   'nan_wien', 'saturated')
+
+# fits outside of these (min, max) are flagged by suspicious()
+QUALITY_LIMITS = dict(chi2_red = (None, 3),
+                      r2 = (0.9, None),
+                      autocorr = (None, 0.5),
+                      planck_wien = (-0.05, 0.05),
+                      nan_wien = (None, 0.05),
+                      saturated = (None, 0))
+
+
+def noise_variance(data):
+    # variance of the noise from the second differences of neighbouring
+    # pixels (variance 6 sigma^2 for white noise), insensitive to the 
+    # smooth signal and its slope
+    d = np.diff(data, n=2, axis=-1)
+    return np.nanmean(d**2, axis=-1) / 6
+
+def fit_quality(data, residuals, wien, T_planck, T_wien,
+                saturated=None, n_params=2):
+    # data, residuals and wien of the Planck fit in the fit window
+    # (..., n_px), NaN padded; T_planck and T_wien (...);
+    # saturated: boolean mask (..., n_px) or None.
+    # Returns a dict of arrays (...) of QUALITY_METRICS.
+    with warnings.catch_warnings(), np.errstate(all='ignore'):
+        # empty or all-NaN rows give NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+
+        valid = np.isfinite(residuals)
+        n = np.sum(valid, axis=-1)
+        r = np.where(valid, residuals, 0)
+        ss_res = np.sum(r**2, axis=-1)
+
+        chi2_red = ss_res / (n - n_params) / noise_variance(data)
+
+        mean = np.nanmean(data, axis=-1)
+        ss_tot = np.nansum((data - mean[..., None])**2, axis=-1)
+        r2 = 1 - ss_res / ss_tot
+
+        autocorr = np.sum(r[..., :-1] * r[..., 1:], axis=-1) / ss_res
+
+        planck_wien = np.asarray(T_wien, dtype=float) / \
+                      np.asarray(T_planck, dtype=float) - 1
+
+        n_px = np.sum(np.isfinite(data), axis=-1)
+        nan_wien = np.sum(np.isfinite(data) & ~np.isfinite(wien),
+                          axis=-1) / n_px
+
+        if saturated is None:
+            saturated = np.zeros(np.shape(n))
+        else:
+            saturated = np.sum(saturated, axis=-1) / n_px
+
+    return dict(chi2_red = chi2_red,
+                r2 = r2,
+                autocorr = autocorr,
+                planck_wien = planck_wien,
+                nan_wien = nan_wien,
+                saturated = saturated)
+
+def suspicious(metrics, limits=None):
+    # boolean mask of the fits with a metric outside of its limits,
+    # metrics: dict of arrays (from fit_quality or TemperaturesBatch)
+    # NaN metrics (fit failed, no data) are suspicious
+    if limits is None:
+        limits = QUALITY_LIMITS
+    out = None
+    for k, (lo, hi) in limits.items():
+        v = np.asarray(metrics[k], dtype=float)
+        bad = ~np.isfinite(v)
+        if lo is not None:
+            bad |= v < lo
+        if hi is not None:
+            bad |= v > hi
+        out = bad if out is None else out | bad
+    return out
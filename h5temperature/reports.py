@@ -0,0 +1,229 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# Fit reports: the four plots of the GUI for every spectrum of a group,
+# rendered offscreen (Agg, no Qt) in a process pool. One page per
+# spectrum (PNG or PDF) and an index.html with the fit results.
+#
+#   write_report(specs, 'report', fmt='png', pars=pars)
+#
+#   python -m h5temperature.reports scan.h5 4.1 -o report --pdf
+#
+# Each worker process creates its figure once, then only updates the
+# data of the artists between pages.
+
+import os
+import sys
+import html
+import argparse
+import multiprocessing
+import concurrent.futures
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from h5temperature.figures import FourPlots
+
+
+class ReportFigure(FourPlots):
+    def __init__(self, figsize=(16, 9), dpi=100):
+        self.fig = Figure(figsize=figsize, dpi=dpi, constrained_layout=True)
+        FigureCanvasAgg(self.fig)
+        self.create_axes()
+        self.title = self.fig.suptitle('')
+
+    def render(self, spec, path):
+        self.set_data(spec)
+        if spec._fitted:
+            self.set_fits(spec)
+            self.set_fitslim(spec)
+            self.set_texts(spec)
+        self.autoscale(spec)
+        self.title.set_text(f'{spec.name}    {spec.get_fit_results()["time"]}')
+        if path.endswith('.png'):
+            # zlib dominates the saving time at higher levels
+            self.fig.savefig(path, pil_kwargs=dict(compress_level=1))
+        else:
+            self.fig.savefig(path)
+        if self.fig.get_layout_engine() is not None:
+            # the layout of the first page is kept: constrained layout
+            # would otherwise draw each page twice
+            self.fig.set_layout_engine(None)
+
+
+# the figure of a worker process, created on its first chunk
+_figure = None
+
+def render_chunk(specs, paths, pars=None, figsize=(16, 9), dpi=100):
+    # runs in the workers: (fits and) renders specs in paths,
+    # returns their fit results, None for failed pages
+    global _figure
+    if _figure is None or _figure.fig.get_size_inches().tolist() != \
+            list(figsize) or _figure.fig.dpi != dpi:
+        _figure = ReportFigure(figsize, dpi)
+
+    out = []
+    for spec, path in zip(specs, paths):
+        try:
+            if pars is not None and spec.pars != pars:
+                spec.eval_fits(pars)
+            _figure.render(spec, path)
+            out.append(spec.get_fit_results())
+        except Exception as e:
+            print(f'{spec.name}: {type(e).__name__}: {e}', file=sys.stderr)
+            out.append(None)
+    return out
+
+def page_name(i, spec, fmt):
+    name = ''.join(c if c.isalnum() or c in '.-_[]' else '_'
+                   for c in str(spec.name))
+    return f'{i:05d}_{name}.{fmt}'
+
+def write_index(folder, names, results, title):
+    # index.html: one row per page with the main results,
+    # thumbnails for PNG pages
+    columns = ('name', 'time', 'T_planck', 'T_wien', 'T_twocolor',
+               'T_std_twocolor', 'saturated')
+    def cell(value):
+        if isinstance(value, float):
+            value = f'{value:.0f}'
+        return f'<td>{html.escape(str(value))}</td>'
+
+    rows = []
+    for name, res in zip(names, results):
+        link = html.escape(name)
+        if name.endswith('.png'):
+            page = f'<a href="{link}"><img src="{link}" width="320"></a>'
+        else:
+            page = f'<a href="{link}">{link}</a>'
+        if res is None:
+            values = '<td colspan="7">failed</td>'
+        else:
+            values = ''.join(cell(res[c]) for c in columns)
+        rows.append(f'<tr><td>{page}</td>{values}</tr>')
+
+    path = os.path.join(folder, 'index.html')
+    with open(path, 'w') as file:
+        file.write(
+            '<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+            f'<title>{html.escape(title)}</title>'
+            '<style>td, th {padding: 2px 8px; text-align: right}</style>'
+            f'</head><body><h1>{html.escape(title)}</h1>\n<table>\n'
+            '<tr><th>page</th>' +
+            ''.join(f'<th>{c}</th>' for c in columns) + '</tr>\n' +
+            '\n'.join(rows) + '\n</table></body></html>\n')
+    return path
+
+def write_report(specs, folder, fmt='png', pars=None, workers=None,
+                 figsize=(16, 9), dpi=100, title='h5temperature report',
+                 progress=None, chunksize=None):
+    # specs: list of BlackBodySpec, fitted with pars in the workers if
+    # pars is given (and differs from their own), else as they are.
+    # fmt: 'png' or 'pdf', one file per spectrum in folder.
+    # workers: size of the process pool (default: number of CPUs),
+    # 0 renders in this process. progress(done, total) is called after
+    # each chunk of spectra. Returns the path of index.html.
+    if fmt not in ('png', 'pdf'):
+        raise ValueError(f'Unknown report format {fmt}')
+    os.makedirs(folder, exist_ok=True)
+    names = [page_name(i, spec, fmt) for i, spec in enumerate(specs)]
+    paths = [os.path.join(folder, name) for name in names]
+    n = len(specs)
+    results = [None] * n
+
+    if workers == 0:
+        results = render_chunk(specs, paths, pars, figsize, dpi)
+        if progress is not None:
+            progress(n, n)
+        return write_index(folder, names, results, title)
+
+    workers = workers or os.cpu_count() or 1
+    # a few chunks per worker: pickling and progress granularity
+    if chunksize is None:
+        chunksize = max(1, min(50, -(-n // (4 * workers))))
+
+    done = 0
+    # no fork: the GUI process runs Qt and other threads
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn')) \
+            as executor:
+        futures = {executor.submit(render_chunk, specs[i:i + chunksize],
+                                   paths[i:i + chunksize], pars,
+                                   figsize, dpi): i
+                   for i in range(0, n, chunksize)}
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            chunk = future.result()
+            results[i:i + len(chunk)] = chunk
+            done += len(chunk)
+            if progress is not None:
+                progress(done, n)
+
+    return write_index(folder, names, results, title)
+
+
+def main():
+    from h5temperature.models import DEFAULT_PARS, BlackBodySpec
+    from h5temperature.formats import read_h5file
+
+    parser = argparse.ArgumentParser(
+        description='h5temperature fit report of h5 groups')
+    parser.add_argument('path')
+    parser.add_argument('groups', nargs='*',
+                        help='groups of the file (default: all)')
+    parser.add_argument('-o', '--output', required=True,
+                        help='folder of the report')
+    parser.add_argument('--pdf', action='store_true',
+                        help='PDF pages instead of PNG')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--lowerb', type=float,
+                        default=DEFAULT_PARS['lowerb'])
+    parser.add_argument('--upperb', type=float,
+                        default=DEFAULT_PARS['upperb'])
+    parser.add_argument('--delta', type=int, default=DEFAULT_PARS['delta'])
+    parser.add_argument('--usebg', action='store_true')
+    args = parser.parse_args()
+
+    pars = dict(DEFAULT_PARS,
+                lowerb = args.lowerb,
+                upperb = args.upperb,
+                delta = args.delta,
+                usebg = args.usebg)
+
+    specs = []
+    for nam, d in read_h5file(args.path).items():
+        if args.groups and nam not in args.groups:
+            continue
+        if isinstance(d, dict):
+            specs.append(BlackBodySpec(nam, **d))
+        else:
+            specs += [BlackBodySpec(f'{nam}[{i}]', **di)
+                      for i, di in enumerate(d)]
+
+    def progress(done, total):
+        print(f'\r{done}/{total}', end='', file=sys.stderr)
+
+    index = write_report(specs, args.output, 'pdf' if args.pdf else 'png',
+                         pars, args.workers, dpi=args.dpi,
+                         title=os.path.basename(args.path),
+                         progress=progress)
+    print(f'\n{index}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
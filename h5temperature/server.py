@@ -0,0 +1,312 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# Temperature fitting service, without Qt, for acquisition scripts.
+#
+#   python -m h5temperature.server --port 8765
+#   python -m h5temperature.server --unix /tmp/h5temperature.sock
+#
+# The protocol is one JSON object per line, in both directions.
+# Requests:
+#   {"id": 1, "lam": [...], "planck": [...], "max_data": [...],
+#    "pars": {"lowerb": 550, ...}}
+#   {"id": 2, "path": "file.h5", "group": "3.1", "frame": 0, "pars": {}}
+#   {"id": 3, "cmd": "stats"}
+# "max_data", "pars" and "frame" are optional. Missing pars take the
+# default values of the application. Without frame, all frames of a 2D
+# group are fitted. The answer has the same id and either "results"
+# (BlackBodySpec.get_fit_results, a list for 2D groups) or "error".
+#
+# Requests arriving together are grouped in batches submitted at once to
+# the worker pool. FitClient is a matching blocking client.
+
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import collections
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+
+from h5temperature.models import DEFAULT_PARS, BlackBodySpec
+
+
+def _to_json(value):
+    # numpy scalars are not serializable
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def fit_request(request):
+    # runs in the worker pool: returns the fit results of one request
+    pars = dict(DEFAULT_PARS, **request.get('pars', {}))
+    many = False
+
+    if 'path' in request:
+        from h5temperature.formats import open_h5file, iter_h5group
+
+        path, name = request['path'], request['group']
+        frame = request.get('frame')
+        with open_h5file(path) as file:
+            group = file[name]
+            if frame is None:
+                d = list(iter_h5group(path, name, group))
+            else:
+                # only the slab of the frame is read
+                d = list(iter_h5group(path, name, group, 
+                                      first=frame, last=frame + 1))
+                if not d:
+                    raise IndexError(f'frame {frame} out of range '
+                                     f'in group {name}')
+        specs = [BlackBodySpec(key, **di) for key, di in d]
+        # a list of results for all frames of a 2D group
+        many = frame is None and d[0][1]['source'][3] is not None
+    else:
+        max_data = request.get('max_data')
+        specs = [BlackBodySpec(request.get('name', 'spectrum'),
+                               np.asarray(request['lam'], dtype=float),
+                               np.asarray(request['planck'], dtype=float),
+                               max_data = (None if max_data is None else
+                                           np.asarray(max_data, dtype=float)))]
+
+    out = []
+    for spec in specs:
+        spec.eval_fits(pars)
+        out.append({k: _to_json(v)
+                    for k, v in spec.get_fit_results().items()})
+
+    return out if many else out[0]
+
+def fit_batch(requests):
+    # one call per batch in the worker pool, errors are per request
+    out = []
+    for request in requests:
+        try:
+            out.append(dict(results = fit_request(request)))
+        except Exception as e:
+            out.append(dict(error = f'{type(e).__name__}: {e}'))
+    return out
+
+
+class FitServer():
+    def __init__(self, workers=None, threads=False,
+                 max_batch=16, batch_window=0.002):
+        # batch_window (s): time waited for other requests once a first
+        # one has arrived; max_batch: max number of requests in a batch.
+        if threads:
+            self.executor = concurrent.futures.ThreadPoolExecutor(workers)
+        else:
+            # no fork: the event loop and its threads are not copied
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('spawn'))
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+
+        self.latencies = collections.deque(maxlen=10000)
+        self.batch_sizes = collections.deque(maxlen=10000)
+        self.n_requests = 0
+        self.n_errors = 0
+
+    def stats(self):
+        # latency statistics in ms over the last requests
+        lat = 1e3 * np.array(self.latencies)
+        out = dict(requests = self.n_requests,
+                   errors = self.n_errors,
+                   batches = len(self.batch_sizes),
+                   mean_batch_size = (float(np.mean(self.batch_sizes))
+                                      if self.batch_sizes else 0))
+        if len(lat):
+            out.update(latency_mean_ms = float(np.mean(lat)),
+                       latency_p50_ms = float(np.percentile(lat, 50)),
+                       latency_p95_ms = float(np.percentile(lat, 95)),
+                       latency_p99_ms = float(np.percentile(lat, 99)),
+                       latency_max_ms = float(np.max(lat)))
+        return out
+
+    async def batcher(self):
+        # collects the queued requests in batches for the executor
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(),
+                                                        timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batch_sizes.append(len(batch))
+            asyncio.ensure_future(self.run_batch(batch))
+
+    async def run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        requests = [request for request, _ in batch]
+        try:
+            answers = await loop.run_in_executor(self.executor,
+                                                 fit_batch, requests)
+        except Exception as e:
+            answers = [dict(error = f'{type(e).__name__}: {e}')] * len(batch)
+        for (_, future), answer in zip(batch, answers):
+            if not future.done():
+                future.set_result(answer)
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                t0 = time.perf_counter()
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    answer = dict(error = f'invalid JSON: {e}')
+                    request = dict()
+                else:
+                    if not isinstance(request, dict):
+                        answer = dict(error = 'invalid request: '
+                                      'expected a JSON object')
+                        request = dict()
+                    elif request.get('cmd') == 'stats':
+                        answer = dict(results = self.stats())
+                    else:
+                        future = loop.create_future()
+                        await self.queue.put((request, future))
+                        answer = await future
+                        self.n_requests += 1
+                        if 'error' in answer:
+                            self.n_errors += 1
+                        self.latencies.append(time.perf_counter() - t0)
+
+                answer['id'] = request.get('id')
+                writer.write(json.dumps(answer).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, path=None,
+                    ready=None):
+        # ready: optional callback once listening
+        self.queue = asyncio.Queue()
+        batcher = asyncio.ensure_future(self.batcher())
+        # one line is one request: large spectra need a large limit
+        limit = 2**26
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path,
+                                                     limit=limit)
+        else:
+            server = await asyncio.start_server(self.handle, host, port,
+                                                limit=limit)
+        if ready is not None:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown(wait=False)
+
+
+class FitClient():
+    # blocking client, one request at a time per client
+    def __init__(self, host='127.0.0.1', port=8765, path=None,
+                 timeout=None):
+        if path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(timeout)
+        self.file = self.sock.makefile('rb')
+        self._id = 0
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def request(self, **request):
+        self._id += 1
+        request['id'] = self._id
+        self.sock.sendall(json.dumps(request).encode() + b'\n')
+        answer = json.loads(self.file.readline())
+        if 'error' in answer:
+            raise RuntimeError(answer['error'])
+        return answer['results']
+
+    def fit(self, lam, planck, max_data=None, pars=None):
+        request = dict(lam = np.asarray(lam).tolist(),
+                       planck = np.asarray(planck).tolist(),
+                       pars = pars or dict())
+        if max_data is not None:
+            request['max_data'] = np.asarray(max_data).tolist()
+        return self.request(**request)
+
+    def fit_file(self, path, group, frame=None, pars=None):
+        return self.request(path = path, group = group, frame = frame,
+                            pars = pars or dict())
+
+    def stats(self):
+        return self.request(cmd = 'stats')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='h5temperature fitting server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='unix socket path instead of TCP')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='size of the worker pool')
+    parser.add_argument('--threads', action='store_true',
+                        help='threads instead of processes')
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--batch-window', type=float, default=2,
+                        help='ms waited to batch requests together')
+    args = parser.parse_args()
+
+    server = FitServer(args.workers, args.threads,
+                       args.max_batch, 1e-3 * args.batch_window)
+
+    def ready(srv):
+        where = args.unix or f'{args.host}:{args.port}'
+        print(f'h5temperature server listening on {where}', file=sys.stderr)
+
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# Closed-form solvers, without scipy.optimize.
+# All functions work along the last axis so that several spectra
+# (2D arrays, one spectrum per row) can be solved at once.
+
+import numpy as np
+
+import h5temperature.physics as Ph
+
+
+def weighted_linear_fit(x, y, w):
+    # weighted least squares of y = a * x + b along the last axis
+    # points where y or w is not finite are ignored.
+    keep = np.isfinite(y) & np.isfinite(w)
+    w = np.where(keep, w, 0)
+    y = np.where(keep, y, 0)
+    x = np.broadcast_to(x, y.shape)
+
+    sw = np.sum(w, axis=-1)
+    # centered on the weighted mean of x for accuracy:
+    xm = np.sum(w * x, axis=-1) / sw
+    ym = np.sum(w * y, axis=-1) / sw
+    dx = x - xm[..., None]
+    sxx = np.sum(w * dx**2, axis=-1)
+    sxy = np.sum(w * dx * (y - ym[..., None]), axis=-1)
+
+    a = sxy / sxx
+    b = ym - a * xm
+    return a, b
+
+def weighted_linear_std(x, y, w, a, b):
+    # standard deviation of the slope a of weighted_linear_fit, with the
+    # variance of the points estimated from the residuals
+    keep = np.isfinite(y) & np.isfinite(w)
+    w = np.where(keep, w, 0)
+    x = np.broadcast_to(x, np.shape(y))
+    r = np.where(keep, y - (a[..., None] * x + b[..., None]), 0)
+    n = np.sum(keep, axis=-1)
+    sw = np.sum(w, axis=-1)
+    xm = np.sum(w * x, axis=-1) / sw
+    sxx = np.sum(w * (x - xm[..., None])**2, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # NaN with less than 3 points
+        s2 = np.sum(w * r**2, axis=-1) / (n - 2)
+        return np.sqrt(s2 / sxx)
+
+def rebin_mean(factor, *arrays, weights=None):
+    # variance weighted means of blocks of factor consecutive pixels of
+    # 1D arrays, weights: 1/variance of each pixel (default: 1).
+    # Pixels not finite in any of the arrays are left out, blocks 
+    # without valid pixel are dropped.
+    # Returns the binned arrays and the summed weights of the blocks
+    # (1/variance of the means).
+    n = len(arrays[0])
+    w = np.ones(n) if weights is None else np.asarray(weights, dtype=float)
+    keep = np.isfinite(w)
+    for a in arrays:
+        keep &= np.isfinite(a)
+    w = np.where(keep, w, 0)
+    # the last block may be shorter
+    starts = np.arange(0, n, factor)
+    sw = np.add.reduceat(w, starts)
+    valid = sw > 0
+    out = [np.add.reduceat(np.where(keep, a * w, 0), starts)[valid] / 
+           sw[valid] for a in arrays]
+    return out + [sw[valid]]
+
+def planck_jac_logeps(lamb, eps, temp):
+    # planck (no background) and its derivative with respect to temp, 
+    # lamb in nm. The derivative with respect to log(eps) is planck itself.
+    # eps and temp broadcast against lamb.
+    f = Ph.planck(lamb, eps, temp)
+    u = Ph.h * Ph.c / (lamb * 1e-9 * Ph.k * temp)
+    # d log(f) / dT = u / T / (1 - exp(-u))
+    dlogf_dT = u / temp / (-np.expm1(-u))
+    return f, f * dlogf_dT
+
+def planck_linear_fit(lamb, planck, newton_steps=2, weights=None):
+    # Planck fit without background:
+    # linear solve in Wien coordinates, weighted by intensity**2 so that
+    # it matches the least squares on intensities, followed by
+    # Gauss-Newton steps on the exact Planck formula.
+    # weights: 1 / variance of the intensities (e.g. pixels per bin of a
+    # rebinned spectrum), None for equal weights.
+    # returns eps, temp and the number of Planck evaluations.
+    x = 1 / lamb
+    # wien as a function of 1/lam is linear in the Wien approximation:
+    y = Ph.wien(lamb, planck)
+    # the variance of log(I) goes as 1/I**2
+    w = planck**2 / np.nanmax(planck**2, axis=-1, keepdims=True)
+    if weights is None:
+        weights = 1.
+    else:
+        w = w * weights
+
+    a, b = weighted_linear_fit(x, y, w)
+    temp = 1e9 / a
+    logeps = - b * Ph.h * Ph.c / Ph.k
+
+    keep = np.isfinite(planck)
+    nfev = 0
+    for _ in range(newton_steps):
+        f, j_temp = planck_jac_logeps(lamb,
+                                      np.exp(logeps)[..., None],
+                                      temp[..., None])
+        nfev += 1
+        r = np.where(keep, planck - f, 0)
+        j_eps = np.where(keep, f, 0)
+        j_temp = np.where(keep, j_temp, 0)
+
+        # 2x2 normal equations solved in closed form:
+        a11 = np.sum(weights * j_eps**2, axis=-1)
+        a12 = np.sum(weights * j_eps * j_temp, axis=-1)
+        a22 = np.sum(weights * j_temp**2, axis=-1)
+        g1 = np.sum(weights * j_eps * r, axis=-1)
+        g2 = np.sum(weights * j_temp * r, axis=-1)
+        det = a11 * a22 - a12**2
+
+        logeps = logeps + (a22 * g1 - a12 * g2) / det
+        # same bounds as in the curve_fit
+        temp = np.clip(temp + (a11 * g2 - a12 * g1) / det, 1, 2e4)
+
+    return np.exp(logeps), temp, nfev
+
+def _planck_normal_equations(lamb, planck, logeps, temp, bg=None, 
+                              weights=None):
+    # normal equations of the weighted least squares of the Planck 
+    # formula in (log(eps), temp[, bg]), bg None: without background.
+    # Returns the matrix (..., k, k) scaled to a unit diagonal, the 
+    # scales (..., k), the gradient (..., k), the weighted sum of squared 
+    # residuals and the number of valid pixels.
+    logeps = np.asarray(logeps, dtype=float)
+    temp = np.asarray(temp, dtype=float)
+    f, j_temp = planck_jac_logeps(lamb, np.exp(logeps)[..., None],
+                                  temp[..., None])
+    keep = np.isfinite(planck)
+    w = keep.astype(float) if weights is None else \
+        np.where(keep, weights, 0)
+    model = f if bg is None else f + np.asarray(bg)[..., None]
+    r = np.where(keep, planck - model, 0)
+
+    # columns of the jacobian, 1 for the background
+    columns = [f, j_temp] if bg is None else [f, j_temp, 1.]
+    k = len(columns)
+    mat = np.empty(r.shape[:-1] + (k, k))
+    grad = np.empty(r.shape[:-1] + (k,))
+    for i in range(k):
+        wc = w * columns[i]
+        grad[..., i] = np.sum(wc * r, axis=-1)
+        for j in range(i, k):
+            mat[..., i, j] = mat[..., j, i] = np.sum(wc * columns[j], 
+                                                     axis=-1)
+    # unit diagonal: eps, temp and bg have very different scales
+    d = np.sqrt(np.diagonal(mat, axis1=-2, axis2=-1))
+    mat = mat / (d[..., :, None] * d[..., None, :])
+    return mat, d, grad, np.sum(w * r**2, axis=-1), np.sum(keep, axis=-1)
+
+def planck_gauss_newton(lamb, planck, eps, temp, bg=None, weights=None,
+                        steps=4):
+    # Gauss-Newton steps of the weighted Planck least squares, for
+    # spectra close to a known solution (eps, temp[, bg]), e.g. the
+    # bootstrap resamples of a fit: one row per spectrum, all solved at 
+    # once. bg None: without background. Same bounds as the curve_fit.
+    # Returns eps, temp and bg (None without background).
+    shape = np.shape(planck)[:-1]
+    logeps = np.broadcast_to(np.log(eps), shape).astype(float)
+    temp = np.broadcast_to(temp, shape).astype(float)
+    if bg is not None:
+        bg = np.broadcast_to(bg, shape).astype(float)
+
+    with np.errstate(all='ignore'):
+        for _ in range(steps):
+            mat, d, grad, _, _ = _planck_normal_equations(lamb, planck,
+                                                          logeps, temp, bg,
+                                                          weights)
+            # slightly damped: never singular
+            mat = mat + 1e-12 * np.eye(mat.shape[-1])
+            grad = grad / d
+            step = np.linalg.solve(mat, grad[..., None])[..., 0]
+            if bg is not None:
+                # bg held on its bound (0): eps and temp solved without it
+                held = (bg <= 0) & (step[..., 2] < 0)
+                if np.any(held):
+                    step2 = np.linalg.solve(mat[..., :2, :2], 
+                                            grad[..., :2, None])[..., 0]
+                    step2 = np.concatenate([step2, 
+                                            np.zeros(step2.shape[:-1] + 
+                                                     (1,))], axis=-1)
+                    step = np.where(held[..., None], step2, step)
+            step = step / d
+            logeps = logeps + step[..., 0]
+            temp = np.clip(temp + step[..., 1], 1, 2e4)
+            if bg is not None:
+                bg = np.maximum(bg + step[..., 2], 0)
+
+    return np.exp(logeps), temp, bg
+
+def planck_covariance(lamb, planck, eps, temp, bg=None, weights=None):
+    # covariance of (log(eps), temp[, bg]) of a Planck fit from the 
+    # jacobian, with the variance of the pixels estimated from the
+    # residuals (as curve_fit without absolute_sigma)
+    with np.errstate(all='ignore'):
+        mat, d, _, ss, n = _planck_normal_equations(lamb, planck,
+                                                    np.log(eps), temp, bg,
+                                                    weights)
+        k = mat.shape[-1]
+        cov = np.linalg.inv(mat) / (d[..., :, None] * d[..., None, :])
+        return cov * (ss / (n - k))[..., None, None]
+
+def _prefix_sums(*arrays):
+    # cumulative sums along the last axis, starting with 0
+    return [np.concatenate([np.zeros(a.shape[:-1] + (1,)), 
+                            np.cumsum(a, axis=-1)], axis=-1) for a in arrays]
+
+def fit_window(lam, lower, upper):
+    # the fit window lower <= lam <= upper of a sorted lam as a slice:
+    # indexing with it gives views instead of copies
+    i = np.searchsorted(lam, lower, side='left')
+    j = np.searchsorted(lam, upper, side='right')
+    return slice(int(i), int(max(i, j)))
+
+def window_indices(lam, lowers, uppers):
+    # start and stop indices of all windows lower <= lam <= upper
+    # lam sorted; returns 2D arrays (len(lowers), len(uppers))
+    i = np.searchsorted(lam, lowers, side='left')
+    j = np.searchsorted(lam, uppers, side='right')
+    return np.meshgrid(i, j, indexing='ij')
+
+def wien_window_map(lam, wien, lowers, uppers):
+    # Wien temperature for every fit window (lower, upper) in nm.
+    # Prefix sums of 1/lam, wien, their products and squares give the
+    # linear regression of each window in O(1).
+    # returns T_wien as a 2D array (len(lowers), len(uppers))
+    x = 1 / lam
+    keep = np.isfinite(wien)
+    # centered for accuracy:
+    x = x - np.mean(x[keep])
+    y = np.where(keep, wien - np.mean(wien[keep]), 0)
+    x = np.where(keep, x, 0)
+
+    n, sx, sy, sxx, sxy = _prefix_sums(keep.astype(float), x, y, x*x, x*y)
+
+    i, j = window_indices(lam, lowers, uppers)
+    n = n[j] - n[i]
+    sx = sx[j] - sx[i]
+    sy = sy[j] - sy[i]
+    sxx = sxx[j] - sxx[i]
+    sxy = sxy[j] - sxy[i]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = (n * sxy - sx * sy) / (n * sxx - sx**2)
+        temp = 1e9 / a
+    temp[n < 2] = np.nan
+    return temp
+
+def twocolor_window_map(lam, wien, delta, lowers, uppers):
+    # two-color mean and std deviation for every fit window (lower, upper)
+    # with prefix sums of the two-color temperatures and their squares.
+    # returns two 2D arrays (len(lowers), len(uppers))
+    tc = Ph.temp2color(lam, wien, delta)
+    keep = np.isfinite(tc)
+    tc_mean = np.mean(tc[keep]) if keep.any() else 0
+    t = np.where(keep, tc - tc_mean, 0)
+
+    n, st, stt = _prefix_sums(keep.astype(float), t, t*t)
+
+    # in a window [i, j) the two-color values are tc[i:j-delta]
+    i, j = window_indices(lam, lowers, uppers)
+    i = np.minimum(i, len(tc))
+    j = np.clip(j - delta, i, len(tc))
+    n = n[j] - n[i]
+    st = st[j] - st[i]
+    stt = stt[j] - stt[i]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = st / n
+        std = np.sqrt(np.maximum(stt / n - mean**2, 0))
+    mean = mean + tc_mean
+    mean[n < 1] = np.nan
+    std[n < 1] = np.nan
+    return mean, std
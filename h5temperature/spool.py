@@ -0,0 +1,432 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# File-spool work queue: batch fits spread over the machines sharing a
+# folder, without a scheduler.
+#
+#   python -m h5temperature.spool submit /shared/spool scan*.h5 --lowerb 600
+#   python -m h5temperature.spool work /shared/spool --processes 4
+#   python -m h5temperature.spool merge /shared/spool -o results.txt
+#
+# submit splits the files into work units (file, groups and frame ranges,
+# pars), one JSON file each in todo/. Workers (on any machine, any number)
+# claim a unit by renaming it into claimed/: the rename is atomic, only
+# one worker gets it. The unit is fitted with a Pipeline, its results
+# shard is written in results/ and a record in done/. Files are written
+# under a temporary name then renamed: partial files are never seen.
+# merge concatenates the shards in unit order, the same file as
+# pipeline.py on the same files. Units of a worker which died (its claim
+# is not touched anymore) are put back in todo/ by merge while waiting.
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import multiprocessing
+
+from h5temperature.models import DEFAULT_PARS
+from h5temperature.formats import (open_h5file,
+                                   is_h5file,
+                                   has_frames,
+                                   iter_h5group,
+                                   iter_ascii)
+from h5temperature.pipeline import Pipeline, TextResultsWriter
+
+
+FOLDERS = ('todo', 'claimed', 'done', 'results')
+
+# spectra per work unit, rounded to the chunks of the h5 datasets
+FRAMES_PER_UNIT = 256
+
+# a worker touches its claims every HEARTBEAT seconds, claims older than
+# STALE_TIMEOUT are considered abandoned
+HEARTBEAT = 30
+STALE_TIMEOUT = 300
+
+
+def _write_json(path, obj):
+    # atomic: written under a hidden name in the same folder, renamed
+    folder, name = os.path.split(path)
+    tmp = os.path.join(folder, f'.{name}.{worker_id()}.tmp')
+    with open(tmp, 'w') as file:
+        json.dump(obj, file)
+    os.replace(tmp, path)
+
+def _read_json(path):
+    with open(path) as file:
+        return json.load(file)
+
+def _units(spool, folder):
+    # unit names in a folder of the spool, in unit order
+    return sorted(n for n in os.listdir(os.path.join(spool, folder))
+                  if n.startswith('unit-'))
+
+def worker_id():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def make_units(paths, frames_per_unit=None):
+    # work units of the files: dict(file, prefix, items), items are
+    # [group, first, last] frame ranges of h5 files (None for ASCII
+    # files). Long groups are split, short ones packed together.
+    if frames_per_unit is None:
+        frames_per_unit = FRAMES_PER_UNIT
+    # names as pipeline.iter_files
+    prefix = sum(is_h5file(path) for path in paths) > 1
+
+    for path in paths:
+        path = os.path.abspath(path)
+        if not is_h5file(path):
+            yield dict(file = path, prefix = '', items = None)
+            continue
+
+        unit = dict(file = path,
+                    prefix = f'{os.path.basename(path)}/' if prefix else '',
+                    items = [])
+        size = 0
+        with open_h5file(path) as file:
+            for nam, group in file.items():
+                if not 'measurement/T_planck' in group:
+                    continue
+                if not has_frames(group):
+                    unit['items'].append([nam, 0, None])
+                    size += 1
+                else:
+                    planck = group['measurement/planck_data']
+                    n = planck.shape[0]
+                    # ranges aligned on the chunks: each chunk is read by
+                    # one unit only
+                    c = planck.chunks[0] if planck.chunks else 1
+                    step = max(c, frames_per_unit // c * c)
+                    for first in range(0, n, step):
+                        last = min(first + step, n)
+                        if size and size + last - first > frames_per_unit:
+                            yield unit
+                            unit = dict(unit, items = [])
+                            size = 0
+                        unit['items'].append([nam, first, last])
+                        size += last - first
+                if size >= frames_per_unit:
+                    yield unit
+                    unit = dict(unit, items = [])
+                    size = 0
+        if unit['items']:
+            yield unit
+
+def unit_source(unit, rdcc_nbytes=None):
+    # (name, data) of the spectra of a unit
+    if unit['items'] is None:
+        yield from iter_ascii([unit['file']])
+        return
+    with open_h5file(unit['file'], rdcc_nbytes) as file:
+        for nam, first, last in unit['items']:
+            for key, d in iter_h5group(unit['file'], nam, file[nam],
+                                       first = first, last = last):
+                yield unit['prefix'] + key, d
+
+
+def submit(spool, paths, pars, frames_per_unit=None):
+    # writes the work units of paths in a new spool folder,
+    # returns the number of units
+    if os.path.exists(os.path.join(spool, 'job.json')):
+        raise ValueError(f'{spool} already contains a job')
+    for folder in FOLDERS:
+        os.makedirs(os.path.join(spool, folder), exist_ok=True)
+
+    pars = dict(DEFAULT_PARS, **pars)
+    n = 0
+    for n, unit in enumerate(make_units(paths, frames_per_unit), 1):
+        unit['pars'] = pars
+        _write_json(os.path.join(spool, 'todo', f'unit-{n - 1:06d}.json'),
+                    unit)
+    # last: workers waiting for the job start once all units are there
+    _write_json(os.path.join(spool, 'job.json'),
+                dict(paths = [os.path.abspath(p) for p in paths],
+                     pars = pars,
+                     n_units = n,
+                     created = time.time()))
+    return n
+
+def claim(spool, worker=None):
+    # claims the first unit left, returns (unit name, claim path) or None
+    worker = worker or worker_id()
+    for name in _units(spool, 'todo'):
+        path = os.path.join(spool, 'claimed', f'{name}.{worker}')
+        try:
+            os.rename(os.path.join(spool, 'todo', name), path)
+        except FileNotFoundError:
+            # claimed by another worker meanwhile
+            continue
+        # the rename keeps the time of submit
+        os.utime(path)
+        return name, path
+    return None
+
+def _heartbeat(path, stop):
+    # touches the claim until stop is set, so it does not look stale
+    while not stop.wait(HEARTBEAT):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return
+
+def run_unit(spool, name, claim_path, threads=1, rdcc_nbytes=None):
+    # fits a claimed unit, writes its shard and record,
+    # returns the record
+    unit = _read_json(claim_path)
+    stem = name[:-len('.json')]
+    shard = os.path.join(spool, 'results', f'{stem}.txt')
+    tmp = os.path.join(spool, 'results', f'.{stem}.{worker_id()}.tmp')
+
+    stop = threading.Event()
+    thread = threading.Thread(target=_heartbeat, args=(claim_path, stop),
+                              daemon=True)
+    thread.start()
+    t0 = time.perf_counter()
+    record = dict(unit = name, worker = worker_id(), written = 0,
+                  errors = [], failure = None)
+    try:
+        with TextResultsWriter(tmp) as writer:
+            pipeline = Pipeline(unit_source(unit, rdcc_nbytes),
+                                unit['pars'], writer, threads)
+            stats = pipeline.run()
+        os.replace(tmp, shard)
+        record.update(written = stats['write']['items'],
+                      errors = pipeline.errors)
+    except Exception as e:
+        record['failure'] = f'{type(e).__name__}: {e}'
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    finally:
+        stop.set()
+        thread.join()
+    record['elapsed'] = time.perf_counter() - t0
+
+    _write_json(os.path.join(spool, 'done', name), record)
+    try:
+        os.remove(claim_path)
+    except FileNotFoundError:
+        # requeued meanwhile, the unit may be fitted twice: same shard
+        pass
+    return record
+
+def run_worker(spool, threads=1, wait=False, poll=1., rdcc_nbytes=None,
+               log=None):
+    # claims and fits units until none is left. wait: also waits for
+    # the job to be submitted and for the units of the other workers
+    # (they may be requeued). Returns the number of units fitted.
+    count = 0
+    while True:
+        c = claim(spool) if os.path.exists(os.path.join(spool, 'job.json'))\
+            else None
+        if c is None:
+            if not wait or is_complete(spool):
+                return count
+            time.sleep(poll)
+            continue
+        record = run_unit(spool, *c, threads, rdcc_nbytes)
+        count += 1
+        if log is not None:
+            log(record)
+
+def requeue_stale(spool, timeout=None):
+    # puts the abandoned claims back in todo/, returns their number
+    if timeout is None:
+        timeout = STALE_TIMEOUT
+    count = 0
+    now = time.time()
+    for claimed in os.listdir(os.path.join(spool, 'claimed')):
+        path = os.path.join(spool, 'claimed', claimed)
+        name = claimed[:claimed.index('.json') + len('.json')]
+        try:
+            if now - os.path.getmtime(path) < timeout:
+                continue
+            if os.path.exists(os.path.join(spool, 'done', name)):
+                os.remove(path)
+                continue
+            os.rename(path, os.path.join(spool, 'todo', name))
+            count += 1
+        except FileNotFoundError:
+            # finished meanwhile
+            pass
+    return count
+
+def status(spool):
+    job = _read_json(os.path.join(spool, 'job.json'))
+    claimed = sorted(os.listdir(os.path.join(spool, 'claimed')))
+    done = _units(spool, 'done')
+    return dict(n_units = job['n_units'],
+                todo = len(_units(spool, 'todo')),
+                claimed = len(claimed),
+                done = len(done),
+                workers = sorted({c.split('.json.', 1)[1] for c in claimed}))
+
+def is_complete(spool):
+    path = os.path.join(spool, 'job.json')
+    return os.path.exists(path) and \
+           len(_units(spool, 'done')) >= _read_json(path)['n_units']
+
+def merge(spool, output, wait=True, poll=2., timeout=None, progress=None):
+    # concatenates the shards in unit order in output, once all units are
+    # done (waits for them, requeuing stale claims).
+    # Returns dict(written, errors, failures) over all units.
+    while wait and not is_complete(spool):
+        requeue_stale(spool, timeout)
+        if progress is not None:
+            progress(status(spool))
+        time.sleep(poll)
+
+    out = dict(written = 0, errors = [], failures = [])
+    header = None
+    with open(output, 'w') as file:
+        for name in _units(spool, 'done'):
+            record = _read_json(os.path.join(spool, 'done', name))
+            out['errors'] += [tuple(e) for e in record['errors']]
+            if record['failure'] is not None:
+                out['failures'].append((name, record['failure']))
+                continue
+            shard = os.path.join(spool, 'results',
+                                 name[:-len('.json')] + '.txt')
+            with open(shard) as lines:
+                first = lines.readline()
+                if not first:
+                    # no spectrum fitted
+                    continue
+                if header is None:
+                    header = first
+                    file.write(header)
+                elif first != header:
+                    raise ValueError(f'{shard}: columns differ from the '
+                                     'other shards')
+                for line in lines:
+                    file.write(line)
+                    out['written'] += 1
+    return out
+
+
+def _work_process(spool, threads, wait, rdcc_nbytes):
+    # one worker process of `work --processes`
+    def log(record):
+        state = record['failure'] or f"{record['written']} fits, " \
+                f"{len(record['errors'])} errors"
+        print(f"{record['worker']} {record['unit']}: {state} "
+              f"in {record['elapsed']:.1f} s", file=sys.stderr)
+    run_worker(spool, threads, wait, rdcc_nbytes=rdcc_nbytes, log=log)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='h5temperature batch fits through a shared spool folder')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('submit', help='split files into work units')
+    p.add_argument('spool')
+    p.add_argument('paths', nargs='+')
+    p.add_argument('--frames', type=int, default=FRAMES_PER_UNIT,
+                   help='spectra per work unit')
+    p.add_argument('--lowerb', type=float, default=DEFAULT_PARS['lowerb'])
+    p.add_argument('--upperb', type=float, default=DEFAULT_PARS['upperb'])
+    p.add_argument('--delta', type=int, default=DEFAULT_PARS['delta'])
+    p.add_argument('--usebg', action='store_true')
+    p.add_argument('--fastplanck', action='store_true')
+    p.add_argument('--rebin', type=int, default=1,
+                   help='pixels per point in the Wien and Planck fits')
+    p.add_argument('--rebin-points', type=int, default=None,
+                   help='points in the fit window (instead of --rebin)')
+    p.add_argument('--bootstrap', type=int, default=0,
+                   help='resamples of the residual bootstrap of each fit')
+    p.add_argument('--seed', type=int, default=0,
+                   help='seed of the bootstrap')
+
+    p = commands.add_parser('work', help='fit the units left')
+    p.add_argument('spool')
+    p.add_argument('--processes', type=int, default=1,
+                   help='worker processes on this machine')
+    p.add_argument('--threads', type=int, default=1,
+                   help='fitter threads per worker')
+    p.add_argument('--wait', action='store_true',
+                   help='wait for the job and for the other workers')
+    p.add_argument('--chunk-cache', type=float, default=None,
+                   help='chunk cache of the h5 files in MB')
+
+    p = commands.add_parser('merge', help='merge the results shards')
+    p.add_argument('spool')
+    p.add_argument('-o', '--output', required=True,
+                   help='tab separated results file')
+    p.add_argument('--no-wait', action='store_true',
+                   help='merge the units done so far')
+    p.add_argument('--stale', type=float, default=STALE_TIMEOUT,
+                   help='seconds after which a claim is abandoned')
+
+    p = commands.add_parser('status')
+    p.add_argument('spool')
+    args = parser.parse_args()
+
+    if args.command == 'submit':
+        pars = dict(lowerb = args.lowerb,
+                    upperb = args.upperb,
+                    delta = args.delta,
+                    usebg = args.usebg,
+                    fastplanck = args.fastplanck,
+                    rebin = args.rebin,
+                    rebin_points = args.rebin_points,
+                    bootstrap = args.bootstrap,
+                    bootstrap_seed = args.seed)
+        n = submit(args.spool, args.paths, pars, args.frames)
+        print(f'{n} work units in {args.spool}', file=sys.stderr)
+
+    elif args.command == 'work':
+        rdcc_nbytes = None
+        if args.chunk_cache is not None:
+            rdcc_nbytes = int(args.chunk_cache * 2**20)
+        worker_args = (args.spool, args.threads, args.wait, rdcc_nbytes)
+        if args.processes <= 1:
+            _work_process(*worker_args)
+        else:
+            # no fork: h5py and the fitter threads
+            context = multiprocessing.get_context('spawn')
+            processes = [context.Process(target=_work_process,
+                                         args=worker_args)
+                         for _ in range(args.processes)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+
+    elif args.command == 'merge':
+        def progress(s):
+            print(f"\r{s['done']}/{s['n_units']} units done, "
+                  f"{s['claimed']} running", end='', file=sys.stderr)
+        out = merge(args.spool, args.output, not args.no_wait,
+                    timeout=args.stale, progress=progress)
+        for name, error in out['errors']:
+            print(f'{name}: {error}', file=sys.stderr)
+        for name, failure in out['failures']:
+            print(f'{name} failed: {failure}', file=sys.stderr)
+        print(f"\n{out['written']} results in {args.output}",
+              file=sys.stderr)
+
+    elif args.command == 'status':
+        s = status(args.spool)
+        print(f"{s['done']}/{s['n_units']} units done, {s['todo']} to do, "
+              f"{s['claimed']} running on {', '.join(s['workers']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
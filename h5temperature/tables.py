@@ -15,16 +15,31 @@
 #   You should have received a copy of the GNU General Public License 
 #   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
 
-from PyQt5.QtWidgets import (QTableWidget,
+import time
+import datetime
+
+import numpy as np
+
+from PyQt5.QtWidgets import (QWidget,
+                            QTableWidget,
                             QTableWidgetItem,
                             QAbstractItemView,
                             QHeaderView,
-                            QSizePolicy)
+                            QSizePolicy,
+                            QComboBox,
+                            QCheckBox,
+                            QLineEdit,
+                            QLabel,
+                            QPushButton,
+                            QHBoxLayout,
+                            QVBoxLayout)
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtGui import QColor
 
 
 class SingleFitResultsTable(QTableWidget):
     def __init__(self):
-        super().__init__(7,1)
+        super().__init__(9,1)
 
         self.setStyleSheet('QTableWidget '
                            '{border: 1px solid gray ;'
@@ -46,6 +61,8 @@ class SingleFitResultsTable(QTableWidget):
                                       "T Wien (K)",
                                       "T 2-color (K)",
                                       "T 2-c std dev (K)",
+                                      "T Planck std (K)",
+                                      "T Wien std (K)",
                                       "multiplier Planck",
                                       "multiplier Wien", 
                                       "background"])
@@ -55,6 +72,323 @@ class SingleFitResultsTable(QTableWidget):
         self.setItem(0, 1, QTableWidgetItem(str(round(current.T_wien))))
         self.setItem(0, 2, QTableWidgetItem(str(round(current.T_twocolor))))
         self.setItem(0, 3, QTableWidgetItem(str(round(current.T_std_twocolor))))
-        self.setItem(0, 4, QTableWidgetItem(str(round(current.eps_planck,3))))
-        self.setItem(0, 5, QTableWidgetItem(str(round(current.eps_wien,3))))
-        self.setItem(0, 6, QTableWidgetItem(str(round(current.bg,3))))
\ No newline at end of file
+        # from the covariance, and the bootstrap if done
+        item = QTableWidgetItem(self.std_text(current.T_std_planck, 
+                                              current.T_std_planck_boot))
+        if current.T_std_planck_boot is not None and current.pars['usebg']:
+            item.setToolTip("The bootstrap refits the background within "
+                            "background >= 0: with a background close to "
+                            "0, the spread of T is truncated and the "
+                            "bootstrap std is a lower bound.")
+        self.setItem(0, 4, item)
+        self.setItem(0, 5, QTableWidgetItem(self.std_text(
+                        current.T_std_wien, current.T_std_wien_boot)))
+        self.setItem(0, 6, QTableWidgetItem(str(round(current.eps_planck,3))))
+        self.setItem(0, 7, QTableWidgetItem(str(round(current.eps_wien,3))))
+        self.setItem(0, 8, QTableWidgetItem(str(round(current.bg,3))))
+
+    @staticmethod
+    def std_text(std, boot=None):
+        text = '' if std is None else f'{std:.3g}'
+        if boot is not None:
+            text += f' (bootstrap {boot:.3g})'
+        return text
+
+
+class DatabaseWindow(QWidget):
+    # search panel of the results database (database.py),
+    # a double click on a hit emits it (a sqlite3.Row) with hit_chosen
+    hit_chosen = pyqtSignal(object)
+
+    # displayed columns: (header, column of the database)
+    columns = (('Time', 'time'),
+               ('Sample', 'sample'),
+               ('File', 'file'),
+               ('Name', 'name'),
+               ('T Planck (K)', 'T_planck'),
+               ('T Wien (K)', 'T_wien'),
+               ('T 2-color (K)', 'T_twocolor'))
+    max_rows = 5000
+
+    def __init__(self, parent):
+        super().__init__()
+        self.setWindowTitle('h5temperature results database')
+        self.resize(900, 600)
+        self.database = None
+        self.hits = []
+
+        self.sample_box = QComboBox()
+        self.sample_box.setEditable(True)
+        self.tmin_edit = QLineEdit()
+        self.tmin_edit.setPlaceholderText('T min (K)')
+        self.tmax_edit = QLineEdit()
+        self.tmax_edit.setPlaceholderText('T max (K)')
+        self.since_edit = QLineEdit()
+        self.since_edit.setPlaceholderText('since YYYY-MM-DD [HH:MM]')
+        self.until_edit = QLineEdit()
+        self.until_edit.setPlaceholderText('until YYYY-MM-DD [HH:MM]')
+        self.search_button = QPushButton('Search')
+        self.status_label = QLabel('')
+
+        filters = QHBoxLayout()
+        filters.addWidget(QLabel('Sample:'))
+        filters.addWidget(self.sample_box, stretch=2)
+        for edit in (self.tmin_edit, self.tmax_edit,
+                     self.since_edit, self.until_edit):
+            filters.addWidget(edit, stretch=1)
+            edit.returnPressed.connect(self.search)
+        filters.addWidget(self.search_button)
+
+        self.table = QTableWidget(0, len(self.columns))
+        self.table.setHorizontalHeaderLabels([h for h, _ in self.columns])
+        self.table.horizontalHeader().setSectionResizeMode(
+                                        QHeaderView.Interactive)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        layout = QVBoxLayout()
+        layout.addLayout(filters)
+        layout.addWidget(self.table)
+        layout.addWidget(self.status_label)
+        self.setLayout(layout)
+
+        self.search_button.clicked.connect(self.search)
+        self.table.cellDoubleClicked.connect(
+                lambda row, col: self.hit_chosen.emit(self.hits[row]))
+
+    def set_database(self, database):
+        self.database = database
+        current = self.sample_box.currentText()
+        self.sample_box.clear()
+        self.sample_box.addItems([''] + database.samples())
+        self.sample_box.setCurrentText(current)
+        self.status_label.setText(f'{database.path}: '
+                                  f'{database.count()} fits')
+
+    def filters(self):
+        # query arguments from the filter widgets, may raise ValueError
+        def number(edit):
+            text = edit.text().strip()
+            return float(text) if text else None
+        def date(edit):
+            text = edit.text().strip()
+            return datetime.datetime.fromisoformat(text) if text else None
+        return dict(sample = self.sample_box.currentText().strip() or None,
+                    tmin = number(self.tmin_edit),
+                    tmax = number(self.tmax_edit),
+                    since = date(self.since_edit),
+                    until = date(self.until_edit))
+
+    def search(self):
+        if self.database is None:
+            return
+        try:
+            filters = self.filters()
+        except ValueError as e:
+            self.status_label.setText(f'Invalid filter: {e}')
+            return
+
+        t0 = time.perf_counter()
+        # one more to know if the list is truncated
+        self.hits = self.database.query(limit = self.max_rows + 1, 
+                                        **filters)
+        dt = time.perf_counter() - t0
+        truncated = len(self.hits) > self.max_rows
+        self.hits = self.hits[:self.max_rows]
+
+        self.table.setUpdatesEnabled(False)
+        self.table.setRowCount(len(self.hits))
+        for i, hit in enumerate(self.hits):
+            for j, (_, col) in enumerate(self.columns):
+                value = hit[col]
+                if value is None:
+                    text = ''
+                elif col == 'file':
+                    text = value.replace('\\', '/').split('/')[-1]
+                elif isinstance(value, float):
+                    text = str(round(value))
+                else:
+                    text = str(value)
+                self.table.setItem(i, j, QTableWidgetItem(text))
+        self.table.setUpdatesEnabled(True)
+
+        more = f' (first {self.max_rows} shown)' if truncated else ''
+        self.status_label.setText(f'{len(self.hits)} fits{more} '
+                                  f'in {1e3 * dt:.0f} ms, '
+                                  'double click to open')
+
+
+
+class QualityWindow(QWidget):
+    # fit quality metrics of the batch (TemperaturesBatch.quality), 
+    # sortable by clicking the headers, filtered with a range on one 
+    # column or to the suspicious fits. Suspicious fits are in red.
+    # A double click emits the key of the spectrum with key_chosen.
+    key_chosen = pyqtSignal(str)
+
+    def __init__(self, parent):
+        super().__init__()
+        self.setWindowTitle('h5temperature fit quality')
+        self.resize(1000, 600)
+        self.batch = None
+
+        self.suspicious_box = QCheckBox('Suspicious fits only')
+        self.column_box = QComboBox()
+        self.min_edit = QLineEdit()
+        self.min_edit.setPlaceholderText('min')
+        self.max_edit = QLineEdit()
+        self.max_edit.setPlaceholderText('max')
+        self.status_label = QLabel('')
+
+        filters = QHBoxLayout()
+        filters.addWidget(self.suspicious_box)
+        filters.addStretch()
+        filters.addWidget(QLabel('Range of'))
+        filters.addWidget(self.column_box)
+        filters.addWidget(self.min_edit)
+        filters.addWidget(self.max_edit)
+
+        self.table = QTableWidget(0, 0)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        layout = QVBoxLayout()
+        layout.addLayout(filters)
+        layout.addWidget(self.table)
+        layout.addWidget(self.status_label)
+        self.setLayout(layout)
+
+        self.suspicious_box.stateChanged.connect(self.refresh)
+        self.column_box.currentIndexChanged.connect(self.refresh)
+        self.min_edit.editingFinished.connect(self.refresh)
+        self.max_edit.editingFinished.connect(self.refresh)
+        self.table.cellDoubleClicked.connect(
+                lambda row, col: self.key_chosen.emit(
+                                    self.table.item(row, 0).text()))
+
+    def set_batch(self, batch):
+        self.batch = batch
+        names = list(batch.columns())
+        if [self.column_box.itemText(i) 
+                for i in range(self.column_box.count())] != names:
+            self.column_box.blockSignals(True)
+            self.column_box.clear()
+            self.column_box.addItems(names)
+            self.column_box.setCurrentText('chi2_red')
+            self.column_box.blockSignals(False)
+        self.refresh()
+
+    def refresh(self):
+        if self.batch is None:
+            return
+        batch = self.batch
+        columns = batch.columns()
+
+        def number(edit):
+            try:
+                return float(edit.text())
+            except ValueError:
+                return None
+        column = self.column_box.currentText()
+        bounds = (number(self.min_edit), number(self.max_edit))
+        ind = batch.select(**{column: bounds}) if bounds != (None, None) \
+              else np.arange(batch.n_points)
+        bad = np.zeros(batch.n_points, dtype=bool)
+        bad[batch.suspicious()] = True
+        if self.suspicious_box.isChecked():
+            ind = ind[bad[ind]]
+
+        names = ['name'] + [k for k in columns if k != 'frame']
+        self.table.setSortingEnabled(False)
+        self.table.setUpdatesEnabled(False)
+        self.table.clear()
+        self.table.setColumnCount(len(names))
+        self.table.setHorizontalHeaderLabels(names)
+        self.table.setRowCount(len(ind))
+        red = QColor('red')
+        for row, i in enumerate(ind):
+            item = QTableWidgetItem(str(batch.keys[i]))
+            if bad[i]:
+                item.setForeground(red)
+            self.table.setItem(row, 0, item)
+            for j, k in enumerate(names[1:], 1):
+                item = QTableWidgetItem()
+                # numbers, for a numerical sort
+                item.setData(Qt.DisplayRole, 
+                             float(f'{columns[k][i]:.4g}'))
+                if bad[i]:
+                    item.setForeground(red)
+                self.table.setItem(row, j, item)
+        self.table.setUpdatesEnabled(True)
+        self.table.setSortingEnabled(True)
+        self.table.resizeColumnsToContents()
+
+        self.status_label.setText(f'{len(ind)} / {batch.n_points} fits, '
+                                  f'{np.sum(bad)} suspicious. '
+                                  'Double click to display.')
+
+
+class MemoryWindow(QWidget):
+    # memory of the session (memory.memory_report): by category, group,
+    # largest spectra, with the growth from the telemetry samples.
+    # refresh_requested asks the main window for a new report.
+    refresh_requested = pyqtSignal()
+
+    def __init__(self, parent):
+        super().__init__()
+        self.setWindowTitle('h5temperature memory')
+        self.resize(600, 700)
+
+        self.summary_label = QLabel('')
+        self.growth_label = QLabel('')
+        self.refresh_button = QPushButton('Refresh')
+
+        top = QHBoxLayout()
+        top.addWidget(self.summary_label)
+        top.addStretch()
+        top.addWidget(self.refresh_button)
+
+        self.table = QTableWidget(0, 3)
+        self.table.setHorizontalHeaderLabels(['', 'Name', 'MB'])
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(
+            1, QHeaderView.Stretch)
+
+        layout = QVBoxLayout()
+        layout.addLayout(top)
+        layout.addWidget(self.table)
+        layout.addWidget(self.growth_label)
+        self.setLayout(layout)
+
+        self.refresh_button.clicked.connect(self.refresh_requested)
+
+    def set_report(self, report, telemetry=None):
+        mb = 2**20
+        rows = [('category', c, v) for c, v in report['categories'].items()]
+        rows.append(('batch', '', report['batch']))
+        rows += [('figure', name, v) 
+                 for name, v in report['figures'].items()]
+        rows += [('group', g, v) for g, v in report['groups'].items()]
+        rows += [('spectrum', k, v) for k, v in report['largest']]
+
+        self.table.setRowCount(len(rows))
+        for i, (section, name, nbytes) in enumerate(rows):
+            self.table.setItem(i, 0, QTableWidgetItem(section))
+            self.table.setItem(i, 1, QTableWidgetItem(str(name)))
+            item = QTableWidgetItem(f'{nbytes / mb:.2f}')
+            item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+            self.table.setItem(i, 2, item)
+        self.table.resizeColumnToContents(0)
+
+        text = (f"Arrays: {report['total'] / mb:.1f} MB, "
+                f"{report['n_spectra']} spectra "
+                f"({report['n_evicted']} evicted)")
+        if report['process_rss'] is not None:
+            text += f", process: {report['process_rss'] / mb:.0f} MB"
+        self.summary_label.setText(text)
+        self.growth_label.setText('' if telemetry is None 
+                                  else telemetry.growth_text())
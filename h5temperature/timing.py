@@ -0,0 +1,138 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# Lightweight timers for the pipeline stages (loading, fits, drawing...).
+# Disabled by default: timed() then returns a shared object doing nothing.
+# Enable with H5TEMPERATURE_TIMING=1 or profiler.enable().
+
+import os
+import json
+import time
+import threading
+import functools
+
+
+class _NullTimer():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class _Timer():
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start,
+                             time.perf_counter() - self.start)
+        return False
+
+
+class Profiler():
+    def __init__(self, max_events=100000):
+        self.enabled = bool(os.environ.get('H5TEMPERATURE_TIMING'))
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self.clear()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def clear(self):
+        with self._lock:
+            # (name, start, duration, thread id), start from self._t0
+            self.events = []
+            # last duration for each name
+            self.last = dict()
+
+    def timed(self, name):
+        # context manager: with profiler.timed('planck fit'): ...
+        if not self.enabled:
+            return _null_timer
+        return _Timer(self, name)
+
+    def timed_function(self, name):
+        # decorator version of timed
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Timer(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name, start, duration):
+        with self._lock:
+            if len(self.events) < self.max_events:
+                self.events.append((name, start - self._t0, duration,
+                                    threading.get_ident()))
+            self.last[name] = duration
+
+    def summary(self):
+        # total time, number of calls and mean time per name, in seconds
+        out = dict()
+        with self._lock:
+            for name, _, duration, _ in self.events:
+                total, count = out.get(name, (0, 0))
+                out[name] = (total + duration, count + 1)
+        return {k: dict(total = t, count = n, mean = t / n)
+                for k, (t, n) in out.items()}
+
+    def overlay_text(self):
+        # one line with the last duration of each stage
+        with self._lock:
+            items = list(self.last.items())
+        return ' | '.join(f'{k}: {1e3 * v:.1f} ms' for k, v in items)
+
+    def export_chrome_trace(self, path):
+        # JSON trace for chrome://tracing or https://ui.perfetto.dev
+        pid = os.getpid()
+        with self._lock:
+            events = [dict(name = name,
+                           cat = 'h5temperature',
+                           ph = 'X',
+                           ts = 1e6 * start,
+                           dur = 1e6 * duration,
+                           pid = pid,
+                           tid = tid) for name, start, duration, tid
+                                      in self.events]
+        with open(path, 'w') as file:
+            json.dump(dict(traceEvents = events,
+                           displayTimeUnit = 'ms'), file)
+
+
+# one profiler for the whole application
+profiler = Profiler()
+timed = profiler.timed
+timed_function = profiler.timed_function
@@ -0,0 +1,181 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# Residual bootstrap of the Planck and Wien temperatures.
+#
+# The fitted curve plus residuals drawn with replacement gives a
+# resampled spectrum; the std deviation of the temperatures fitted on
+# many resamples is the uncertainty. All resamples of a spectrum are
+# rows of one 2D array, refitted at once: Gauss-Newton steps from the
+# fit for Planck (solvers.planck_gauss_newton), the closed-form linear
+# regression for Wien.
+#
+# Each spectrum has its own random generator, from the seed and its
+# name: results do not depend on the order of the spectra nor on the
+# number of processes.
+#
+#   tasks = [spec.bootstrap_inputs(500, seed=0) for spec in specs]
+#   results = bootstrap_tasks(tasks, workers=8)
+
+import os
+import zlib
+import warnings
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+
+import h5temperature.physics as Ph
+from h5temperature.solvers import (planck_gauss_newton,
+                                   weighted_linear_fit)
+
+
+# uncertainties of the Planck and Wien temperatures: from the covariance
+# of the fits, and from the bootstrap (NaN before bootstrap_task)
+UNCERTAINTIES = ('T_std_planck', 'T_std_wien', 
+                 'T_std_planck_boot', 'T_std_wien_boot')
+
+# resamples refitted together: rows * pixels per 2D array, for memory
+BLOCK_SIZE = 2**18
+
+# Gauss-Newton steps of the Planck refits, from the fit
+PLANCK_STEPS = 3
+
+
+def spectrum_rng(seed, name):
+    # random generator of a spectrum, from the seed and its name
+    key = zlib.crc32(str(name).encode())
+    return np.random.default_rng(np.random.SeedSequence(seed,
+                                                        spawn_key=(key,)))
+
+def resample_residuals(fit, residuals, weights, n_boot, rng):
+    # n_boot resampled data as rows of a 2D array: fit plus residuals
+    # drawn with replacement. Residuals are standardized by the weights
+    # (1 / variance, e.g. pixels per bin) before drawing, scaled back
+    # after.
+    scale = np.sqrt(weights)
+    e = residuals * scale
+    e = e - np.mean(e)
+    ind = rng.integers(0, len(e), (n_boot, len(e)))
+    return fit + e[ind] / scale
+
+def _blocks(n_boot, n_px):
+    # sizes of the blocks of resamples
+    rows = max(1, BLOCK_SIZE // max(n_px, 1))
+    for i in range(0, n_boot, rows):
+        yield min(rows, n_boot - i)
+
+def bootstrap_planck(lam, data, weights, p, n_boot, rng):
+    # temperatures of n_boot resamples of a Planck fit with parameters
+    # p = (eps, T) or (eps, T, bg) of the data (lam, data, weights)
+    keep = np.isfinite(data)
+    lam, data, weights = lam[keep], data[keep], weights[keep]
+    eps, temp = p[0], p[1]
+    bg = p[2] if len(p) > 2 else None
+
+    fit = Ph.planck(lam, *p)
+    out = []
+    for n in _blocks(n_boot, len(lam)):
+        resamples = resample_residuals(fit, data - fit, weights, n, rng)
+        # bg is refitted with eps and T, within its bound: when the fit
+        # has bg close to 0, resamples that would need bg < 0 keep 
+        # bg = 0, and the spread of T is truncated on that side
+        _, temps, _ = planck_gauss_newton(lam, resamples, eps, temp, bg,
+                                          weights, PLANCK_STEPS)
+        out.append(temps)
+    return np.concatenate(out)
+
+def bootstrap_wien(x, y, weights, n_boot, rng):
+    # temperatures of n_boot resamples of the Wien fit of y (wien)
+    # against x (1 / lam)
+    keep = np.isfinite(y)
+    x, y, weights = x[keep], y[keep], weights[keep]
+    a, b = weighted_linear_fit(x, y, weights)
+    fit = a * x + b
+
+    out = []
+    for n in _blocks(n_boot, len(x)):
+        resamples = resample_residuals(fit, y - fit, weights, n, rng)
+        a, _ = weighted_linear_fit(x, resamples, weights)
+        out.append(1e9 / a)
+    return np.concatenate(out)
+
+def bootstrap_task(task):
+    # bootstrap std deviations of one spectrum, task from
+    # BlackBodySpec.bootstrap_inputs; also runs in worker processes
+    rng = spectrum_rng(task['seed'], task['name'])
+    n_boot = task['n_boot']
+    with warnings.catch_warnings(), np.errstate(all='ignore'):
+        # failed refits are NaN, left out
+        warnings.simplefilter('ignore', RuntimeWarning)
+        T_planck = bootstrap_planck(*task['planck'], n_boot, rng)
+        T_wien = bootstrap_wien(*task['wien'], n_boot, rng)
+        return dict(T_std_planck_boot = float(np.nanstd(T_planck, ddof=1)),
+                    T_std_wien_boot = float(np.nanstd(T_wien, ddof=1)),
+                    bootstrap = n_boot)
+
+def bootstrap_chunk(tasks):
+    return [bootstrap_task(task) for task in tasks]
+
+def bootstrap_tasks(tasks, workers=None, progress=None, chunksize=None):
+    # results of bootstrap_task for all tasks, in order.
+    # workers: size of the process pool (default: number of CPUs),
+    # 0 runs in this process. progress(done, total) is called after
+    # each chunk of tasks.
+    n = len(tasks)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or n < 2:
+        results = []
+        for task in tasks:
+            results.append(bootstrap_task(task))
+            if progress is not None:
+                progress(len(results), n)
+        return results
+
+    # a few chunks per worker, as in reports.write_report
+    if chunksize is None:
+        chunksize = max(1, min(50, -(-n // (4 * workers))))
+
+    results = [None] * n
+    done = 0
+    # no fork: the GUI process runs Qt and other threads
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn')) \
+            as executor:
+        futures = {executor.submit(bootstrap_chunk, 
+                                   tasks[i:i + chunksize]): i
+                   for i in range(0, n, chunksize)}
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            chunk = future.result()
+            results[i:i + len(chunk)] = chunk
+            done += len(chunk)
+            if progress is not None:
+                progress(done, n)
+    return results
+
+def bootstrap_specs(specs, n_boot, seed=0, workers=None, progress=None):
+    # bootstrap uncertainties of fitted spectra, stored in the spectra
+    # (BlackBodySpec.set_bootstrap). Spectra not fitted are skipped.
+    # Returns the number of spectra.
+    fitted = [spec for spec in specs if spec._fitted]
+    tasks = [spec.bootstrap_inputs(n_boot, seed) for spec in fitted]
+    for spec, result in zip(fitted, bootstrap_tasks(tasks, workers,
+                                                    progress)):
+        spec.set_bootstrap(result)
+    return len(fitted)
@@ -0,0 +1,207 @@
+#   Copyright (C) 2023-2025 Alexis Forestier (alforestier@gmail.com)
+#
+#   This file is part of h5temperature.
+#
+#   h5temperature is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by the
+#   Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   h5temperature is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#   See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with h5temperature. If not, see <https://www.gnu.org/licenses/>.
+
+# Background fits for the GUI.
+# A FitJob fits a copy of a BlackBodySpec in a QThreadPool thread, the
+# result is committed to the original spectrum in the GUI thread.
+
+from copy import deepcopy
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+
+class FitSignals(QObject):
+    # emits the job itself, in the GUI thread (queued connection)
+    finished = pyqtSignal(object)
+
+
+class FitJob(QRunnable):
+    def __init__(self, key, spec, pars, tag=None, is_stale=None):
+        # key: key of the spectrum in NestedData
+        # spec is copied here, in the GUI thread, the worker never
+        # touches the original.
+        # is_stale(job) is checked before starting: superseded jobs
+        # finish without fitting.
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.key = key
+        # the original, to check it was not replaced meanwhile
+        self.origin = spec
+        self.spec = deepcopy(spec)
+        self.pars = deepcopy(pars)
+        self.tag = tag
+        self.is_stale = is_stale
+
+        self.started = False
+        self.cancelled = False
+        self.error = None
+
+        self.signals = FitSignals()
+
+    def run(self):
+        self.started = True
+        if self.is_stale is not None and self.is_stale(self):
+            self.cancelled = True
+        else:
+            try:
+                self.spec.eval_fits(self.pars)
+            except Exception as e:
+                self.error = str(e)
+        self.signals.finished.emit(self)
+
+    def commit(self, spec):
+        # copy the fitted state into spec, GUI thread only
+        spec.__dict__.update(self.spec.__dict__)
+
+
+class PipelineJob(QRunnable):
+    # streaming fits of whole files to a results file (pipeline.py),
+    # self.pipeline can be polled for its stats while running
+    def __init__(self, paths, pars, output):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.paths = paths
+        self.pars = deepcopy(pars)
+        self.output = output
+        self.pipeline = None
+        self.error = None
+
+        self.signals = FitSignals()
+
+    def run(self):
+        from h5temperature.pipeline import (Pipeline, 
+                                            TextResultsWriter, 
+                                            iter_files)
+        try:
+            with TextResultsWriter(self.output) as writer:
+                self.pipeline = Pipeline(iter_files(self.paths), 
+                                         self.pars, writer)
+                self.pipeline.run()
+        except Exception as e:
+            self.error = str(e)
+        self.signals.finished.emit(self)
+
+    def abort(self):
+        if self.pipeline is not None:
+            self.pipeline.abort()
+
+
+class MappingJob(QRunnable):
+    # per-CCD-line temperature map of a group (mapping.py),
+    # self.done / self.total can be polled while running
+    def __init__(self, path, group, pars):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.path = path
+        self.group = group
+        self.pars = deepcopy(pars)
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+
+        self.signals = FitSignals()
+
+    def progress(self, done, total):
+        self.done, self.total = done, total
+
+    def run(self):
+        from h5temperature.mapping import map_group
+        try:
+            self.result = map_group(self.path, self.group, self.pars,
+                                    progress = self.progress)
+        except Exception as e:
+            self.error = str(e)
+        self.signals.finished.emit(self)
+
+
+class BootstrapJob(QRunnable):
+    # residual bootstrap of fitted spectra (uncertainty.py) in a process
+    # pool, self.done / self.total can be polled while running
+    def __init__(self, specs, n_boot, seed=0):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        # the arrays of the fits are taken here, in the GUI thread
+        self.specs = [spec for spec in specs if spec._fitted]
+        self.tasks = [spec.bootstrap_inputs(n_boot, seed) 
+                      for spec in self.specs]
+        # to skip the spectra fitted again meanwhile
+        self.temperatures = [spec.T_planck for spec in self.specs]
+        self.n_boot = n_boot
+        self.done = 0
+        self.total = len(self.tasks)
+        self.results = None
+        self.error = None
+
+        self.signals = FitSignals()
+
+    def progress(self, done, total):
+        self.done, self.total = done, total
+
+    def run(self):
+        from h5temperature.uncertainty import bootstrap_tasks
+        try:
+            self.results = bootstrap_tasks(self.tasks, 
+                                           progress = self.progress)
+        except Exception as e:
+            self.error = str(e)
+        self.tasks = None
+        self.signals.finished.emit(self)
+
+    def commit(self):
+        # the results into the spectra, GUI thread only
+        for spec, T, result in zip(self.specs, self.temperatures, 
+                                   self.results):
+            if spec.T_planck == T:
+                spec.set_bootstrap(result)
+
+
+class ReportJob(QRunnable):
+    # fit report of spectra (reports.py), rendered in a process pool,
+    # self.done / self.total can be polled while running
+    def __init__(self, specs, folder, fmt, pars):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        # copied in the GUI thread, as in FitJob
+        self.specs = deepcopy(specs)
+        self.folder = folder
+        self.fmt = fmt
+        self.pars = deepcopy(pars)
+        self.done = 0
+        self.total = len(specs)
+        self.index = None
+        self.error = None
+
+        self.signals = FitSignals()
+
+    def progress(self, done, total):
+        self.done, self.total = done, total
+
+    def run(self):
+        from h5temperature.reports import write_report
+        try:
+            self.index = write_report(self.specs, self.folder, self.fmt,
+                                      self.pars, progress = self.progress)
+        except Exception as e:
+            self.error = str(e)
+        self.specs = None
+        self.signals.finished.emit(self)
@@ -17,4 +17,6 @@
 
 from h5temperature import main
 
-main()
\ No newline at end of file
+# the worker processes of the reports import this module again
+if __name__ == '__main__':
+    main()
\ No newline at end of file